@@ -0,0 +1,219 @@
+# default lib imports
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+# module imports
+from .RateLimiter import TokenBucket
+
+
+# decides which new connections are registered and runs their registration on workers of its own, so a storm of slow
+# or half-open devices can not take the workers used by established clients
+class RegistrationAdmission:
+    # what happens to a connection which arrives while every registration worker is busy or the rate is spent
+    REJECT = "reject"
+    QUEUE = "queue"
+    POLICIES = (REJECT, QUEUE)
+
+    def __init__(self, register: Callable[[socket.socket, tuple], bool], max_workers: int = 8,
+                 max_pending: int = 1024, rate: float = None, max_per_ip: int = None, policy: str = QUEUE,
+                 queue_timeout: float = 10, logging_id: str = "[Registration Admission]",
+                 logging_level: int = logging.WARNING):
+        if policy not in self.POLICIES:
+            raise ValueError("policy must be one of " + ", ".join(self.POLICIES))
+
+        # logger object and setup
+        self.logger = logging.getLogger(logging_id)
+        self.logger.setLevel(logging_level)
+
+        # registers a connection, returns True if the client was added to the pool
+        self.__register = register
+
+        # the number of registrations which run at once
+        self.max_workers = max_workers
+
+        # the max number of connections waiting for or running a registration (with the reject policy no connection
+        # waits so this is capped at max_workers)
+        self.max_pending = max_pending if policy == self.QUEUE else min(max_pending, max_workers)
+
+        # token bucket limiting the rate registrations start at, None if the rate is unlimited
+        self.__limiter = None if rate is None else TokenBucket(rate)
+
+        # the max number of connections (registering or registered) from one IP address, None for no limit
+        self.max_per_ip = max_per_ip
+
+        # reject refuses connections which can not start registering right away, queue lets them wait
+        self.policy = policy
+
+        # the time a queued connection may wait before it is dropped, a device which waited this long has likely
+        # given up on the connection
+        self.queue_timeout = queue_timeout
+
+        # lock guarding the counts
+        self.__lock = threading.Lock()
+
+        # the number of connections waiting for or running a registration
+        self.__pending = 0
+
+        # the number of connections from each IP address
+        self.__per_ip = {}
+
+        # counters of the connections admitted and refused
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_rate = 0
+        self.rejected_ip = 0
+        self.expired = 0
+
+        # the registration workers
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="Client Registrar")
+
+    # decide if a new connection may register
+    def admit(self, address: tuple) -> bool:
+        """
+        Decide if a new connection may register, counts it against the limits if it may. Every admitted connection
+        must be passed to RegistrationAdmission.register() or RegistrationAdmission.abandon().
+
+        :param address: The address of the connection.
+        :return: True if the connection was admitted, False if it should be closed.
+        """
+
+        ip = address[0]
+
+        with self.__lock:
+            # too many connections from the address
+            if self.max_per_ip is not None and self.__per_ip.get(ip, 0) >= self.max_per_ip:
+                self.rejected_ip += 1
+                reason = "too many connections from the address"
+
+            # too many registrations waiting
+            elif self.__pending >= self.max_pending:
+                self.rejected_full += 1
+                reason = "too many registrations waiting"
+
+            # the rate is spent and the connection may not wait for it
+            elif self.policy == self.REJECT and self.__limiter is not None and not self.__limiter.try_acquire():
+                self.rejected_rate += 1
+                reason = "registration rate exceeded"
+
+            else:
+                self.__pending += 1
+                self.__per_ip[ip] = self.__per_ip.get(ip, 0) + 1
+                self.admitted += 1
+                return True
+
+        # logging output
+        self.logger.warning("(Admit) Refusing connection from '" + str(ip) + "', " + reason + ".")
+        return False
+
+    # queue the registration of an admitted connection
+    def register(self, connection: socket.socket, address: tuple):
+        """
+        Queue the registration of an admitted connection on the registration workers.
+
+        :param connection: The connection's socket.
+        :param address: The address of the connection.
+        :return: None
+        """
+        self.__executor.submit(self.__run, connection, address, time.monotonic())
+
+    # register a connection, run on the executor
+    def __run(self, connection: socket.socket, address: tuple, queued: float):
+        added = False
+
+        try:
+            deadline = queued + self.queue_timeout
+
+            # with the queue policy the rate is waited for here, the connection is dropped if it waited too long
+            if (self.__limiter is not None and self.policy == self.QUEUE
+                    and not self.__limiter.acquire(timeout=max(0.0, deadline - time.monotonic()))) \
+                    or time.monotonic() > deadline:
+                with self.__lock:
+                    self.expired += 1
+
+                # logging output
+                self.logger.warning("(Register) Connection from '" + str(address[0]) + "' waited too long to register,"
+                                    + " closing it.")
+
+                connection.close()
+                return
+
+            added = self.__register(connection, address)
+
+        # a failing registration must not take down the worker
+        except Exception as error:
+            self.logger.error("(Register) Exception caught when registering a client. Exception: '" + str(error) + "'")
+
+        finally:
+            with self.__lock:
+                self.__pending -= 1
+
+            # only clients in the pool keep counting against their address
+            if not added:
+                self.release(address)
+
+    # give up on an admitted connection before it was registered
+    def abandon(self, address: tuple):
+        """
+        Stop counting an admitted connection which will not be registered (ex. its SSL handshake failed).
+
+        :param address: The address of the connection.
+        :return: None
+        """
+
+        with self.__lock:
+            self.__pending -= 1
+
+        self.release(address)
+
+    # stop counting a connection against its address
+    def release(self, address: tuple):
+        """
+        Stop counting a connection against the per address limit, called once a registered client leaves the pool.
+
+        :param address: The address of the connection.
+        :return: None
+        """
+
+        ip = address[0]
+
+        with self.__lock:
+            count = self.__per_ip.get(ip, 0) - 1
+
+            if count > 0:
+                self.__per_ip[ip] = count
+            else:
+                self.__per_ip.pop(ip, None)
+
+    # the admission counters
+    def stats(self) -> dict:
+        """
+        Get the number of connections admitted, refused because of each limit, and dropped after waiting too long, the
+        number of registrations pending, and the number of addresses with connections.
+
+        :return: dict
+        """
+
+        with self.__lock:
+            return {
+                "admitted": self.admitted,
+                "rejected_full": self.rejected_full,
+                "rejected_rate": self.rejected_rate,
+                "rejected_ip": self.rejected_ip,
+                "expired": self.expired,
+                "pending": self.__pending,
+                "addresses": len(self.__per_ip)
+            }
+
+    # stop the registration workers
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the registration workers once every queued registration has run.
+
+        :param wait: Block until the registrations have finished.
+        :return: None
+        """
+        self.__executor.shutdown(wait)
@@ -0,0 +1,458 @@
+# default lib imports
+import logging
+import math
+import threading
+import time
+from array import array
+from typing import Hashable, Iterable, Union, Sequence
+
+# optional lib imports, values are added one at a time without numpy
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# the time buckets of one key, every statistic is kept in a flat array with one entry per bucket (and sketch_width
+# entries per bucket for the sketch) so a key costs a few fixed size arrays no matter how many values it sees
+class _Ring:
+    __slots__ = ("epochs", "counts", "sums", "minimums", "maximums", "sketch")
+
+    def __init__(self, slots: int, sketch_width: int):
+        # the bucket number each slot holds, -1 for a slot which was never used
+        self.epochs = array("q", [-1]) * slots
+        self.counts = array("Q", [0]) * slots
+        self.sums = array("d", [0.0]) * slots
+        self.minimums = array("d", [0.0]) * slots
+        self.maximums = array("d", [0.0]) * slots
+
+        # the histogram of each slot, None if the key keeps no sketch
+        self.sketch = array("I", [0]) * (slots * sketch_width) if sketch_width else None
+
+
+# keeps rolling count, sum, min, max and mean of streams of values indexed by key (ex. a device and a field) over the
+# last slots * resolution seconds, and a log scale histogram per bucket to estimate percentiles
+class Aggregator:
+    def __init__(self, resolution: float = 1.0, slots: int = 60, sketch_bins: int = 64,
+                 sketch_range: tuple = (0.001, 1000000.0), max_keys: int = 100000,
+                 logging_id: str = "[Aggregator]", logging_level: int = logging.WARNING):
+        if not isinstance(resolution, (int, float)) or resolution <= 0:
+            raise TypeError("resolution must be a number greater than 0 representing time in seconds")
+
+        if not isinstance(slots, int) or slots <= 0:
+            raise TypeError("slots must be an int greater than 0")
+
+        if not isinstance(sketch_bins, int) or sketch_bins < 0:
+            raise TypeError("sketch_bins must be an int greater than or equal to 0")
+
+        if not 0 < sketch_range[0] < sketch_range[1]:
+            raise ValueError("sketch_range must be a (low, high) pair with 0 < low < high")
+
+        # logger object and setup
+        self.logger = logging.getLogger(logging_id)
+        self.logger.setLevel(logging_level)
+
+        # the length of a bucket in seconds and the number of buckets kept, windows up to resolution * slots long can
+        # be queried
+        self.resolution = resolution
+        self.slots = slots
+
+        # the number of histogram bins of a bucket on each side of zero, spread on a log scale across the magnitudes in
+        # sketch_range (larger magnitudes are counted in the outermost bins), 0 keeps no sketches
+        self.sketch_bins = sketch_bins
+        self.sketch_range = sketch_range
+        self.__log_low = math.log(sketch_range[0])
+        self.__bin_scale = sketch_bins / (math.log(sketch_range[1]) - self.__log_low) if sketch_bins else 0.0
+
+        # the number of histogram entries of a bucket, the negative bins (most negative first), one bin for the values
+        # closer to zero than sketch_range[0], then the positive bins
+        self.__sketch_width = 2 * sketch_bins + 1 if sketch_bins else 0
+
+        # the max number of keys, values of new keys over it are dropped so the memory used is bounded
+        self.max_keys = max_keys
+
+        # lock guarding the rings
+        self.__lock = threading.Lock()
+
+        # the ring of each key
+        self.__rings = {}
+
+        # the number of values dropped because max_keys was reached
+        self.dropped = 0
+
+        # the number of NaN and infinite values left out, they have no place in the sums or the sketches
+        self.invalid = 0
+
+    # the ring of a key, made if the key is new, must be called with the lock held
+    def __ring(self, key: Hashable, sketch: bool) -> Union[_Ring, None]:
+        ring = self.__rings.get(key)
+
+        if ring is None:
+            if len(self.__rings) >= self.max_keys:
+                return None
+
+            ring = self.__rings[key] = _Ring(self.slots, self.__sketch_width if sketch else 0)
+
+        return ring
+
+    # the slot of the bucket a timestamp falls in, emptied if it holds an older bucket, must be called with the lock
+    # held
+    def __slot(self, ring: _Ring, timestamp: float) -> int:
+        epoch = int(timestamp // self.resolution)
+        slot = epoch % self.slots
+
+        if ring.epochs[slot] != epoch:
+            ring.epochs[slot] = epoch
+            ring.counts[slot] = 0
+            ring.sums[slot] = 0.0
+            ring.minimums[slot] = math.inf
+            ring.maximums[slot] = -math.inf
+
+            if ring.sketch is not None:
+                start = slot * self.__sketch_width
+                ring.sketch[start:start + self.__sketch_width] = array("I", [0]) * self.__sketch_width
+
+        return slot
+
+    # the histogram bin of a value
+    def __bin(self, value: float) -> int:
+        magnitude = abs(value)
+
+        if magnitude < self.sketch_range[0]:
+            return self.sketch_bins
+
+        offset = min(int((math.log(magnitude) - self.__log_low) * self.__bin_scale), self.sketch_bins - 1)
+        return self.sketch_bins + 1 + offset if value > 0 else self.sketch_bins - 1 - offset
+
+    # the value a histogram bin stands for, the geometric middle of its magnitudes
+    def __bin_value(self, index: int) -> float:
+        if index == self.sketch_bins:
+            return 0.0
+
+        offset = index - self.sketch_bins - 1 if index > self.sketch_bins else self.sketch_bins - 1 - index
+        middle = math.exp(self.__log_low + (offset + 0.5) / self.__bin_scale)
+
+        return middle if index > self.sketch_bins else -middle
+
+    # add a value
+    def add(self, key: Hashable, value: float, timestamp: float = None, sketch: bool = True) -> bool:
+        """
+        Add a value to a key's current bucket.
+
+        :param key: The key the value is aggregated under (ex. a (uuid, field) tuple).
+        :param value: The value.
+        :param timestamp: The time.time() timestamp of the value, None uses the current time.
+        :param sketch: Keep a percentile sketch for the key, only used when the key is new.
+        :return: True if the value was added, False if it was dropped because max_keys was reached or because it is NaN
+                 or infinite.
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        value = float(value)
+
+        if not math.isfinite(value):
+            with self.__lock:
+                self.invalid += 1
+            return False
+
+        with self.__lock:
+            ring = self.__ring(key, sketch)
+            if ring is None:
+                self.dropped += 1
+                return False
+
+            slot = self.__slot(ring, timestamp)
+
+            ring.counts[slot] += 1
+            ring.sums[slot] += value
+
+            if value < ring.minimums[slot]:
+                ring.minimums[slot] = value
+            if value > ring.maximums[slot]:
+                ring.maximums[slot] = value
+
+            if ring.sketch is not None:
+                ring.sketch[slot * self.__sketch_width + self.__bin(value)] += 1
+
+        return True
+
+    # the key of a field of a device
+    @staticmethod
+    def device_key(unique_id: str, field: str) -> tuple:
+        """
+        The key the Manager aggregates a record field of one device under.
+
+        :param unique_id: The device's UUID.
+        :param field: The name of the field.
+        :return: tuple
+        """
+        return "device", unique_id, field
+
+    # the key of a field of a device type
+    @staticmethod
+    def type_key(device_type: str, field: str) -> tuple:
+        """
+        The key the Manager aggregates a record field of every device of a type under.
+
+        :param device_type: The device type.
+        :param field: The name of the field.
+        :return: tuple
+        """
+        return "type", device_type, field
+
+    # add the fields of a batch of records
+    def add_records(self, device_type: str, unique_id: str, schema, records, fields: Sequence[str],
+                    device_sketches: bool = False):
+        """
+        Add fields of the records decoded by a RecordSchema under the keys of the device (Aggregator.device_key()) and
+        of its type (Aggregator.type_key()).
+
+        :param device_type: The device's type.
+        :param unique_id: The device's UUID.
+        :param schema: The RecordSchema which decoded the records.
+        :param records: The decoded records.
+        :param fields: The names of the fields to aggregate.
+        :param device_sketches: Keep percentile sketches for the device's keys, the type's keys always keep them.
+        :return: None
+        """
+
+        timestamp = time.time()
+
+        for field in fields:
+            values = schema.column(records, field)
+
+            self.add_many(self.device_key(unique_id, field), values, timestamp, device_sketches)
+            self.add_many(self.type_key(device_type, field), values, timestamp)
+
+    # count values left out because they are not finite
+    def __count_invalid(self, invalid: int):
+        if invalid:
+            with self.__lock:
+                self.invalid += invalid
+
+    # add many values
+    def add_many(self, key: Hashable, values: Union[Iterable, "numpy.ndarray"], timestamp: float = None,
+                 sketch: bool = True) -> bool:
+        """
+        Add many values to a key's current bucket at once, a numpy array (ex. a field of the records decoded by a
+        RecordSchema) is added in a few vectorized steps. NaN and infinite values are left out and counted as invalid.
+
+        :param key: The key the values are aggregated under.
+        :param values: A numpy array or an iterable of numbers.
+        :param timestamp: The time.time() timestamp of the values, None uses the current time.
+        :param sketch: Keep a percentile sketch for the key, only used when the key is new.
+        :return: True if the values were added, False if they were dropped because max_keys was reached.
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        # reduce the values before taking the lock
+        if numpy is not None:
+            values = numpy.asarray(values, dtype=numpy.float64).ravel()
+
+            finite = numpy.isfinite(values)
+            invalid = len(values) - int(numpy.count_nonzero(finite))
+            if invalid:
+                values = values[finite]
+
+            count = len(values)
+
+            if count == 0:
+                self.__count_invalid(invalid)
+                return True
+
+            total = float(values.sum())
+            minimum = float(values.min())
+            maximum = float(values.max())
+            bins = None
+
+            if self.sketch_bins and sketch:
+                magnitudes = numpy.abs(values)
+                offsets = (numpy.log(numpy.maximum(magnitudes, self.sketch_range[0])) - self.__log_low) \
+                    * self.__bin_scale
+                offsets = numpy.minimum(offsets.astype(numpy.int64), self.sketch_bins - 1)
+
+                # mirror the negative values and put the ones closer to zero than sketch_range[0] in the middle bin
+                indexes = numpy.where(values > 0, self.sketch_bins + 1 + offsets, self.sketch_bins - 1 - offsets)
+                indexes[magnitudes < self.sketch_range[0]] = self.sketch_bins
+
+                counts = numpy.bincount(indexes, minlength=self.__sketch_width)
+                bins = [(int(index), int(counts[index])) for index in numpy.flatnonzero(counts)]
+        else:
+            # a field with a repeat count is decoded into tuples
+            values = [float(item) for value in values for item in (value if isinstance(value, tuple) else (value,))]
+
+            given = len(values)
+            values = [value for value in values if math.isfinite(value)]
+            invalid = given - len(values)
+
+            count = len(values)
+
+            if count == 0:
+                self.__count_invalid(invalid)
+                return True
+
+            total = math.fsum(values)
+            minimum = min(values)
+            maximum = max(values)
+            bins = None
+
+            if self.sketch_bins and sketch:
+                counts = {}
+                for value in values:
+                    index = self.__bin(value)
+                    counts[index] = counts.get(index, 0) + 1
+
+                bins = counts.items()
+
+        with self.__lock:
+            self.invalid += invalid
+
+            ring = self.__ring(key, sketch)
+            if ring is None:
+                self.dropped += count
+                return False
+
+            slot = self.__slot(ring, timestamp)
+
+            ring.counts[slot] += count
+            ring.sums[slot] += total
+
+            if minimum < ring.minimums[slot]:
+                ring.minimums[slot] = minimum
+            if maximum > ring.maximums[slot]:
+                ring.maximums[slot] = maximum
+
+            if ring.sketch is not None and bins is not None:
+                start = slot * self.__sketch_width
+
+                for index, bin_count in bins:
+                    ring.sketch[start + index] += bin_count
+
+        return True
+
+    # the aggregates of a key over a window
+    def query(self, key: Hashable, window: float = None, percentiles: Sequence[float] = (0.5, 0.9, 0.99),
+              now: float = None) -> Union[dict, None]:
+        """
+        Get the count, sum, min, max and mean of the values of a key within a window ending now, and estimates of
+        percentiles of the values (accurate to within a histogram bin, only if the key keeps a sketch). The window is
+        rounded up to whole buckets.
+
+        :param key: The key.
+        :param window: The length of the window in seconds, None uses every bucket kept.
+        :param percentiles: The percentiles to estimate as fractions (ex. 0.99).
+        :param now: The time.time() timestamp the window ends at, None uses the current time.
+        :return: A dict, or None if the key has no values within the window.
+        """
+
+        if now is None:
+            now = time.time()
+
+        buckets = self.slots if window is None else min(self.slots, max(1, math.ceil(window / self.resolution)))
+        last = int(now // self.resolution)
+
+        with self.__lock:
+            ring = self.__rings.get(key)
+            if ring is None:
+                return None
+
+            count = 0
+            total = 0.0
+            minimum = math.inf
+            maximum = -math.inf
+            histogram = [0] * self.__sketch_width if ring.sketch is not None else None
+
+            for epoch in range(last - buckets + 1, last + 1):
+                slot = epoch % self.slots
+
+                if ring.epochs[slot] != epoch or not ring.counts[slot]:
+                    continue
+
+                count += ring.counts[slot]
+                total += ring.sums[slot]
+                minimum = min(minimum, ring.minimums[slot])
+                maximum = max(maximum, ring.maximums[slot])
+
+                if histogram is not None:
+                    start = slot * self.__sketch_width
+
+                    for index, bin_count in enumerate(ring.sketch[start:start + self.__sketch_width]):
+                        histogram[index] += bin_count
+
+        if not count:
+            return None
+
+        result = {
+            "count": count,
+            "sum": total,
+            "min": minimum,
+            "max": maximum,
+            "mean": total / count
+        }
+
+        if histogram is not None:
+            result["percentiles"] = {percentile: self.__percentile(histogram, count, percentile, minimum, maximum)
+                                     for percentile in percentiles}
+
+        return result
+
+    # estimate a percentile from a histogram
+    def __percentile(self, histogram: list, count: int, percentile: float, minimum: float, maximum: float) -> float:
+        rank = percentile * count
+        seen = 0
+
+        for index, bin_count in enumerate(histogram):
+            seen += bin_count
+
+            if seen >= rank and bin_count:
+                # the middle of the bin, kept within the values seen
+                return min(max(self.__bin_value(index), minimum), maximum)
+
+        return maximum
+
+    # the keys with values
+    def keys(self) -> list:
+        """
+        Get every key which has been added to.
+
+        :return: list
+        """
+
+        with self.__lock:
+            return list(self.__rings)
+
+    # forget a key
+    def remove(self, key: Hashable) -> bool:
+        """
+        Drop the buckets of a key, freeing their memory.
+
+        :param key: The key.
+        :return: True if the key was removed, False if it had no values.
+        """
+
+        with self.__lock:
+            return self.__rings.pop(key, None) is not None
+
+    # the memory used by the buckets
+    def memory(self) -> int:
+        """
+        Get the approximate number of bytes used by the buckets of every key.
+
+        :return: int
+        """
+
+        with self.__lock:
+            rings = list(self.__rings.values())
+
+        size = 0
+        for ring in rings:
+            size += sum(column.itemsize * len(column) for column in (ring.epochs, ring.counts, ring.sums,
+                                                                      ring.minimums, ring.maximums))
+            if ring.sketch is not None:
+                size += ring.sketch.itemsize * len(ring.sketch)
+
+        return size
@@ -0,0 +1,1353 @@
+# default lib imports
+import asyncio
+import inspect
+import json
+import logging
+import random
+import ssl
+import time
+from collections import deque
+from typing import Union, Callable
+from uuid import uuid4
+
+# module imports
+from .Client import Client
+from .Packet import Packet
+from .Message import Message, MessageBatch
+from .DeviceType import DeviceType
+from .FrameDecoder import FrameDecoder
+from .ClientRegistry import ClientRegistry
+from .Broadcast import BroadcastResult
+from .Manager import Manager, packetable
+from .Handshake import TypeTable, NAMED_TYPE, decode_info
+from .Aggregator import Aggregator
+from .ReservedBytes import GET_DATA, HEARTBEAT, END_CONNECTION, PROTOCOL, TYPE_ID, BINARY_INFO, PROTOCOL_V1, \
+    PROTOCOL_V2, STREAM_CHUNK, STREAM_END, PRIORITY_CONTROL
+
+
+# a client connected to an AsyncManager, the connection is an asyncio protocol so reads and writes are driven by the
+# event loop and no thread or task waits on an idle client
+class AsyncClient(asyncio.BufferedProtocol):
+    # an exception raised when the client ends the connection
+    class ConnectionEnd(Exception):
+        pass
+
+    # an exception raised when the client fails to give valid info
+    class InvalidInfo(Exception):
+        pass
+
+    def __init__(self, logging_level: int, max_frame_size: int = 4194304, write_timeout: float = 30,
+                 high_watermark: int = 1048576, low_watermark: int = None, max_pending_handlers: int = 64,
+                 on_made: Callable = None, on_lost: Callable = None, type_table: TypeTable = None):
+        # client logger
+        self.logger = logging.getLogger("[Client](ID: UNKNOWN)")
+        self.logger_level = logging_level
+        self.logger.setLevel(self.logger_level)
+
+        # the transport of the connection, set once the connection is made
+        self.__transport = None
+
+        # the address of the client
+        self.address = None
+
+        # called with the client once the connection is made and once it is lost
+        self.__on_made = on_made
+        self.__on_lost = on_lost
+
+        # the client's info
+        self.__uuid = None
+        self.__type = None
+        self.data = None
+
+        # the table the client's type name is interned in, shared by every client of the manager
+        self.__types = type_table if type_table is not None else TypeTable()
+
+        # id of this connection, unlike the uuid it is never shared with a later connection of the same client
+        self.instance_id = str(uuid4())
+
+        # the protocol version of the frames sent and received, starts at version 1 until the client asks for more
+        self.protocol_version = PROTOCOL_V1
+
+        # incremental frame decoder, the event loop reads straight into its buffer
+        self.__decoder = FrameDecoder(max_frame_size=max_frame_size)
+
+        # the last stream id used by Client.send_stream()
+        self.__next_stream_id = 0
+
+        # the time the client last sent any data (time.monotonic())
+        self.last_seen = time.monotonic()
+
+        # requests waiting for a reply as tuples of (match, Future), checked in order for each frame read
+        self.__waiters = deque()
+
+        # called with each list of frames which are not replies to a request, frames read before it is set are kept
+        self.__listener = None
+        self.__frames = []
+
+        # the time the transport may refuse more data before the client is disconnected
+        self.write_timeout = write_timeout
+
+        # the number of bytes buffered by the transport at which it stops taking data and the number it must drain to
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark if low_watermark is not None or high_watermark is None \
+            else high_watermark // 2
+
+        # the number of packets dropped because the transport was full
+        self.dropped = 0
+
+        # futures waiting for the transport to take more data and the timer which disconnects the client if it does not
+        self.__drain_waiters = []
+        self.__write_deadline = None
+
+        # handler coroutines waiting to run for this client, run one after the other so they see messages in order,
+        # reading from the client pauses while max_pending_handlers are waiting
+        self.__handlers = deque()
+        self.__handler_task = None
+        self.max_pending_handlers = max_pending_handlers
+        self.__reading_paused = False
+
+        # true once the connection is closed
+        self.__closed = False
+
+    # return the client's uuid
+    def uuid(self):
+        return self.__uuid
+
+    # return the client's type
+    def type(self):
+        return self.__type
+
+    # check if the connection has been closed
+    def is_closed(self) -> bool:
+        """
+        Check if the connection to the client has been closed.
+
+        :return: bool
+        """
+        return self.__closed
+
+    # <> asyncio protocol callbacks <>
+    def connection_made(self, transport: asyncio.Transport):
+        self.__transport = transport
+        self.address = transport.get_extra_info("peername")
+
+        # the transport pauses the writers once this many bytes are buffered
+        if self.high_watermark is not None:
+            transport.set_write_buffer_limits(self.high_watermark, self.low_watermark)
+
+        self.logger = logging.getLogger("[Client](ID: UNKNOWN | IP: " + str(self.address[0]) + ")")
+        self.logger.setLevel(self.logger_level)
+
+        if self.__on_made is not None:
+            self.__on_made(self)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.__decoder.buffer()
+
+    def buffer_updated(self, nbytes: int):
+        self.__decoder.advance(nbytes)
+        self.last_seen = time.monotonic()
+
+        try:
+            frames = self.__decoder.frames()
+
+        # refuse frames which would grow the buffer past the limit
+        except FrameDecoder.FrameTooLarge as error:
+            self.abort(str(error))
+            return
+
+        # hand every frame which is not a reply to a request to the listener
+        frames = self.__match_replies(frames)
+
+        if not frames:
+            return
+
+        if self.__listener is None:
+            self.__frames.extend(frames)
+        else:
+            self.__listener(self, frames)
+
+    def eof_received(self):
+        # let the transport close the connection
+        return False
+
+    def pause_writing(self):
+        # the client is not reading, disconnect it if it does not start again before the write timeout
+        if self.write_timeout is not None and self.__write_deadline is None:
+            self.__write_deadline = asyncio.get_event_loop().call_later(
+                self.write_timeout, self.abort,
+                "Client stopped reading, no data was written for " + str(self.write_timeout) + " seconds.")
+
+    def resume_writing(self):
+        if self.__write_deadline is not None:
+            self.__write_deadline.cancel()
+            self.__write_deadline = None
+
+        self.__wake_drain_waiters()
+
+    def connection_lost(self, exc: Union[Exception, None]):
+        self.__closed = True
+
+        if self.__write_deadline is not None:
+            self.__write_deadline.cancel()
+            self.__write_deadline = None
+
+        # fail every request waiting for a reply
+        for _, future in self.__waiters:
+            if not future.done():
+                future.set_exception(self.ConnectionEnd())
+
+        self.__waiters.clear()
+        self.__wake_drain_waiters()
+
+        if self.__on_lost is not None:
+            self.__on_lost(self)
+
+    # wake every coroutine waiting in AsyncClient.drain()
+    def __wake_drain_waiters(self):
+        for future in self.__drain_waiters:
+            if not future.done():
+                future.set_result(None)
+
+        self.__drain_waiters.clear()
+
+    # match frames to the requests waiting for a reply
+    def __match_replies(self, frames: list) -> list:
+        if not self.__waiters:
+            return frames
+
+        unmatched = []
+
+        for frame in frames:
+            for waiter in self.__waiters:
+                match, future = waiter
+
+                if not future.done() and match(frame):
+                    future.set_result(frame)
+                    self.__waiters.remove(waiter)
+                    break
+            else:
+                unmatched.append(frame)
+
+        return unmatched
+
+    # <> reading <>
+    # start handing frames to a listener
+    def attach_reader(self, listener: Callable):
+        """
+        Hand every frame which is not a reply to a request to a listener, including the frames read before it was
+        attached.
+
+        :param listener: Callable called with the client and a list of receiving Packets.
+        :return: None
+        """
+
+        self.__listener = listener
+
+        frames, self.__frames = self.__frames, []
+        if frames:
+            listener(self, frames)
+
+    # run a handler coroutine once the ones scheduled before it have finished
+    def schedule(self, awaitable):
+        """
+        Run an awaitable once every awaitable scheduled before it for this client has finished, so the client's
+        messages are handled in order. Reading from the client pauses while max_pending_handlers are waiting.
+
+        :param awaitable: The awaitable to run.
+        :return: None
+        """
+
+        self.__handlers.append(awaitable)
+
+        # stop reading until the handlers catch up
+        if len(self.__handlers) >= self.max_pending_handlers and not self.__reading_paused and not self.__closed:
+            self.__reading_paused = True
+            self.__transport.pause_reading()
+
+        if self.__handler_task is None:
+            self.__handler_task = asyncio.ensure_future(self.__run_handlers())
+
+    # run the scheduled handlers in order, only runs while there are handlers waiting
+    async def __run_handlers(self):
+        try:
+            while self.__handlers:
+                await self.__handlers.popleft()
+
+                # the handlers have caught up
+                if self.__reading_paused and len(self.__handlers) < self.max_pending_handlers // 2:
+                    self.__reading_paused = False
+
+                    if not self.__closed:
+                        self.__transport.resume_reading()
+        finally:
+            self.__handler_task = None
+
+    # wait for a reply to a request
+    async def request(self, packet: Packet, match: Callable[[Packet], bool], timeout: Union[float, None] = 15) \
+            -> Union[Packet, None]:
+        """
+        Send a packet and wait for the first frame which match() returns True for. Other frames are handed to the
+        listener as usual.
+
+        :param packet: The packet to send.
+        :param match: Callable which returns True for the reply.
+        :param timeout: Max time to wait for the reply in seconds, None will wait forever.
+        :return: The reply Packet, None if no reply came in time or the connection was closed.
+        """
+
+        future = asyncio.get_event_loop().create_future()
+        waiter = (match, future)
+
+        # register the waiter before sending so a fast reply is not missed
+        self.__waiters.append(waiter)
+
+        try:
+            if not self.send(packet):
+                return None
+
+            return await asyncio.wait_for(future, timeout)
+
+        except (asyncio.TimeoutError, self.ConnectionEnd):
+            return None
+
+        finally:
+            try:
+                self.__waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    # get the client's info
+    async def get_data(self, timeout: float = 15):
+        """
+        Get the client's info, see Client.get_data(). Raises AsyncClient.InvalidInfo if the client gives invalid info
+        or AsyncClient.ConnectionEnd if it does not reply in time.
+
+        :param timeout: The time allowed for a response before the connection is ended.
+        :return: None
+        """
+
+        # logging output
+        self.logger.info("(getinfo) Sending getinfo request.")
+
+        packet = await self.request(Packet(GET_DATA, priority=PRIORITY_CONTROL), lambda reply: not reply.is_stream(),
+                                    timeout)
+
+        # if the request failed because of an error or a timeout end the connection
+        if packet is None:
+            self.end()
+            raise self.ConnectionEnd
+
+        # clients may reply with the compact binary form instead of the text form
+        if packet.payload[0:1] == BINARY_INFO:
+            try:
+                client_uuid, client_type, sent_type_id, client_data = decode_info(packet.payload, self.__types)
+            except ValueError as error:
+                # logging output
+                self.logger.error("(getinfo) Invalid binary info. " + str(error))
+
+                raise self.InvalidInfo
+
+            # a client which named a registered type is told its id so it can send the id when it reconnects
+            type_id = self.__types.id_of(client_type)
+            if sent_type_id == NAMED_TYPE and type_id is not None:
+                if not self.send(Packet(TYPE_ID, type_id.to_bytes(2, 'big'), priority=PRIORITY_CONTROL)):
+                    self.end()
+                    raise self.ConnectionEnd
+
+            self.__set_info(client_uuid, client_type, client_data)
+            return None
+
+        # split the response using "##" as the delimiter
+        response = bytes(packet.payload).decode(errors="replace").split("##")
+
+        # if the response is not 3 pieces of data raise an error
+        if len(response) != 3:
+            # logging output
+            self.logger.error("(getinfo) Response invalid formatting, must be 3 values separated by delimiter '##'"
+                              + ". Formatted like: 'UUID##DEVICE_TYPE##JSON'.")
+
+            raise self.InvalidInfo
+
+        # check if the UUID is 36 char long to only allow proper UUIDs
+        if len(response[0]) != 36:
+            # logging output
+            self.logger.error("(getinfo) UUID invalid length, should be 36 characters. Data received: "
+                              + str(response) + ".")
+
+            raise self.InvalidInfo
+
+        # convert the data from a JSON string to a python dict
+        try:
+            client_data = json.loads(response[2])
+        except json.JSONDecodeError:
+            # logging output
+            self.logger.error("(getinfo) Failed to parse JSON.")
+
+            raise self.InvalidInfo
+
+        self.__set_info(response[0], self.__types.intern(response[1]), client_data)
+        return None
+
+    # store the client's info and switch protocol versions if it asked to
+    def __set_info(self, client_uuid: str, client_type: str, client_data):
+        # store the retrieved data
+        self.__uuid = client_uuid
+        self.__type = client_type
+        self.data = client_data
+
+        # update the client's logger info
+        self.logger = logging.getLogger("[Client](ID: " + self.__uuid + ")")
+        self.logger.setLevel(self.logger_level)
+
+        # switch to version 2 frames if the client asked for them, the confirmation is sent using version 1
+        if isinstance(client_data, dict) and client_data.get("protocol_version") == PROTOCOL_V2:
+            if not self.send(Packet(PROTOCOL, bytes((PROTOCOL_V2,)), priority=PRIORITY_CONTROL)):
+                self.end()
+                raise self.ConnectionEnd
+
+            self.protocol_version = PROTOCOL_V2
+            self.__decoder.version = PROTOCOL_V2
+
+            # logging output
+            self.logger.info("(getinfo) Client is using protocol version " + str(PROTOCOL_V2) + ".")
+
+    # check the heartbeat of the client
+    async def heartbeat(self, heartbeat_timeout: float) -> bool:
+        """
+        Send the client a heartbeat packet and wait for its reply, the connection is ended if no reply comes in time.
+
+        :param heartbeat_timeout: The time allowed for a reply.
+        :return: True if the connection is alive and False if the connection is now dead.
+        """
+
+        response = await self.request(Packet(HEARTBEAT, priority=PRIORITY_CONTROL),
+                                      lambda reply: reply.bytes == HEARTBEAT, heartbeat_timeout)
+
+        if response is not None:
+            return True
+
+        self.logger.warning("(heartbeat) Failed heartbeat check.")
+        self.end()
+        return False
+
+    # <> writing <>
+    # write a packet to the client
+    def send(self, packet: Packet) -> bool:
+        """
+        Write a packet to the client's transport, which sends it as soon as the socket takes it. Packets other than
+        control packets are dropped while the transport holds high_watermark bytes the client has not read, use
+        AsyncClient.drain() to wait for room instead.
+
+        :param packet: Packet object containing the data to send to the client, should be a Packet in sending mode.
+        :return: True if the packet was written to the transport, False if it was dropped or could not be framed.
+        """
+
+        if self.__closed or self.__transport.is_closing():
+            return False
+
+        # the client is not reading, drop the packet
+        if packet.priority != PRIORITY_CONTROL and self.high_watermark is not None \
+                and self.__transport.get_write_buffer_size() >= self.high_watermark:
+            self.dropped += 1
+            self.logger.debug("(send) The transport is full, packet dropped.")
+            return False
+
+        try:
+            buffers = packet.buffers(self.protocol_version)
+
+        # the packet does not fit the frames of the client's protocol version
+        except (OverflowError, ValueError) as error:
+            self.logger.error("(send) Unable to send packet. Exception: '" + str(error) + "'")
+            return False
+
+        self.__transport.writelines(buffers)
+        return True
+
+    # wait for the transport to take more data
+    async def drain(self) -> bool:
+        """
+        Wait until the transport holds fewer than high_watermark unsent bytes.
+
+        :return: True if more data can be sent, False if the connection was closed.
+        """
+
+        while not self.__closed and self.high_watermark is not None \
+                and self.__transport.get_write_buffer_size() >= self.high_watermark:
+            future = asyncio.get_event_loop().create_future()
+            self.__drain_waiters.append(future)
+            await future
+
+        return not self.__closed
+
+    # send a large payload as a stream of chunk frames
+    async def send_stream(self, source, chunk_size: int = 65536) -> bool:
+        """
+        Send a payload of any size as a stream of frames, waiting for the transport to take each chunk, see
+        Client.send_stream(). Requires the client to be using protocol version 2.
+
+        :param source: A bytes-like object, a binary file object, or an iterable of bytes-like chunks.
+        :param chunk_size: The max size of each chunk in bytes.
+        :return: True if the whole stream was sent, False if it could not be sent.
+        """
+
+        # streams need the frame flags of version 2
+        if self.protocol_version < PROTOCOL_V2:
+            self.logger.warning("(send_stream) Unable to send a stream, the client is using protocol version "
+                                + str(self.protocol_version) + ".")
+            return False
+
+        # give the stream an id
+        self.__next_stream_id = (self.__next_stream_id + 1) & 0xFFFFFFFF
+        stream_id = self.__next_stream_id.to_bytes(4, 'big')
+
+        # send every chunk once the transport has room for it
+        for chunk in Client.stream_chunks(source, chunk_size):
+            if not await self.drain() or not self.send(Packet(stream_id, chunk, flags=STREAM_CHUNK)):
+                return False
+
+        # mark the end of the stream
+        return await self.drain() and self.send(Packet(stream_id, flags=STREAM_END))
+
+    # end the connection
+    def end(self):
+        """
+        Send the client the end connection signal and close the connection once the transport has written everything
+        it holds.
+
+        :return: None
+        """
+
+        if self.__closed:
+            return
+
+        # logging output
+        self.logger.warning("(end) Ending connection.")
+
+        self.send(Packet(END_CONNECTION, priority=PRIORITY_CONTROL))
+        self.__transport.close()
+
+    # drop the connection without writing what is left
+    def abort(self, reason: str = "Connection aborted."):
+        """
+        Close the connection right away, dropping any data the transport has not written yet.
+
+        :param reason: The reason logged for the abort.
+        :return: None
+        """
+
+        if self.__closed:
+            return
+
+        # logging output
+        self.logger.warning("(abort) " + reason)
+
+        self.__transport.abort()
+
+    # client info as a dict
+    def return_data(self) -> Union[dict, None]:
+        """
+        Returns the client's information as a JSON serializable dictionary, None if the client has not given it yet.
+
+        :return: dict or None
+        """
+
+        if self.data is not None:
+            return {
+                "instance_id": self.instance_id,
+                "uuid": self.__uuid,
+                "type": self.__type,
+                "data": self.data
+            }
+        else:
+            return None
+
+    # use dict(client) to get client info
+    def __iter__(self):
+        yield "instance_id", self.instance_id
+        yield "uuid", self.__uuid
+        yield "type", self.__type
+        yield "data", self.data
+
+
+# asyncio version of the Manager, every connection is served by one event loop so tens of thousands of clients can be
+# served on a single core without a thread per connection or per in-flight operation, handlers may be plain functions
+# or coroutine functions (async def)
+class AsyncManager:
+    def __init__(self, ssl_context: ssl.SSLContext = None, host: str = "127.0.0.1", connection_port: int = 8595,
+                 heartbeat_rate: float = 60, heartbeat_timeout: float = 10, heartbeat_jitter: float = 0.1,
+                 passive_heartbeat: bool = True, backlogged_connections: int = 100, registration_timeout: float = 15,
+                 max_frame_size: int = 4194304, write_timeout: float = 30, outbound_high_watermark: int = 1048576,
+                 outbound_low_watermark: int = None, max_pending_handlers: int = 64, aggregator: Aggregator = None,
+                 logging_id: str = "[Async Manager]", logging_level: int = logging.WARNING,
+                 client_logging_level: int = logging.WARNING):
+
+        # <> Instantiate Public Class Variables <>
+        # the host is the computer running this program
+        self.host = host
+
+        # port that the manager will listen on for devices that want to connect
+        self.port = connection_port
+
+        # context used to wrap the connections, None for plain TCP
+        if ssl_context is not None and not isinstance(ssl_context, ssl.SSLContext):
+            raise TypeError("ssl_context must be a ssl.SSLContext")
+
+        self.ssl_context = ssl_context
+
+        # the delay between heartbeat messages
+        if isinstance(heartbeat_rate, (int, float)):
+            self.heartbeat_rate = heartbeat_rate
+        else:
+            raise TypeError("heartbeat_rate must be a number representing delay in seconds")
+
+        # the time a client has to respond before being removed
+        if isinstance(heartbeat_timeout, (int, float)):
+            self.heartbeat_timeout = heartbeat_timeout
+        else:
+            raise TypeError("heartbeat_timeout must be a number representing time in seconds")
+
+        # the fraction of the heartbeat_rate each client's heartbeat is randomly moved by
+        if isinstance(heartbeat_jitter, (int, float)) and 0 <= heartbeat_jitter < 1:
+            self.heartbeat_jitter = heartbeat_jitter
+        else:
+            raise TypeError("heartbeat_jitter must be a number from 0 up to but not including 1")
+
+        # if true any message received from a client counts as a heartbeat
+        self.passive_heartbeat = passive_heartbeat
+
+        # the size of the listening socket's backlog
+        if isinstance(backlogged_connections, int):
+            self.backlogged_connections = backlogged_connections
+        else:
+            raise TypeError("backlogged_connections must be type int")
+
+        # the time a new client has to give its info
+        if isinstance(registration_timeout, (int, float)) and registration_timeout > 0:
+            self.registration_timeout = registration_timeout
+        else:
+            raise TypeError("registration_timeout must be a number greater than 0 representing time in seconds")
+
+        # the largest message a client may send using protocol version 2 frames
+        if isinstance(max_frame_size, int) and max_frame_size > 0:
+            self.max_frame_size = max_frame_size
+        else:
+            raise TypeError("max_frame_size must be an int greater than 0")
+
+        # the time a client's transport may refuse more data before the client is disconnected
+        if isinstance(write_timeout, (int, float)) and write_timeout > 0:
+            self.write_timeout = write_timeout
+        else:
+            raise TypeError("write_timeout must be a number greater than 0 representing time in seconds")
+
+        # the number of unsent bytes buffered for a client at which packets to it are dropped, and the number it must
+        # drain to before AsyncClient.drain() returns
+        if outbound_high_watermark is not None and \
+                (not isinstance(outbound_high_watermark, int) or outbound_high_watermark <= 0):
+            raise TypeError("outbound_high_watermark must be None or an int greater than 0")
+
+        if outbound_low_watermark is not None and (not isinstance(outbound_low_watermark, int)
+                                                   or not 0 <= outbound_low_watermark <= (outbound_high_watermark or 0)):
+            raise TypeError("outbound_low_watermark must be None or an int from 0 up to outbound_high_watermark")
+
+        self.outbound_high_watermark = outbound_high_watermark
+        self.outbound_low_watermark = outbound_low_watermark
+
+        # the number of handler coroutines which may wait to run for one client before reading from it pauses
+        if isinstance(max_pending_handlers, int) and max_pending_handlers > 0:
+            self.max_pending_handlers = max_pending_handlers
+        else:
+            raise TypeError("max_pending_handlers must be an int greater than 0")
+
+        # logger object and setup
+        if isinstance(logging_id, str):
+            # logger object
+            self.logger = logging.getLogger(logging_id)
+        else:
+            raise TypeError("logging_id must be of type str")
+
+        if isinstance(logging_level, int):
+            self.logger.setLevel(logging_level)
+        else:
+            raise TypeError("logging_level must resolve to an integer value")
+
+        if isinstance(client_logging_level, int):
+            self.client_logging_level = client_logging_level
+        else:
+            raise TypeError("client_logging_level must resolve to an integer value")
+
+        # keeps the windowed aggregates of the record fields listed by each device type's aggregate, see
+        # Manager.device_aggregate()
+        if aggregator is None:
+            aggregator = Aggregator(logging_id=logging_id + "[Aggregator]", logging_level=logging_level)
+        elif not isinstance(aggregator, Aggregator):
+            raise TypeError("aggregator must be an Aggregator or None")
+
+        self.aggregator = aggregator
+
+        # <> Instantiate Private Class Variables <>
+        # a registry of connected clients indexed by uuid, instance id, and type
+        self.__clients = ClientRegistry()
+
+        # a list of device types
+        self.__device_types = {}
+
+        # true if the general messages handler takes batches, and the device types whose handler takes batches
+        self.__batch_messages = getattr(self.on_message_batch, "__func__", None) is not AsyncManager.on_message_batch
+        self.__batched_types = set()
+
+        # interns the type names of the clients and gives each added device type an id for binary handshakes
+        self.__types = TypeTable()
+
+        # the heartbeat timer of each registered client indexed by instance id, a probe timer until a probe is sent
+        # and then a deadline timer until the reply comes
+        self.__heartbeat_timers = {}
+
+        # instance ids of the clients which have been sent a probe and not yet replied
+        self.__awaiting_beat = set()
+
+        # every open connection, including the clients which are still registering
+        self.__connections = set()
+
+        # tasks registering new clients and running disconnect handlers
+        self.__tasks = set()
+
+        # the asyncio server, set once the manager has started
+        self.__server = None
+
+        # set once the manager is stopped, made once the event loop is running
+        self.__stopped = None
+
+    # <> Connections <>
+    # make the protocol of a new connection
+    def __make_client(self) -> AsyncClient:
+        return AsyncClient(self.client_logging_level, self.max_frame_size, self.write_timeout,
+                           self.outbound_high_watermark, self.outbound_low_watermark, self.max_pending_handlers,
+                           self.__client_made, self.__client_lost, self.__types)
+
+    # called by a client once its connection is made
+    def __client_made(self, client: AsyncClient):
+        # logging output
+        self.logger.info("(Connection Listener) New Client Connection Established. Client IP Address: '"
+                         + str(client.address[0]) + "'")
+
+        self.__connections.add(client)
+        self.__spawn(self.__register_client(client))
+
+    # run a coroutine as a task which is kept until it finishes
+    def __spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    # get the info of a new client and add it to the pool
+    async def __register_client(self, client: AsyncClient):
+        try:
+            # get the client's info
+            await client.get_data(self.registration_timeout)
+
+            # logging output
+            self.logger.info("(Client Registrar) Got the data of client '" + client.uuid() + "', adding client to pool.")
+
+        # in the case the client gave an invalid type or closed the connection during the handshake
+        except (AsyncClient.InvalidInfo, AsyncClient.ConnectionEnd):
+            # logging output
+            self.logger.error("(Client Registrar) Failed to receive valid data from client client with IP '"
+                              + str(client.address[0]) + "', ending connection.")
+
+            client.end()
+            return
+
+        # remove a connection which shares the UUID, assume it is the client reconnecting
+        existing_client = self.__clients.get(client.uuid())
+        if existing_client is not None and self.__clients.remove(existing_client):
+            self.__replace_client(existing_client)
+
+        # run the on_connect handlers
+        await self.__run_handler(self.on_connect, client, "on_connect")
+
+        if client.type() in self.__device_types.keys():
+            await self.__run_handler(self.__device_types[client.type()].on_connect, client, "on_connect",
+                                     client.type())
+
+        # the client may have gone while the handlers ran, it never reached the pool so its loss did not run the
+        # on_disconnect handlers which pair with the on_connect handlers that already ran
+        if client.is_closed():
+            await self.__run_disconnect_handlers(client)
+            return
+
+        # add the client to the pool, a connection sharing the UUID may have registered in the meantime
+        replaced_client = self.__clients.add(client)
+        if replaced_client is not None:
+            self.__replace_client(replaced_client)
+
+        # start handling the client's messages and checking its heartbeat
+        client.attach_reader(self.__client_frames)
+        self.__schedule_probe(client, self.heartbeat_rate * (1 + random.uniform(-1, 1) * self.heartbeat_jitter))
+
+        # log the success
+        self.logger.info("(Client Registrar) Client with UUID '" + client.uuid() + "' successfully added to pool.")
+
+    # end a connection which has been overridden by a new connection sharing its UUID
+    def __replace_client(self, client: AsyncClient):
+        # logging output
+        self.logger.debug("(Client Registrar) Client with UUID '" + client.uuid() + "' has overridden a"
+                          + " established connection. This was likely due to reconnection before a "
+                          + "heartbeat check but could also be caused by two clients sharing a UUID.")
+
+        client.end()
+        self.__disconnect_client(client)
+
+    # called by a client once its connection is lost
+    def __client_lost(self, client: AsyncClient):
+        # logging output
+        self.logger.info("(Message Listener) Client '" + str(client.uuid()) + "' closed the connection, removing from"
+                         + " pool.")
+
+        self.__connections.discard(client)
+
+        # remove the client, only the first removal runs the disconnect handlers
+        if self.__clients.remove(client):
+            self.__disconnect_client(client)
+
+    # stop checking a removed client and run the disconnect handlers
+    def __disconnect_client(self, client: AsyncClient):
+        timer = self.__heartbeat_timers.pop(client.instance_id, None)
+        if timer is not None:
+            timer.cancel()
+
+        self.__awaiting_beat.discard(client.instance_id)
+
+        self.__spawn(self.__run_disconnect_handlers(client))
+
+    # run the on_disconnect handlers
+    async def __run_disconnect_handlers(self, client: AsyncClient):
+        await self.__run_handler(self.on_disconnect, client, "on_disconnect")
+
+        if client.type() in self.__device_types.keys():
+            await self.__run_handler(self.__device_types[client.type()].on_disconnect, client, "on_disconnect",
+                                     client.type())
+
+        # free the aggregates of the device unless it has reconnected in the meantime
+        device = self.__device_types.get(client.type())
+        if getattr(device, "aggregate", None) and self.__clients.get(client.uuid()) is None:
+            for field in device.aggregate:
+                self.aggregator.remove(Aggregator.device_key(client.uuid(), field))
+
+    # <> Heartbeats <>
+    # check the client's heartbeat after a delay
+    def __schedule_probe(self, client: AsyncClient, delay: float):
+        self.__heartbeat_timers[client.instance_id] = \
+            asyncio.get_event_loop().call_later(max(0.0, delay), self.__probe, client)
+
+    # send a client a heartbeat probe, the reply is picked up by the client's listener
+    def __probe(self, client: AsyncClient):
+        # any recent message counts as a heartbeat
+        quiet = time.monotonic() - client.last_seen
+
+        if self.passive_heartbeat and quiet < self.heartbeat_rate:
+            self.__schedule_probe(client, self.heartbeat_rate - quiet)
+            return
+
+        client.send(Packet(HEARTBEAT, priority=PRIORITY_CONTROL))
+
+        self.__awaiting_beat.add(client.instance_id)
+        self.__heartbeat_timers[client.instance_id] = \
+            asyncio.get_event_loop().call_later(self.heartbeat_timeout, self.__heartbeat_expired, client,
+                                                time.monotonic())
+
+    # a client replied to its heartbeat probe
+    def __acknowledge(self, client: AsyncClient):
+        if client.instance_id not in self.__awaiting_beat:
+            return
+
+        self.__awaiting_beat.discard(client.instance_id)
+        self.__heartbeat_timers.pop(client.instance_id).cancel()
+
+        self.__schedule_probe(client, self.heartbeat_rate * (1 + random.uniform(-1, 1) * self.heartbeat_jitter))
+
+    # remove a client which did not reply to its heartbeat probe in time
+    def __heartbeat_expired(self, client: AsyncClient, probed: float):
+        # any message received since the probe was sent counts as a reply
+        if self.passive_heartbeat and client.last_seen >= probed:
+            self.__awaiting_beat.discard(client.instance_id)
+            self.__heartbeat_timers.pop(client.instance_id, None)
+
+            self.__schedule_probe(client, self.heartbeat_rate * (1 + random.uniform(-1, 1) * self.heartbeat_jitter))
+            return
+
+        # logging output
+        self.logger.error("(Heartbeat Checker for Client '" + str(client.uuid())
+                          + "') Client failed heartbeat check, removing from pool.")
+
+        self.__awaiting_beat.discard(client.instance_id)
+        self.__heartbeat_timers.pop(client.instance_id, None)
+
+        client.end()
+
+        if self.__clients.remove(client):
+            self.__disconnect_client(client)
+
+    # <> Messages <>
+    # called by a client with the frames it has read
+    def __client_frames(self, client: AsyncClient, packets: list):
+        # the messages of a client whose handlers take batches are handed over together
+        batched = self.__batch_messages or client.type() in self.__batched_types
+        batch = []
+
+        for packet in packets:
+            # a reply to a heartbeat probe
+            if packet.bytes == HEARTBEAT:
+                self.__acknowledge(client)
+                continue
+
+            if batched and not packet.is_stream():
+                batch.append(packet)
+                continue
+
+            # the batched messages the client sent first are handled first
+            if batch:
+                self.__dispatch_batch(client, batch)
+                batch = []
+
+            # logging message
+            self.logger.debug("(Message Listener) Data received from client '" + str(client.uuid()) + "'."
+                              + " Sending data to appropriate handlers.")
+
+            message = Message(client, packet)
+            name = "on_stream" if packet.is_stream() else "on_message"
+
+            self.__dispatch(client, getattr(self, name), message, name)
+
+            if client.type() in self.__device_types.keys():
+                self.__dispatch(client, getattr(self.__device_types[client.type()], name), message, name,
+                                client.type())
+
+        if batch:
+            self.__dispatch_batch(client, batch)
+
+    # run the handlers of a batch of messages, each message is handed to a handler which does not take batches
+    def __dispatch_batch(self, client: AsyncClient, packets: list):
+        batch = MessageBatch(client, packets)
+
+        if self.__batch_messages:
+            self.__dispatch(client, self.on_message_batch, batch, "on_message_batch")
+        else:
+            for packet in packets:
+                self.__dispatch(client, self.on_message, Message(client, packet), "on_message")
+
+        device = self.__device_types.get(client.type())
+        if device is None:
+            return
+
+        # decode the records of a type with a schema in one step and update the aggregates of its fields
+        if getattr(device, "schema", None) is not None:
+            try:
+                records = device.schema.decode(batch.payloads())
+            except Exception as error:
+                self.logger.error("(Message Handler) Exception caught when decoding the records of DeviceType '"
+                                  + client.type() + "'. Exception: '" + str(error) + "'")
+                return
+
+            # a failed update of the aggregates does not keep the records from the handler
+            if getattr(device, "aggregate", None):
+                try:
+                    self.aggregator.add_records(client.type(), client.uuid(), device.schema, records, device.aggregate,
+                                                device.device_sketches)
+                except Exception as error:
+                    self.logger.error("(Message Handler) Exception caught when aggregating the records of DeviceType '"
+                                      + client.type() + "'. Exception: '" + str(error) + "'")
+
+            self.__dispatch(client, lambda argument: device.on_records(argument, records), batch, "on_records",
+                            client.type())
+
+        elif client.type() in self.__batched_types:
+            self.__dispatch(client, device.on_message_batch, batch, "on_message_batch", client.type())
+        else:
+            for packet in packets:
+                self.__dispatch(client, device.on_message, Message(client, packet), "on_message", client.type())
+
+    # run a handler for a client's message, a coroutine handler is run after the client's earlier handlers
+    def __dispatch(self, client: AsyncClient, handler: Callable, argument, name: str, device_type: str = None):
+        try:
+            result = handler(argument)
+
+        # in case of a exception when executing handler
+        except Exception as error:
+            self.__log_handler_error(error, name, device_type)
+            return
+
+        if inspect.isawaitable(result):
+            client.schedule(self.__guard(result, name, device_type))
+
+    # run a handler, awaiting it if it is a coroutine function
+    async def __run_handler(self, handler: Callable, argument, name: str, device_type: str = None):
+        try:
+            result = handler(argument)
+
+            if inspect.isawaitable(result):
+                await result
+
+        # in case of a exception when executing handler
+        except Exception as error:
+            self.__log_handler_error(error, name, device_type)
+
+    # await a handler's coroutine, logging any exception it raises
+    async def __guard(self, awaitable, name: str, device_type: str = None):
+        try:
+            await awaitable
+
+        # in case of a exception when executing handler
+        except Exception as error:
+            self.__log_handler_error(error, name, device_type)
+
+    # log an exception raised by a handler
+    def __log_handler_error(self, error: Exception, name: str, device_type: str = None):
+        if device_type is None:
+            self.logger.error("(Message Handler) Exception caught when running the " + name + "() handler. Exception: '"
+                              + str(error) + "'")
+        else:
+            self.logger.error("(Message Handler) Exception caught when running the " + name + "() handler for "
+                              + "DeviceType '" + device_type + "'. Exception: '" + str(error) + "'")
+
+    # <> Sending <>
+    # write one packet to many clients
+    @staticmethod
+    def __broadcast(clients, packet: Packet) -> BroadcastResult:
+        sent = failed = skipped = 0
+
+        for client in clients:
+            if client.is_closed():
+                skipped += 1
+            elif client.send(packet):
+                sent += 1
+            else:
+                failed += 1
+
+        result = BroadcastResult(len(clients))
+        result.record(sent, failed, skipped)
+
+        return result
+
+    # sends data to all clients
+    def send_all(self, data: packetable) -> BroadcastResult:
+        """
+        Send some data to all devices. The data is encoded into a Packet once and shared by every client. Must be called
+        from the manager's event loop.
+
+        :param data: str, bytes, bytearray, memoryview, or Packet object
+        :return: A BroadcastResult with the sent/failed/skipped counts, already resolved.
+        """
+        return self.__broadcast(self.__clients.snapshot(), self.make_packet(data))
+
+    # sends data to all clients of a specified device_type
+    def send_type(self, device_type, data: packetable) -> BroadcastResult:
+        """
+        Send some data to all devices of a specific type. The data is encoded into a Packet once and shared by every
+        client. Must be called from the manager's event loop.
+
+        :param device_type: Device type to broadcast to as a str.
+        :param data: str, bytes, bytearray, memoryview, or Packet object
+        :return: A BroadcastResult with the sent/failed/skipped counts, already resolved.
+        """
+        return self.__broadcast(self.__clients.of_type(device_type), self.make_packet(data))
+
+    # sends data to a client given a uuid
+    def send(self, unique_id: str, data: packetable) -> bool:
+        """
+        Send some data to a specific Client given their UUID. Must be called from the manager's event loop.
+
+        :param unique_id: The client's UUID as a str.
+        :param data: str, bytes, bytearray, memoryview, or Packet object.
+        :return: True if the data was written to the client's transport, False if the client does not exist or its
+                 transport is full.
+        """
+
+        # look up the client with the provided uuid
+        client = self.__clients.get(unique_id)
+        if client is None:
+            return False
+
+        return client.send(self.make_packet(data))
+
+    # streams data to a client given a uuid
+    async def send_stream(self, unique_id: str, source, chunk_size: int = 65536) -> bool:
+        """
+        Stream a payload of any size to a specific Client given their UUID, see AsyncClient.send_stream().
+
+        :param unique_id: The client's UUID as a str.
+        :param source: A bytes-like object, a binary file object, or an iterable of bytes-like chunks.
+        :param chunk_size: The max size of each chunk in bytes.
+        :return: True if the whole stream was sent, False if the client does not exist or the stream failed.
+        """
+
+        # look up the client with the provided uuid
+        client = self.__clients.get(unique_id)
+        if client is None:
+            return False
+
+        return await client.send_stream(source, chunk_size)
+
+    # converts a str, bytes, bytearray, or Packet into a Packet
+    make_packet = staticmethod(Manager.make_packet)
+
+    # returns an list of dictionaries storing the connected clients' information
+    def get_client_data(self):
+        """
+        Get a list of dictionaries which represent connected client's data. (dict returned from
+        AsyncClient.return_data())
+
+        :return: A list of dictionaries representing connected clients.
+        """
+        return [client.return_data() for client in self.__clients.snapshot()]
+
+    # <> Handlers <>
+    # event manager decorator function
+    def event(self, coroutine):
+        """
+        Decorator which allows for simple overwriting of the generic on_message, on_connect, on_disconnect, and
+        on_stream functions. Handlers may be plain functions or coroutine functions.
+
+        :param coroutine: Function named on_connect, on_message, on_disconnect, or on_stream.
+        :return: bool
+        """
+
+        # handle general on_connect, on_message, on_message_batch, on_disconnect, and on_stream handlers
+        if coroutine.__name__ in ("on_connect", "on_message", "on_message_batch", "on_disconnect", "on_stream"):
+            # logging output
+            self.logger.info("(Event Handler) '" + coroutine.__name__ + "' handler was added successfully.")
+
+            # replaces the existing coroutine with the provided one
+            setattr(self, coroutine.__name__, coroutine)
+
+            # messages are handed over in batches from now on
+            if coroutine.__name__ == "on_message_batch":
+                self.__batch_messages = True
+
+            return True
+        return False
+
+    # used to add a device to the manager
+    def add_device(self, device: DeviceType):
+        """
+        Define a new device type for the Manager, its handlers may be plain methods or coroutine methods.
+
+        :param device: Any implementation of the subclass DeviceType.
+        :return: None
+        """
+
+        # ensure the device is of type DeviceType
+        if not isinstance(device, DeviceType):
+            raise ValueError("device is not of type DeviceType")
+
+        # ensure device.type is of type str
+        if not isinstance(device.type, str):
+            raise ValueError("device.type is not of type str")
+
+        # the fields to aggregate must be fields of the type's records
+        aggregate = getattr(device, "aggregate", None)
+        if aggregate:
+            if device.schema is None:
+                raise ValueError("device.aggregate needs a device.schema to decode the fields from")
+
+            for field in aggregate:
+                if field not in device.schema.names:
+                    raise ValueError("device.aggregate field '" + str(field) + "' is not a field of device.schema")
+
+                if field not in device.schema.numeric:
+                    raise ValueError("device.aggregate field '" + str(field) + "' is not a number")
+
+        # let the type's handlers add their own values to the aggregator
+        device.aggregator = self.aggregator
+
+        # add the device to the list of device types
+        self.__device_types.update({device.type: device})
+
+        # hand the type's messages over in batches if it takes them or decodes them into records
+        if getattr(device.on_message_batch, "__func__", None) is not DeviceType.on_message_batch \
+                or getattr(device, "schema", None) is not None:
+            self.__batched_types.add(device.type)
+        else:
+            self.__batched_types.discard(device.type)
+
+        # give the type an id clients can send in a binary handshake
+        type_id = self.__types.register(device.type)
+
+        # logging output
+        self.logger.debug("(Device Adder) Successfully added DeviceType '" + device.type + "' to the manager with type"
+                          + " id " + str(type_id) + ".")
+
+    # the id of a device type
+    def type_id(self, device_type: str) -> Union[int, None]:
+        """
+        Get the id of a device type added with AsyncManager.add_device(), see Manager.type_id().
+
+        :param device_type: The device type as a str.
+        :return: int or None if the device type was not added.
+        """
+        return self.__types.id_of(device_type)
+
+    # the windowed aggregates of a field of a device
+    def device_aggregate(self, unique_id: str, field: str, window: float = None,
+                         percentiles: tuple = (0.5, 0.9, 0.99)) -> Union[dict, None]:
+        """
+        Get the windowed aggregates of a record field one device sent, see Manager.device_aggregate().
+
+        :param unique_id: The UUID of the device.
+        :param field: The name of the field.
+        :param window: The length of the window in seconds ending now, None uses every bucket the Aggregator keeps.
+        :param percentiles: The percentiles to estimate as fractions (ex. 0.99).
+        :return: dict or None if the device sent no values of the field within the window.
+        """
+        return self.aggregator.query(Aggregator.device_key(unique_id, field), window, percentiles)
+
+    # the windowed aggregates of a field of every device of a type
+    def type_aggregate(self, device_type: str, field: str, window: float = None,
+                       percentiles: tuple = (0.5, 0.9, 0.99)) -> Union[dict, None]:
+        """
+        Get the windowed aggregates of a record field sent by every device of a type, see Manager.type_aggregate().
+
+        :param device_type: The device type as a str.
+        :param field: The name of the field.
+        :param window: The length of the window in seconds ending now, None uses every bucket the Aggregator keeps.
+        :param percentiles: The percentiles to estimate as fractions (ex. 0.99).
+        :return: dict or None if no device of the type sent values of the field within the window.
+        """
+        return self.aggregator.query(Aggregator.type_key(device_type, field), window, percentiles)
+
+    # on connection function - run on client connection
+    def on_connect(self, client: AsyncClient):
+        """
+        A empty implementation of the generic on_connect function, meant to be overwritten.
+
+        :param client: AsyncClient object representing the connecting client.
+        :return: None
+        """
+        return
+
+    # on message function - runs when a client sends a message to the server
+    def on_message(self, message: Message):
+        """
+        A empty implementation of the generic on_message function, meant to be overwritten. The coroutine handlers of
+        a client's messages run one after the other in the order the messages arrived.
+
+        :param message: Message object containing an AsyncClient and Packet.
+        :return: None
+        """
+        return
+
+    # on message batch function - runs with the messages a client sent in one read
+    def on_message_batch(self, batch: MessageBatch):
+        """
+        A empty implementation of the generic on_message_batch function, meant to be overwritten. Once it is
+        overwritten it runs in place of on_message with the messages of each read of a client's connection, see
+        Manager.on_message_batch().
+
+        :param batch: MessageBatch object containing an AsyncClient and the Packets it sent.
+        :return: None
+        """
+        return
+
+    # on stream function - runs when a client sends a chunk of a stream to the server
+    def on_stream(self, message: Message):
+        """
+        A empty implementation of the generic on_stream function, meant to be overwritten.
+
+        :param message: Message object containing an AsyncClient and a stream chunk Packet.
+        :return: None
+        """
+        return
+
+    # on disconnect function - runs when the client disconnects from the server
+    def on_disconnect(self, client: AsyncClient):
+        """
+        A empty implementation of the generic on_disconnect function, meant to be overwritten.
+
+        :param client: AsyncClient object representing the disconnecting client.
+        :return: None
+        """
+        return
+
+    # <> Lifecycle <>
+    # start accepting connections
+    async def start(self):
+        """
+        Start listening for clients on the running event loop.
+
+        :return: None
+        """
+
+        self.__stopped = asyncio.Event()
+
+        try:
+            self.__server = await asyncio.get_event_loop().create_server(
+                self.__make_client, self.host, self.port, ssl=self.ssl_context, backlog=self.backlogged_connections)
+
+        # in the case a socket error is raised
+        except OSError:
+            raise Exception("Unable to bind server socket to the provided host and port")
+
+        # logging output
+        self.logger.info("(Process Handler) Listening on " + str(self.host) + ":" + str(self.port) + ".")
+
+    # serve until the manager is stopped
+    async def serve_forever(self):
+        """
+        Start the manager if it has not been started and wait until AsyncManager.stop() is called.
+
+        :return: None
+        """
+
+        if self.__server is None:
+            await self.start()
+
+        await self.__stopped.wait()
+
+    # stop the manager
+    async def stop(self, timeout: float = 10):
+        """
+        Stop accepting clients, end every connection, and wait up to timeout seconds for the running handlers.
+
+        :param timeout: Max time to wait for the handlers in seconds.
+        :return: None
+        """
+
+        if self.__server is None:
+            return
+
+        self.__server.close()
+
+        # end every connection, the disconnect handlers run as the connections close
+        for client in list(self.__connections):
+            client.end()
+
+        await self.__server.wait_closed()
+
+        # wait for the connections to close and for the handlers they started
+        deadline = time.monotonic() + timeout
+
+        while self.__connections and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+        if self.__tasks:
+            await asyncio.wait(set(self.__tasks), timeout=max(0.0, deadline - time.monotonic()))
+
+        for timer in self.__heartbeat_timers.values():
+            timer.cancel()
+
+        self.__heartbeat_timers.clear()
+        self.__server = None
+        self.__stopped.set()
+
+        # logging output
+        self.logger.info("(Process Handler) Manager stopped.")
+
+    # blocking entry point
+    def run(self):
+        """
+        Run the manager on a new event loop until it is stopped.
+
+        :return: None
+        """
+        asyncio.run(self.serve_forever())
@@ -0,0 +1,147 @@
+# default lib imports
+import threading
+from concurrent.futures import Executor, Future
+
+# module imports
+from .Packet import Packet
+from .ReservedBytes import PRIORITY_CONTROL
+
+
+# aggregate result of sending a packet to many clients
+class BroadcastResult:
+    def __init__(self, total: int):
+        # lock guarding the counters
+        self.__lock = threading.Lock()
+
+        # the number of clients the broadcast targeted
+        self.total = total
+
+        # the number of clients the packet was queued for
+        self.sent = 0
+
+        # the number of clients the packet failed to send to (including clients whose outbound queue was full)
+        self.failed = 0
+
+        # the number of clients skipped because their connection was already closed
+        self.skipped = 0
+
+        # future which resolves to this result once every target has been handled
+        self.future = Future()
+
+        # resolve right away if there is nothing to send
+        if total == 0:
+            self.future.set_result(self)
+
+    # add the counts from a finished batch
+    def record(self, sent: int, failed: int, skipped: int):
+        """
+        Add the counts of a finished batch to the result, resolves the future once every target has been handled.
+
+        :param sent: Number of clients the packet was queued for.
+        :param failed: Number of clients the packet failed to send to.
+        :param skipped: Number of clients which were skipped.
+        :return: None
+        """
+
+        with self.__lock:
+            self.sent += sent
+            self.failed += failed
+            self.skipped += skipped
+
+            finished = self.sent + self.failed + self.skipped >= self.total
+
+        if finished and not self.future.done():
+            self.future.set_result(self)
+
+    # check if the broadcast is done
+    def done(self) -> bool:
+        """
+        Check if every target of the broadcast has been handled.
+
+        :return: bool
+        """
+        return self.future.done()
+
+    # block until the broadcast is done
+    def wait(self, timeout: float = None):
+        """
+        Block until every target of the broadcast has been handled.
+
+        :param timeout: Max time to wait in seconds, None will wait forever.
+        :return: The BroadcastResult. Raises concurrent.futures.TimeoutError if the timeout expires.
+        """
+        return self.future.result(timeout)
+
+    def __repr__(self):
+        return "BroadcastResult(total=" + str(self.total) + ", sent=" + str(self.sent) + ", failed=" \
+               + str(self.failed) + ", skipped=" + str(self.skipped) + ")"
+
+
+# sends one already encoded packet to many clients
+class Broadcaster:
+    def __init__(self, executor: Executor, workers: int, min_batch_size: int = 64, control_executor: Executor = None):
+        # the executor which runs the batches
+        self.__executor = executor
+
+        # the executor which runs the batches of control packets so they are not queued behind other work, None uses
+        # the executor
+        self.__control_executor = control_executor
+
+        # the number of workers the executor has, the targets are split so every worker gets a batch
+        self.workers = workers
+
+        # the smallest batch worth handing to a worker, small broadcasts run as a single batch
+        self.min_batch_size = min_batch_size
+
+    # send a packet to each client in a batch
+    @staticmethod
+    def __send_batch(clients, packet: Packet, result: BroadcastResult):
+        sent = failed = skipped = 0
+
+        for client in clients:
+            # skip connections which have already been closed
+            if client.is_closed():
+                skipped += 1
+                continue
+
+            try:
+                # queue the packet without waiting for the client to read it, so a stalled client can not hold up the
+                # rest of the batch
+                if client.post(packet):
+                    sent += 1
+                else:
+                    failed += 1
+
+            # a failing client must not stop the rest of the batch
+            except Exception:
+                failed += 1
+
+        result.record(sent, failed, skipped)
+
+    # send a packet to a group of clients
+    def broadcast(self, clients, packet: Packet) -> BroadcastResult:
+        """
+        Send one packet to every client given. The packet is shared by every target, it is not copied or re-encoded
+        per client, and the sends are split into batches sized so each executor worker gets one batch.
+
+        :param clients: A sequence of Client objects to send the packet to.
+        :param packet: A sending Packet object.
+        :return: A BroadcastResult which is filled in as the batches finish.
+        """
+
+        result = BroadcastResult(len(clients))
+
+        # nothing to send
+        if not clients:
+            return result
+
+        # split the clients evenly across the workers
+        batch_size = max(self.min_batch_size, -(-len(clients) // max(1, self.workers)))
+
+        executor = self.__control_executor \
+            if packet.priority == PRIORITY_CONTROL and self.__control_executor is not None else self.__executor
+
+        for start in range(0, len(clients), batch_size):
+            executor.submit(self.__send_batch, clients[start:start + batch_size], packet, result)
+
+        return result
@@ -1,17 +1,27 @@
 # default lib imports
+import os
+import select
 import threading
+import time
+import ssl
 import json
 import logging
-from typing import Union
+from typing import Union, Callable
 from queue import Queue
+from collections import deque
+from concurrent.futures import Executor, Future, TimeoutError as FutureTimeoutError
 from uuid import uuid4
 
 # external lib import
 from gevent import socket
 
 # module imports
-from .ReservedBytes import GET_DATA, HEARTBEAT, END_CONNECTION
+from .ReservedBytes import GET_DATA, HEARTBEAT, END_CONNECTION, PROTOCOL, TYPE_ID, BINARY_INFO, PROTOCOL_V1, \
+    PROTOCOL_V2, STREAM_CHUNK, STREAM_END, STREAM_OFFSET, PRIORITY_CONTROL, PRIORITY_BULK
 from .Packet import Packet
+from .FrameDecoder import FrameDecoder
+from .OutboundQueue import OutboundQueue, IOV_MAX
+from .Handshake import TypeTable, NAMED_TYPE, decode_info
 
 
 # Client class
@@ -25,24 +35,97 @@ class Client:
     class InvalidInfo(Exception):
         pass
 
-    def __init__(self, connection: socket, address: tuple, logging_level: int):
+    # an exception raised when a packet does not fit in the client's outbound queue and the queue's policy is "raise"
+    QueueFull = OutboundQueue.QueueFull
+
+    def __init__(self, connection: socket, address: tuple, logging_level: int, max_frame_size: int = 4194304,
+                 outbound_queue: OutboundQueue = None, flush_window: float = 0.0, flush_executor: Executor = None,
+                 write_timeout: Union[float, None] = 30, writable_notifier: Callable = None,
+                 control_executor: Executor = None, type_table: TypeTable = None):
         # client logger
         self.logger = logging.getLogger("[Client](ID: UNKNOWN | IP: " + str(address[0]) + ")")
         self.logger_level = logging_level
         self.logger.setLevel(self.logger_level)
 
-        # a lock preventing multiple threads from using the __connection at the same time
-        self.connection_lock = threading.RLock()
+        # a lock preventing multiple threads from writing to the __connection at the same time, reads never take it so
+        # a blocked read can not hold up a send
+        self.write_lock = threading.RLock()
+
+        # a lock allowing only one thread to read from the __connection at a time
+        self.read_lock = threading.RLock()
+
+        # kept for code which locks the connection to send several packets in a row
+        self.connection_lock = self.write_lock
 
-        # socket object representing the connection between the client and the server
+        # socket object representing the connection between the client and the server, it is never blocking so reads
+        # and writes can wait on it independently (see Client.__wait_for())
         self.__connection = connection
+        self.__connection.settimeout(0)
+
+        # SSL sockets can not be read and written at the same time, so each single non blocking call is locked
+        self.__ssl_lock = threading.Lock() if isinstance(connection, ssl.SSLSocket) else None
+
+        # packets waiting to be written, whoever holds the write lock writes every queued packet in as few writes as
+        # possible (each write is one scatter/gather sendmsg of up to max_batch_bytes), its watermarks and policy
+        # decide what happens to packets for a client which is not reading
+        self.__outbound = outbound_queue if outbound_queue is not None else OutboundQueue()
+
+        # the part of the batch being written which the socket has not accepted yet
+        self.__unsent = []
+
+        # the time a write may wait for the socket to accept more data before the connection is aborted
+        self.write_timeout = write_timeout
+
+        # called with the client when a flush stops because the socket's send buffer is full, it must call
+        # Client.flush() once the socket is writable again (None makes flushes wait for the socket instead)
+        self.writable_notifier = writable_notifier
+
+        # the time a flush of packets queued by Client.post() waits for more packets to queue before writing
+        self.flush_window = flush_window
+
+        # the executor which runs the flushes of packets queued by Client.post(), None will flush on the calling thread
+        self.flush_executor = flush_executor
+
+        # the executor which runs the flushes of control packets queued by Client.post(), kept apart from the flush
+        # executor so control packets are not held up when it is busy with bulk data (None uses the flush executor)
+        self.control_executor = control_executor
+
+        # true once a write to the connection has failed, the connection can not be written to after a failed write
+        # since part of a frame may have been written
+        self.__write_failed = False
 
         # IP address of the client
         self.address = address
 
-        # message buffer when irrelevant messages are received during a heartbeat
+        # true if packets can be sent with a scatter/gather sendmsg (not available for SSL sockets or on Windows)
+        self.__scatter_gather = hasattr(connection, "sendmsg") and not isinstance(connection, ssl.SSLSocket)
+
+        # true if files can be sent straight from the page cache with os.sendfile (not available for SSL sockets)
+        self.__zero_copy_files = hasattr(os, "sendfile") and not isinstance(connection, ssl.SSLSocket)
+
+        # message buffer, messages put in it are returned by recv() and recv_available() before any received message
         self.buffer = Queue()
 
+        # the protocol version used for frames, clients start on version 1 and can request version 2 when handshaking
+        self.protocol_version = PROTOCOL_V1
+
+        # incremental decoder which reads from the socket in large chunks and splits the data into frames
+        self.__decoder = FrameDecoder(max_frame_size=max_frame_size)
+
+        # the id of the next stream sent to the client
+        self.__next_stream_id = 0
+
+        # frames parsed by the decoder which have not been returned yet
+        self.__frames = deque()
+
+        # requests waiting for a reply as a deque of (match, Future) tuples, every frame read is offered to them first
+        self.__waiters = deque()
+        self.__waiters_lock = threading.Lock()
+
+        # true once another thread (the Manager's message listener) is the connection's only reader, requests then
+        # wait for that reader to hand over their replies instead of reading themselves
+        self.__reader_attached = False
+
         # instance id of client (used to differentiate between multiple connections between the same client)
         self.instance_id = str(uuid4())
 
@@ -55,6 +138,15 @@ class Client:
         # the bonus data which varies by client
         self.data = None
 
+        # the table the client's type name is interned in, shared by every client of the manager
+        self.__types = type_table if type_table is not None else TypeTable()
+
+        # true once the connection has been ended
+        self.__closed = False
+
+        # time.monotonic() timestamp of the last message received from the client, any message counts as a sign of life
+        self.last_seen = time.monotonic()
+
     # return the client's uuid
     def uuid(self):
         """
@@ -71,6 +163,44 @@ class Client:
         """
         return self.__type
 
+    # return the file descriptor of the client's socket
+    def fileno(self) -> int:
+        """
+        Return the file descriptor of the client's socket, allows the Client to be watched by a selector.
+
+        :return: int
+        """
+        return self.__connection.fileno()
+
+    # return if files can be sent to the client without copying them through python
+    def supports_sendfile(self) -> bool:
+        """
+        Return True if files are sent to the client with os.sendfile, False if they have to be sent from a buffer such
+        as an mmap of the file (SSL connections and platforms without os.sendfile).
+
+        :return: bool
+        """
+        return self.__zero_copy_files
+
+    # return if the connection has been ended
+    def is_closed(self) -> bool:
+        """
+        Return True if the connection with the client has been ended.
+
+        :return: bool
+        """
+        return self.__closed
+
+    # return the client's outbound queue
+    def outbound(self) -> OutboundQueue:
+        """
+        Return the client's outbound queue, useful to check how many bytes are waiting to be written or if the client
+        has stopped reading (OutboundQueue.is_full()).
+
+        :return: OutboundQueue
+        """
+        return self.__outbound
+
     # end the connection with the client
     def end(self, raise_exception: bool = False):
         """
@@ -86,12 +216,22 @@ class Client:
         self.logger.warning("(end) Ending connection.")
 
         try:
-            # tell the client the connection is ending
-            self.send(Packet(END_CONNECTION))
+            # tell the client the connection is ending, a client which is not reading is not waited on
+            self.send(Packet(END_CONNECTION, priority=PRIORITY_CONTROL), 0)
+
+        # the client's outbound queue is full
+        except self.QueueFull:
+            pass
 
         finally:
-            # shutdown the socket connection
-            self.__connection.shutdown(socket.SHUT_RDWR)
+            # mark the connection as closed
+            self.__closed = True
+
+            # shutdown the socket connection, it may already have been shut down by abort()
+            try:
+                self.__connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
 
             # close the socket connection
             self.__connection.close()
@@ -100,83 +240,479 @@ class Client:
                 # raise a connection end error
                 raise self.ConnectionEnd
 
+    # abort the connection without the end handshake
+    def abort(self, reason: str = "Connection aborted."):
+        """
+        Abort the connection with a client which can no longer be written to. Queued packets are dropped and the socket
+        is shut down, so the reader of the connection (the Manager's message listener) sees the connection end and
+        removes the client.
+
+        :param reason: The reason logged for the abort.
+
+        :return: None
+        """
+
+        # stop every write, a write in progress fails once the socket is shut down
+        self.__write_failed = True
+        dropped = self.__outbound.clear()
+
+        # logging output
+        self.logger.warning("(abort) " + reason + " Dropped '" + str(dropped) + "' queued packets.")
+
+        try:
+            self.__connection.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
     # send data to the client
-    def send(self, packet: Packet) -> bool:
+    def send(self, packet: Packet, timeout: Union[float, None] = -1) -> bool:
         """
-        Attempt to send a packet to the client.
+        Attempt to send a packet to the client, waits for the packet to be written.
 
         :param packet: Packet object containing the data to send to the client, should be a Packet in sending mode.
+        :param timeout: The time allowed for the socket to accept the packet, defaults to write_timeout. None will wait
+                        forever and 0 will not wait at all.
 
-        :return: True if the packet was send, false if the packet could not be sent.
+        :return: True if the packet was send, false if the packet could not be sent. Raises Client.QueueFull if the
+                 outbound queue is full and its policy is "raise".
         """
 
         self.logger.debug("(send) Attempting to send a Packet.")
 
+        # build the packet's buffers
+        buffers = self.__frame_buffers(packet, "send")
+        if buffers is None:
+            return False
+
+        # queue the packet behind any queued packets and write the queue, if another thread is already writing the
+        # packet may be written by it along with the packets queued around it
+        if self.__enqueue(buffers, packet.priority, "send") is None:
+            return False
+
+        # a control packet only waits for the control lane, so it is never written behind queued application data
+        max_priority = PRIORITY_CONTROL if packet.priority == PRIORITY_CONTROL else PRIORITY_BULK
+
+        with self.write_lock:
+            sent = self.__drain(True, self.write_timeout if timeout == -1 else timeout, max_priority)
+
+        if sent:
+            self.logger.debug("(send) Packet sent successfully.")
+            return True
+
+        self.logger.debug("(send) Packet was unable to be sent.")
+        return False
+
+    # queue data to be sent to the client
+    def post(self, packet: Packet) -> bool:
+        """
+        Queue a packet to be sent to the client without waiting for it to be written. The first packet queued starts a
+        flush on the flush executor which waits flush_window seconds and then writes every queued packet, so a burst of
+        packets is written with a few large writes by one flush.
+
+        :param packet: Packet object containing the data to send to the client, should be a Packet in sending mode.
+
+        :return: True if the packet was queued, False if it can not be sent or was dropped because the outbound queue
+                 is full. Raises Client.QueueFull if the outbound queue is full and its policy is "raise".
+        """
+
+        # build the packet's buffers
+        buffers = self.__frame_buffers(packet, "post")
+        if buffers is None:
+            return False
+
+        schedule = self.__enqueue(buffers, packet.priority, "post")
+        if schedule is None:
+            return False
+
+        # only the packet which finds no flush pending starts one
+        if schedule:
+            # control packets get a flush of just the control lane which does not wait for the flush window
+            if packet.priority == PRIORITY_CONTROL:
+                executor = self.control_executor if self.control_executor is not None else self.flush_executor
+                arguments = (0, PRIORITY_CONTROL)
+            else:
+                executor = self.flush_executor
+                arguments = (self.flush_window,)
+
+            if executor is not None:
+                executor.submit(self.flush, *arguments)
+            else:
+                self.flush(*arguments)
+
+        return True
+
+    # write every queued packet
+    def flush(self, window: float = 0, max_priority: int = PRIORITY_BULK) -> bool:
+        """
+        Write every queued packet to the client, highest priority first and in the order they were queued within a
+        priority. With a writable_notifier the flush never waits for the socket, it stops once the socket's send buffer
+        is full and is continued by the notifier.
+
+        :param window: Time in seconds to wait for more packets to queue before writing.
+        :param max_priority: The lowest priority to write, PRIORITY_CONTROL only writes control packets.
+
+        :return: True if the queue was written (or is waiting for the socket), False if the connection can not be
+                 written to.
+        """
+
+        # give a burst of packets time to queue, unless there is already a full batch waiting
+        if window > 0 and self.__outbound.pending_bytes() < self.__outbound.max_batch_bytes:
+            time.sleep(window)
+
+        with self.write_lock:
+            return self.__drain(self.writable_notifier is None, self.write_timeout, max_priority)
+
+    # write every queued packet, waiting for the socket
+    def drain(self, timeout: Union[float, None] = -1) -> bool:
+        """
+        Write every queued packet to the client, waiting for the socket to take them even if the client has a
+        writable_notifier. Used to finish the queued sends before the connection is ended.
+
+        :param timeout: The time allowed for the socket to accept the packets, defaults to write_timeout. None will wait
+                        forever.
+
+        :return: True if the queue was written, False if the connection can not be written to.
+        """
+
+        with self.write_lock:
+            return self.__drain(True, self.write_timeout if timeout == -1 else timeout, PRIORITY_BULK)
+
+    # add a packet's buffers to the outbound queue
+    def __enqueue(self, buffers: list, priority: int, caller: str) -> Union[bool, None]:
+        """
+        Add a packet's buffers to the outbound queue, applying the queue's policy if they do not fit.
+
+        :param buffers: The packet's buffers.
+        :param priority: The packet's priority class.
+        :param caller: The name of the calling method, used for logging.
+
+        :return: True if a flush should be scheduled, False if one is already pending, None if the packet was dropped.
+        """
+
+        # nothing can be written after a failed write
+        if self.__write_failed:
+            return None
+
+        try:
+            return self.__outbound.put(buffers, priority)
+
+        # the client is not reading fast enough
+        except OutboundQueue.QueueFull as error:
+            policy = self.__outbound.policy
+
+            if policy == OutboundQueue.RAISE:
+                raise
+
+            if policy == OutboundQueue.DISCONNECT:
+                self.abort("(" + caller + ") " + str(error))
+            else:
+                self.logger.debug("(" + caller + ") Dropping packet. " + str(error))
+
+            return None
+
+    # write the queued packets in batches, must be called with the write lock held
+    def __drain(self, blocking: bool, timeout: Union[float, None], max_priority: int) -> bool:
+        """
+        Write the queued packets in batches, highest priority first. A batch which was partly written is always finished
+        first so frames are never interleaved.
+
+        :param blocking: If the socket is waited on when its send buffer is full, otherwise the writable_notifier is
+                         called and the rest is written by a later flush.
+        :param timeout: The time allowed for the socket to accept more data when blocking.
+        :param max_priority: The lowest priority to write.
+
+        :return: True if the queue was written (or is waiting for the socket), False if the connection can not be
+                 written to.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            # a failed write leaves the connection part way through a frame
+            if self.__write_failed:
+                self.__unsent = []
+                self.__outbound.clear()
+                return False
+
+            # start the next batch
+            if not self.__unsent:
+                batch = self.__outbound.take(max_priority)
+
+                # everything has been written
+                if not batch:
+                    return True
+
+                self.__unsent = self.__views(batch)
+
+            try:
+                self.__unsent = self.__write_some(self.__unsent)
+
+                # the socket's send buffer is full
+                if self.__unsent:
+                    if not blocking:
+                        self.writable_notifier(self)
+                        return True
+
+                    self.__wait_writable(self.__remaining(deadline))
+
+            # in case of a socket error (or a timeout) the connection is aborted
+            except socket.error as error:
+                self.abort("(send) Write failed. Error: " + str(error))
+
+    # the buffers to send a packet with
+    def __frame_buffers(self, packet: Packet, caller: str) -> Union[list, None]:
         # check if the packet object is a Packet in sending mode
         if not packet.is_sending():
-            self.logger.warning("(send) Unable to send Packet, Packet object must be a sending Packet.")
-            return False
+            self.logger.warning("(" + caller + ") Unable to send Packet, Packet object must be a sending Packet.")
+            return None
 
-        # init the lock
-        with self.connection_lock:
+        # build the buffers for the client's protocol version
+        try:
+            return packet.buffers(self.protocol_version)
+
+        # the packet is too large or has flags the client's protocol version can not carry
+        except (OverflowError, ValueError) as error:
+            self.logger.warning("(" + caller + ") Unable to send Packet using protocol version "
+                                + str(self.protocol_version) + ". Error: " + str(error))
+            return None
+
+    # byte views of a list of buffers ready to be written
+    def __views(self, buffers: list) -> list:
+        views = [memoryview(buffer).cast('B') for buffer in buffers]
+
+        # without scatter/gather each buffer is a separate write, small buffers are joined so they are not sent as
+        # separate records
+        if not self.__scatter_gather and len(views) > 1 and sum(view.nbytes for view in views) <= 16384:
+            views = [memoryview(b''.join(views))]
+
+        return views
+
+    # write as much as the socket accepts without waiting
+    def __write_some(self, views: list) -> list:
+        """
+        Write a list of byte views to the client until they are all written or the socket's send buffer is full. Uses a
+        scatter/gather sendmsg so the buffers are never joined, falls back to one send per buffer for sockets which do
+        not support sendmsg.
+
+        :param views: A list of byte memoryviews, changed in place.
+
+        :return: The views which were not written (the first may be partly written), empty if everything was written.
+        """
+
+        while views:
             try:
-                # send the string to to the client
-                self.__connection.sendall(packet.bytes)
+                if self.__scatter_gather:
+                    sent = self.__connection.sendmsg(views[:IOV_MAX])
+                else:
+                    sent = self.__call(self.__connection.send, views[0])
 
-                self.logger.debug("(send) Packet sent successfully.")
+            # the socket's send buffer is full
+            except (BlockingIOError, ssl.SSLWantWriteError, ssl.SSLWantReadError):
+                return views
 
-                return True
+            # drop the buffers which were fully sent
+            while views and sent >= views[0].nbytes:
+                sent -= views.pop(0).nbytes
 
-            # in case of a socket error return None
-            except socket.error:
-                self.logger.debug("(send) Packet was unable to be sent.")
-                return False
+            # skip the part of the next buffer which was sent
+            if sent:
+                views[0] = views[0][sent:]
 
-    # recv using the protocol of [2B - Message Size][Message] -> ignore rest of buffer
-    def __smart_recv(self, timeout: int) -> Union[bytes, None]:
+        return views
+
+    # send a list of buffers as one contiguous stream of bytes
+    def __send_buffers(self, buffers: list, timeout: float = None):
         """
-        'Smartly' check the client socket's buffer.
-        Read the first two bytes of the buffer (message header), this will give the size of the message.
-        Read the # of bytes the message header specified and return those bytes.
+        Send a list of buffers to the client in order, waiting for the socket whenever its send buffer is full. Must be
+        called with the write lock held.
 
-        :param timeout: The time allowed for a response before the server assumes the client is dead and
-                        ends the connection via the end() function.
+        :param buffers: A list of bytes-like objects.
+        :param timeout: The time allowed for the socket to accept more data, None will wait forever.
 
-        :return: Either None or a bytes object.
+        :return: None
         """
 
-        # init the lock
-        with self.connection_lock:
-            # if a timeout is specified then set the timeout
-            if timeout is not None:
-                self.__connection.settimeout(timeout)
+        views = self.__views(buffers)
 
-            # read the first two bytes to get the size of the message
-            message_size_bytes = self.__connection.recv(2)
+        while True:
+            views = self.__write_some(views)
 
-            # if the buffer is empty return none
-            if message_size_bytes is None:
-                return None
+            if not views:
+                return
 
-            # if it has a value convert it into an integer
-            message_size = int.from_bytes(message_size_bytes, 'big', signed=False)
+            self.__wait_writable(timeout)
 
-            # log message header info
-            self.logger.debug("(recv) Read message size header as: " + str(message_size_bytes) + " or int(" +
-                              str(message_size) + ")")
+    # run a single non blocking call on the socket
+    def __call(self, function, *args):
+        # SSL sockets can not be used by two threads at the same time
+        if self.__ssl_lock is None:
+            return function(*args)
 
-            # recv up to the number of bytes we should recv
-            message = self.__connection.recv(message_size)
+        with self.__ssl_lock:
+            return function(*args)
 
-            # log message body
-            self.logger.debug("(recv) Read message body as: " + str(message))
+    # wait for the socket to be readable or writable
+    def __wait_for(self, writable: bool, timeout: Union[float, None]):
+        """
+        Wait for the socket to have data to read or room to write. Only the calling thread waits, no lock is held so
+        reads and writes wait independently of each other.
+
+        :param writable: True to wait for room to write, False to wait for data to read.
+        :param timeout: Max time to wait in seconds, None will wait forever.
 
-            # check if the message len in bytes matches the length given, if it did not give a warning
-            if message_size != len(message):
-                # warn if the message length doesn't match the length given by the header
-                self.logger.warning("(recv) Message length did not match the length specified in the message header.")
+        :return: None. Raises socket.timeout if the timeout expires.
+        """
 
-            return message
+        # data already decrypted by an SSL socket will not wake a poll
+        if not writable and self.__ssl_lock is not None and self.__connection.pending():
+            return
+
+        if hasattr(select, "poll"):
+            poller = select.poll()
+            poller.register(self.__connection.fileno(), select.POLLOUT if writable else select.POLLIN)
+            ready = poller.poll(None if timeout is None else max(0, int(timeout * 1000)))
+        elif writable:
+            _, ready, _ = select.select([], [self.__connection], [], timeout)
+        else:
+            ready, _, _ = select.select([self.__connection], [], [], timeout)
+
+        if not ready:
+            raise socket.timeout("Timed out waiting to " + ("send to" if writable else "receive from") + " the client.")
+
+    # wait for the socket to have room to write
+    def __wait_writable(self, timeout: Union[float, None]):
+        self.__wait_for(True, timeout)
+
+    # wait for the socket to have data to read
+    def __wait_readable(self, timeout: Union[float, None]):
+        self.__wait_for(False, timeout)
+
+    # the time left until a deadline
+    @staticmethod
+    def __remaining(deadline: Union[float, None]) -> Union[float, None]:
+        if deadline is None:
+            return None
+
+        remaining = deadline - time.monotonic()
+
+        if remaining <= 0:
+            raise socket.timeout("Timed out waiting to receive from the client.")
+
+        return remaining
+
+    # read from the socket once and parse every complete frame which has arrived
+    def __read_frames(self, timeout: Union[float, None]) -> list:
+        """
+        Read one chunk from the client's socket into the frame decoder and return every complete frame it contains.
+        A partial frame at the end of the chunk is kept and completed by a later read. Must be called with the read
+        lock held.
+
+        :param timeout: The time allowed for data to arrive, None will block until data arrives and 0 will not block.
+
+        :return: A list of receiving Packet objects, empty if no complete frame has arrived yet. Raises socket.timeout
+                 if no data arrived in time.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        try:
+            while True:
+                try:
+                    read = self.__call(self.__decoder.read_from, self.__connection)
+                    break
+
+                # nothing to read yet
+                except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                    if timeout == 0:
+                        return []
+
+                    self.__wait_readable(None if deadline is None else deadline - time.monotonic())
+
+            # an empty read means the client has closed its end of the connection
+            if read == 0:
+                raise self.ConnectionEnd
+
+            frames = self.__decoder.frames()
+
+        # the stream can not be trusted after an oversized frame so the connection is treated as ended
+        except FrameDecoder.FrameTooLarge as error:
+            self.logger.error("(recv) " + str(error) + " Ending connection.")
+            raise self.ConnectionEnd
+
+        # record that the client is alive
+        if frames:
+            self.last_seen = time.monotonic()
+
+        # log the frames read
+        self.logger.debug("(recv) Read '" + str(len(frames)) + "' frames, '" + str(self.__decoder.pending())
+                          + "' bytes of a partial frame are waiting for the rest of the frame.")
+
+        # hand any replies to the requests waiting for them
+        return self.__match_replies(frames)
+
+    # hand frames which are replies to the requests waiting for them
+    def __match_replies(self, frames: list) -> list:
+        """
+        Offer each frame to the requests waiting for a reply, in the order the requests were made.
+
+        :param frames: A list of receiving Packet objects.
+
+        :return: The frames which were not a reply to any request.
+        """
+
+        # nothing is waiting, skip taking the lock
+        if not self.__waiters:
+            return frames
+
+        unmatched = []
+
+        with self.__waiters_lock:
+            for frame in frames:
+                for waiter in self.__waiters:
+                    match, future = waiter
+
+                    try:
+                        matched = match(frame)
+                    except Exception:
+                        matched = False
+
+                    if matched:
+                        self.__waiters.remove(waiter)
+                        future.set_result(frame)
+                        break
+                else:
+                    unmatched.append(frame)
+
+        return unmatched
+
+    # recv using the protocol of [2B - Message Size][Message] (or the version 2 frame format)
+    def __smart_recv(self, timeout: Union[float, None]) -> Union[Packet, None]:
+        """
+        'Smartly' check the client socket's buffer.
+        Return the next frame which has already been read, otherwise read from the socket until a complete frame
+        arrives. Frames are read in large chunks so one read can complete several frames.
+
+        :param timeout: The time allowed for a response before the server assumes the client is dead and
+                        ends the connection via the end() function.
+
+        :return: Either None or a receiving Packet object.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        # init the lock
+        with self.read_lock:
+            while True:
+                # return a frame parsed by an earlier read
+                if self.__frames:
+                    return self.__frames.popleft()
+
+                # only read once when not blocking, a partial frame is kept for the next call
+                if timeout == 0:
+                    self.__frames.extend(self.__read_frames(0))
+                    return self.__frames.popleft() if self.__frames else None
+
+                self.__frames.extend(self.__read_frames(self.__remaining(deadline)))
 
     # receives data from a client (optional timeout)
     def recv(self, timeout: int = 15) -> Union[Packet, None]:
@@ -187,7 +723,7 @@ class Client:
         :param timeout: The time allowed for a response before the server assumes the client is dead and
                         ends the connection via the end() function.
 
-        :return: None or a receiving Packet object.
+        :return: None or a receiving Packet object. Raises Client.ConnectionEnd if the client closed the connection.
         """
 
         # if there is a buffered message
@@ -210,15 +746,124 @@ class Client:
         except socket.error:
             return None
 
-        finally:
-            # if response is non return None
-            if response is None:
+        # if response is non return None
+        if response is None:
+            return None
+
+        self.logger.debug("(recv) Returning received packet.")
+
+        # return the packet
+        return response
+
+    # receives every message which is available without blocking
+    def recv_available(self) -> list:
+        """
+        Receives every message which is available without blocking. Messages buffered by earlier calls are returned
+        first, otherwise the client's socket is read once and every complete frame in that read is returned. Meant to
+        be called once the client's socket is known to be readable. Replies to requests made with Client.request() are
+        handed to the request and not returned.
+
+        :return: A list of receiving Packet objects, may be empty. Raises Client.ConnectionEnd if the client closed the
+                 connection.
+        """
+
+        packets = []
+
+        # messages put in the buffer
+        while self.buffer.qsize() > 0:
+            packets.append(self.buffer.get())
+
+        # init the lock
+        with self.read_lock:
+            # frames parsed by an earlier read
+            frames = list(self.__frames)
+            self.__frames.clear()
+
+            # only read from the socket if nothing was buffered, a readable socket will be reported again
+            if not packets and not frames:
+                try:
+                    frames = self.__read_frames(0)
+
+                # nothing to read after all
+                except socket.error:
+                    return packets
+
+        packets.extend(frames)
+
+        return packets
+
+    # mark the connection as read by another thread
+    def attach_reader(self):
+        """
+        Mark the connection as being read by another thread, such as the Manager's message listener, which passes
+        everything it receives through Client.recv_available(). Requests made after this wait for that reader to hand
+        over their replies instead of reading the socket themselves, so the connection only ever has one reader.
+
+        :return: None
+        """
+        self.__reader_attached = True
+
+    # send a packet and wait for the reply to it
+    def request(self, packet: Packet, match: Callable[[Packet], bool], timeout: Union[float, None] = 15) \
+            -> Union[Packet, None]:
+        """
+        Send a packet and wait for the reply matching it. Only the read side of the connection is waited on, so other
+        threads can keep sending to the client while the request is in flight. Messages received while waiting which
+        do not match are kept for Client.recv() and Client.recv_available().
+
+        :param packet: Packet object to send, should be a Packet in sending mode.
+        :param match: A callable which is given each received Packet and returns True for the reply.
+        :param timeout: The time allowed for the reply, None will wait forever.
+
+        :return: The reply Packet, or None if the packet could not be sent or no reply arrived in time. Raises
+                 Client.ConnectionEnd if the client closed the connection while waiting.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        reply = Future()
+
+        # register before sending so a fast reply can not be missed
+        with self.__waiters_lock:
+            self.__waiters.append((match, reply))
+
+        try:
+            if not self.send(packet):
                 return None
 
-            self.logger.debug("(recv) Returning received packet.")
+            # the attached reader hands the reply over
+            if self.__reader_attached:
+                try:
+                    return reply.result(timeout)
+                except FutureTimeoutError:
+                    return None
+
+            # otherwise read until the reply arrives, keeping everything else
+            with self.read_lock:
+                # the reply may already have been parsed by an earlier read
+                frames = list(self.__frames)
+                self.__frames.clear()
+                self.__frames.extend(self.__match_replies(frames))
+
+                while not reply.done():
+                    self.__frames.extend(self.__read_frames(self.__remaining(deadline)))
 
-            # return data as a packet object
-            return Packet(response, sending=False)
+            return reply.result()
+
+        # no reply in time
+        except socket.timeout:
+            return None
+
+        # in case of another socket error
+        except socket.error:
+            return None
+
+        finally:
+            # drop the request if it was never answered
+            with self.__waiters_lock:
+                try:
+                    self.__waiters.remove((match, reply))
+                except ValueError:
+                    pass
 
     # gets the client's info (returns None if successful)
     def get_data(self, timeout: int = 15):
@@ -238,76 +883,116 @@ class Client:
         # logging output
         self.logger.info("(getinfo) Sending getinfo request.")
 
-        # init the lock
-        with self.connection_lock:
+        # ask the client for their data and await the response containing their info, only the read side of the
+        # connection waits so sends to the client are not held up
+        packet = self.request(Packet(GET_DATA, priority=PRIORITY_CONTROL), lambda reply: not reply.is_stream(), timeout)
+
+        # if the request failed because of an error or a timeout end the connection
+        if packet is None:
+            self.end(True)
+
+        # clients may reply with the compact binary form instead of the text form
+        if packet.payload[0:1] == BINARY_INFO:
+            self.__get_binary_data(packet)
+            return None
+
+        # output the response
+        self.logger.debug("(getinfo) Got data from client: '" + packet.bytes.decode() + "'.")
+
+        # split the response using "##" as the delimiter
+        response = packet.bytes.decode().split("##")
+
+        # if the response is not 3 pieces of data raise an error
+        if len(response) != 3:
             # logging output
-            self.logger.debug("(getinfo) Sending getinfo packet.")
+            self.logger.error("(getinfo) Response invalid formatting, must be 3 values separated by delimiter '##'"
+                              + ". Formatted like: 'UUID##DEVICE_TYPE##JSON'.")
 
-            # ask the client for their data if the send fails then end the connection
-            if not self.send(Packet(GET_DATA)):
-                self.end(True)
+            raise self.InvalidInfo
+
+        # get the clients UUID
+        client_uuid = response[0]
+
+        # update the client's logger info
+        self.logger = logging.getLogger("[Client](ID: " + client_uuid + ")")
+        self.logger.setLevel(self.logger_level)
 
+        # check if the UUID is 36 char long to only allow proper UUIDs
+        if len(client_uuid) != 36:
             # logging output
-            self.logger.debug("(getinfo) Receiving getinfo response")
+            self.logger.error("(getinfo) UUID invalid length, should be 36 characters. Data received: "
+                              + str(response) + ".")
 
-            # await client response containing their info
-            packet = self.recv(timeout=timeout)
+            raise self.InvalidInfo
 
-            # if the response returned None because of an error end the connection
-            if packet is None:
-                self.end(True)
+        # get the client's type, shared with every other client of the type
+        client_type = self.__types.intern(response[1])
 
-            # output the response
-            self.logger.debug("(getinfo) Got data from client: '" + packet.bytes.decode() + "'.")
+        # convert the data from a JSON string to a python dict
+        try:
+            # get the clients JSON data and convert it to a dict
+            client_data = json.loads(response[2])
+        except json.JSONDecodeError:
+            # logging output
+            self.logger.error("(getinfo) Failed to parse JSON.")
 
-            # split the response using "##" as the delimiter
-            response = packet.bytes.decode().split("##")
+            # in case the JSON data provided is formatted incorrectly
+            raise self.InvalidInfo
 
-            # if the response is not 3 pieces of data raise an error
-            if len(response) != 3:
-                # logging output
-                self.logger.error("(getinfo) Response invalid formatting, must be 3 values separated by delimiter '##'"
-                                  + ". Formatted like: 'UUID##DEVICE_TYPE##JSON'.")
+        # store the retrieved data
+        self.__uuid = client_uuid
+        self.__type = client_type
+        self.data = client_data
 
-                raise self.InvalidInfo
+        # switch to version 2 frames if the client asked for them
+        if isinstance(client_data, dict) and client_data.get("protocol_version") == PROTOCOL_V2:
+            self.__negotiate_protocol(PROTOCOL_V2)
 
-            # get the clients UUID
-            client_uuid = response[0]
+        return None
 
-            # update the client's logger info
-            self.logger = logging.getLogger("[Client](ID: " + client_uuid + ")")
-            self.logger.setLevel(self.logger_level)
+    # get the client's info from a binary info reply, see Handshake.py for the format
+    def __get_binary_data(self, packet: Packet):
+        try:
+            client_uuid, client_type, sent_type_id, client_data = decode_info(packet.payload, self.__types)
+        except ValueError as error:
+            # logging output
+            self.logger.error("(getinfo) Invalid binary info. " + str(error))
 
-            # check if the UUID is 36 char long to only allow proper UUIDs
-            if len(client_uuid) != 36:
-                # logging output
-                self.logger.error("(getinfo) UUID invalid length, should be 36 characters. Data received: "
-                                  + str(response) + ".")
+            raise self.InvalidInfo
 
-                raise self.InvalidInfo
+        # update the client's logger info
+        self.logger = logging.getLogger("[Client](ID: " + client_uuid + ")")
+        self.logger.setLevel(self.logger_level)
 
-            # get the client's type
-            client_type = response[1]
+        # store the retrieved data
+        self.__uuid = client_uuid
+        self.__type = client_type
+        self.data = client_data
 
-            # convert the data from a JSON string to a python dict
-            try:
-                # get the clients JSON data and convert it to a dict
-                client_data = json.loads(response[2])
-            except json.JSONDecodeError:
-                # logging output
-                self.logger.error("(getinfo) Failed to parse JSON.")
-
-                # in case the JSON data provided is formatted incorrectly
-                raise self.InvalidInfo
-
-            # store the retrieved data
-            self.__uuid = client_uuid
-            self.__type = client_type
-            self.data = client_data
-            return None
+        # a client which named a registered type is told its id so it can send the id when it reconnects
+        type_id = self.__types.id_of(client_type)
+        if sent_type_id == NAMED_TYPE and type_id is not None:
+            if not self.send(Packet(TYPE_ID, type_id.to_bytes(2, 'big'), priority=PRIORITY_CONTROL)):
+                self.end(True)
+
+        # switch to version 2 frames if the client asked for them
+        if client_data.get("protocol_version") == PROTOCOL_V2:
+            self.__negotiate_protocol(PROTOCOL_V2)
+
+    # confirm a protocol version requested by the client and start using it
+    def __negotiate_protocol(self, version: int):
+        # the confirmation is sent using the current version, everything after it uses the new version
+        if not self.send(Packet(PROTOCOL, bytes((version,)), priority=PRIORITY_CONTROL)):
+            self.end(True)
+
+        self.protocol_version = version
+        self.__decoder.version = version
+
+        # logging output
+        self.logger.info("(getinfo) Client is using protocol version " + str(version) + ".")
 
     # check the heartbeat of the client returns None if client has a heartbeat
-    def heartbeat(self, heartbeat_timeout: int) -> bool:
+    def heartbeat(self, heartbeat_timeout: int, quiet_threshold: float = None) -> bool:
         """
         Checks the if the client socket is still alive by sending it a heartbeat packet, then waits for a response.
         If no response is received then the client is assumed to be dead and the socket is closed and the manager
@@ -316,57 +1001,213 @@ class Client:
 
         :param heartbeat_timeout: The time allowed for a response before the server assumes the client is dead and
                                   ends the connection via the end() function.
+        :param quiet_threshold: If given, a client which sent a message within the last quiet_threshold seconds is
+                                considered alive without sending it a heartbeat packet.
 
         :return: True if the connection is alive and False if the connection is now dead.
         """
 
+        # any recent message counts as a heartbeat
+        if quiet_threshold is not None and time.monotonic() - self.last_seen < quiet_threshold:
+            self.logger.debug("(heartbeat) Client was recently active, skipping heartbeat request.")
+            return True
+
         # logging output
         self.logger.info("(heartbeat) Sending heartbeat request.")
 
-        # init the lock
-        with self.connection_lock:
-            # logging output
-            self.logger.debug("(heartbeat) Sending heartbeat packet.")
+        # logging output
+        self.logger.debug("(heartbeat) Sending heartbeat packet.")
 
-            # send the heartbeat command if it fails end the connection
-            if not self.send(Packet(HEARTBEAT)):
-                self.end(True)
+        # send the heartbeat command and await a "beat" response, any other message received in the meantime is kept
+        # for the message listener and sends to the client are not held up
+        response = self.request(Packet(HEARTBEAT, priority=PRIORITY_CONTROL),
+                                lambda reply: reply.bytes == HEARTBEAT, heartbeat_timeout)
 
+        if response is not None:
             # logging output
-            self.logger.debug("(heartbeat) Receiving heartbeat response.")
+            self.logger.info("(heartbeat) Passed heartbeat check.")
 
-            response = b''
-            # loop until heartbeat or None is returned from recv
-            while response is not None:
-                # await a "beat" response or await timeout error
-                response = self.recv(timeout=heartbeat_timeout)
+            # return the alive response
+            return True
 
-                # if response is non exit the loop
-                if response is None:
-                    continue
+        # if the request fails then end the client connection and log a warning
+        self.logger.warning("(heartbeat) Failed heartbeat check.")
+        self.end(True)
+        return False
 
-                # log the bytes
-                self.logger.debug("(heartbeat) Heartbeat response: " + str(response.bytes))
+    # send a large payload as a stream of chunk frames
+    def send_stream(self, source, chunk_size: int = 65536) -> bool:
+        """
+        Send a payload of any size as a stream of frames, each carrying one chunk of the payload. Only one chunk is
+        held in memory at a time and the connection is released between chunks so other packets are not held up
+        behind the stream. Requires the client to be using protocol version 2.
 
-                # if the client's response is not beat then return a incorrect response
-                if response.bytes == HEARTBEAT:
-                    # logging output
-                    self.logger.info("(heartbeat) Passed heartbeat check.")
+        Each frame's payload is the 4 byte stream id followed by the chunk, the last frame is flagged as the end of the
+        stream and may carry an empty chunk.
 
-                    # return the alive response
-                    return True
-                else:
-                    self.logger.debug("(heartbeat) Response was not a heartbeat, adding response to buffer and " +
-                                      "waiting again for heartbeat")
+        :param source: A bytes-like object, a binary file object, or an iterable of bytes-like chunks.
+        :param chunk_size: The max size of each chunk in bytes.
+
+        :return: True if the whole stream was sent, False if it could not be sent.
+        """
 
-                    # put the received message into the message buffer
-                    self.buffer.put(response)
+        # streams need the frame flags of version 2
+        if self.protocol_version < PROTOCOL_V2:
+            self.logger.warning("(send_stream) Unable to send a stream, the client is using protocol version "
+                                + str(self.protocol_version) + ".")
+            return False
 
-            # if the recv fails then end the client connection and log a warning
-            self.logger.warning("(heartbeat) Failed heartbeat check.")
-            self.end(True)
+        # give the stream an id
+        stream_id = self.__new_stream_id()
+
+        # logging output
+        self.logger.debug("(send_stream) Sending stream " + str(int.from_bytes(stream_id, 'big')) + ".")
+
+        # send every chunk, each one is sent as soon as it has been read
+        for chunk in self.stream_chunks(source, chunk_size):
+            if not self.send(Packet(stream_id, chunk, flags=STREAM_CHUNK, priority=PRIORITY_BULK)):
+                return False
+
+        # mark the end of the stream
+        return self.send(Packet(stream_id, flags=STREAM_END, priority=PRIORITY_BULK))
+
+    # send part of a file without reading it into python
+    def send_file(self, file_descriptor: int, offset: int, count: int, chunk_size: int = 65536, mapping=None,
+                  progress=None, timeout: float = 30) -> bool:
+        """
+        Send part of a file to the client. The file is sent straight from the page cache with os.sendfile, or as
+        slices of a shared mmap of the file for connections which can not use os.sendfile, so the file is never
+        copied into python. Explicit offsets are used so one file descriptor can be shared by many transfers.
+
+        Clients using protocol version 2 receive the file as a stream (see Client.send_stream()), when the offset is
+        not 0 the first chunk is flagged STREAM_OFFSET and carries the offset as 8 bytes after the stream id (see
+        Packet.stream_offset) so the client can tell a resumed tail from a new file. Clients using protocol version 1
+        receive it as plain messages of at most 65535 bytes which carry no offset, so they can not resume a transfer.
+
+        :param file_descriptor: A file descriptor of the file opened for reading.
+        :param offset: The offset in the file to start sending from, used to resume a transfer.
+        :param count: The number of bytes to send.
+        :param chunk_size: The max size of each frame's chunk of the file in bytes.
+        :param mapping: An mmap of the whole file, required if Client.supports_sendfile() is False.
+        :param progress: Optional callable called with the offset reached after each chunk is sent.
+        :param timeout: The time allowed for the socket to accept more data before the transfer fails.
+
+        :return: True if the whole part of the file was sent, False if it could not be sent.
+        """
+
+        # files can only be sent from a buffer if os.sendfile can not be used
+        if not self.__zero_copy_files and mapping is None:
+            raise ValueError("An mmap of the file is required to send files over this connection.")
+
+        # version 2 clients get a stream, version 1 clients get plain messages which fit the 16 bit size header
+        if self.protocol_version >= PROTOCOL_V2:
+            prefix = self.__new_stream_id()
+            flags = STREAM_CHUNK
+        else:
+            prefix = b''
+            flags = 0
+            chunk_size = min(chunk_size, 0xFFFF)
+
+        # the first chunk of a resumed stream says where in the file it starts
+        first_prefix, first_flags = prefix, flags
+        if prefix and offset:
+            first_prefix, first_flags = prefix + offset.to_bytes(8, 'big'), flags | STREAM_OFFSET
+
+        # logging output
+        self.logger.debug("(send_file) Sending " + str(count) + " bytes of a file from offset " + str(offset) + ".")
+
+        end = offset + count
+
+        try:
+            while offset < end:
+                size = min(chunk_size, end - offset)
+                header = Packet.frame_header(len(first_prefix) + size, self.protocol_version, first_flags)
+
+                # the connection is released between chunks so other packets are not held up behind the file, packets
+                # queued before the chunk are written first
+                with self.write_lock:
+                    if not self.__drain(True, timeout, PRIORITY_BULK):
+                        return False
+
+                    if mapping is not None and not self.__zero_copy_files:
+                        self.__send_buffers([header, first_prefix, memoryview(mapping)[offset:offset + size]], timeout)
+                    else:
+                        self.__send_buffers([header, first_prefix], timeout)
+                        self.__sendfile(file_descriptor, offset, size, timeout)
+
+                offset += size
+                first_prefix, first_flags = prefix, flags
+
+                if progress is not None:
+                    progress(offset)
+
+            # mark the end of the stream
+            if prefix and not self.send(Packet(prefix, flags=STREAM_END, priority=PRIORITY_BULK)):
+                return False
+
+        # in case of a socket error the rest of the file can not be sent, part of a frame may have been written
+        except (socket.error, EOFError) as error:
+            self.abort("(send_file) File was unable to be sent. Error: " + str(error))
             return False
 
+        self.logger.debug("(send_file) File sent successfully.")
+
+        return True
+
+    # send part of a file with os.sendfile, must be called with the write lock held
+    def __sendfile(self, file_descriptor: int, offset: int, count: int, timeout: float):
+        while count > 0:
+            try:
+                sent = os.sendfile(self.__connection.fileno(), file_descriptor, offset, count)
+
+            # the socket's send buffer is full
+            except BlockingIOError:
+                self.__wait_writable(timeout)
+                continue
+
+            # the file is shorter than expected, the frame can not be completed
+            if sent == 0:
+                raise EOFError("The file ended " + str(count) + " bytes before the end of the frame.")
+
+            offset += sent
+            count -= sent
+
+    # give a new stream an id
+    def __new_stream_id(self) -> bytes:
+        with self.write_lock:
+            stream_id = self.__next_stream_id.to_bytes(4, 'big')
+            self.__next_stream_id = (self.__next_stream_id + 1) % 0x100000000
+
+        return stream_id
+
+    # split a stream source into chunks
+    @staticmethod
+    def stream_chunks(source, chunk_size: int):
+        # a file object, read one chunk at a time
+        if hasattr(source, "read"):
+            while True:
+                chunk = source.read(chunk_size)
+
+                if not chunk:
+                    return
+
+                yield chunk
+
+        # a buffer, slice it without copying
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            view = memoryview(source).cast('B')
+
+            for start in range(0, view.nbytes, chunk_size):
+                yield view[start:start + chunk_size]
+
+        # an iterable of chunks, split any chunk which is too large
+        else:
+            for chunk in source:
+                view = memoryview(chunk).cast('B')
+
+                for start in range(0, view.nbytes, chunk_size):
+                    yield view[start:start + chunk_size]
+
     # client info as a dict
     def return_data(self) -> Union[dict, None]:
         """
@@ -0,0 +1,168 @@
+# default lib imports
+import threading
+from typing import Union
+
+# module imports
+from .Client import Client
+
+
+# indexed registry of the connected clients
+class ClientRegistry:
+    def __init__(self):
+        # lock guarding all of the indexes
+        self.__lock = threading.RLock()
+
+        # clients indexed by their instance id (primary index)
+        self.__by_instance = {}
+
+        # clients indexed by their uuid, only one connection per uuid is kept
+        self.__by_uuid = {}
+
+        # clients indexed by their type then by their instance id
+        self.__by_type = {}
+
+        # cached snapshots, rebuilt lazily after the registry changes
+        self.__snapshot = None
+        self.__type_snapshots = {}
+
+    # add a client, replacing any client which shares its uuid
+    def add(self, client: Client) -> Union[Client, None]:
+        """
+        Add a client to the registry. If a client with the same UUID is already registered it is replaced.
+
+        :param client: Client object to add.
+        :return: The Client object which was replaced or None if no client was replaced.
+        """
+
+        with self.__lock:
+            # remove the client sharing the uuid from every index
+            replaced = self.__by_uuid.get(client.uuid())
+            if replaced is not None:
+                self.__discard(replaced)
+
+            # add the client to every index
+            self.__by_instance[client.instance_id] = client
+            self.__by_uuid[client.uuid()] = client
+            self.__by_type.setdefault(client.type(), {})[client.instance_id] = client
+
+            # invalidate the snapshots
+            self.__snapshot = None
+            self.__type_snapshots.pop(client.type(), None)
+
+            return replaced
+
+    # remove a client from every index, must be called with the lock held
+    def __discard(self, client: Client) -> bool:
+        # make sure this exact connection is the one registered
+        if self.__by_instance.pop(client.instance_id, None) is None:
+            return False
+
+        # only remove the uuid index entry if it still points at this connection
+        if self.__by_uuid.get(client.uuid()) is client:
+            del self.__by_uuid[client.uuid()]
+
+        # remove the type index entry and drop the type if it is empty
+        type_index = self.__by_type.get(client.type())
+        if type_index is not None:
+            type_index.pop(client.instance_id, None)
+
+            if not type_index:
+                del self.__by_type[client.type()]
+
+        # invalidate the snapshots
+        self.__snapshot = None
+        self.__type_snapshots.pop(client.type(), None)
+
+        return True
+
+    # remove a client
+    def remove(self, client: Client) -> bool:
+        """
+        Remove a client from the registry. Does nothing if the client is not registered (ex. it was already replaced
+        by a newer connection sharing its UUID).
+
+        :param client: Client object to remove.
+        :return: True if the client was removed, False if it was not registered.
+        """
+
+        with self.__lock:
+            return self.__discard(client)
+
+    # get a client by uuid
+    def get(self, unique_id: str) -> Union[Client, None]:
+        """
+        Get the client with the given UUID.
+
+        :param unique_id: The client's UUID as a str.
+        :return: Client object or None if no client has the UUID.
+        """
+        return self.__by_uuid.get(unique_id)
+
+    # get a client by instance id
+    def get_instance(self, instance_id: str) -> Union[Client, None]:
+        """
+        Get the client with the given instance id.
+
+        :param instance_id: The client's instance id as a str.
+        :return: Client object or None if no client has the instance id.
+        """
+        return self.__by_instance.get(instance_id)
+
+    # snapshot of the clients of a given type
+    def of_type(self, device_type: str) -> tuple:
+        """
+        Get an immutable snapshot of the clients of a given type. The snapshot is cached until a client of the type is
+        added or removed so repeated calls are cheap.
+
+        :param device_type: The device type as a str.
+        :return: A tuple of Client objects.
+        """
+
+        snapshot = self.__type_snapshots.get(device_type)
+        if snapshot is not None:
+            return snapshot
+
+        with self.__lock:
+            snapshot = tuple(self.__by_type.get(device_type, {}).values())
+            self.__type_snapshots[device_type] = snapshot
+
+            return snapshot
+
+    # snapshot of every client
+    def snapshot(self) -> tuple:
+        """
+        Get an immutable snapshot of every registered client. The snapshot is cached until a client is added or
+        removed so repeated calls are cheap.
+
+        :return: A tuple of Client objects.
+        """
+
+        snapshot = self.__snapshot
+        if snapshot is not None:
+            return snapshot
+
+        with self.__lock:
+            snapshot = tuple(self.__by_instance.values())
+            self.__snapshot = snapshot
+
+            return snapshot
+
+    # the registered device types
+    def types(self) -> list:
+        """
+        Get the device types which currently have at least one registered client.
+
+        :return: A list of str.
+        """
+
+        with self.__lock:
+            return list(self.__by_type.keys())
+
+    def __contains__(self, client: Client) -> bool:
+        return self.__by_instance.get(client.instance_id) is client
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __len__(self) -> int:
+        return len(self.__by_instance)
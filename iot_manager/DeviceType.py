@@ -1,17 +1,89 @@
+# default lib imports
+from typing import Callable, Sequence
+
+# module imports
 from .Client import Client
-from .Message import Message
+from .Message import Message, MessageBatch
+from .Dispatcher import KeyedDispatcher
+from .Schema import RecordSchema
 
 
 # defines a device type
 class DeviceType:
-    def __init__(self, device_type):
+    # what happens to a message of the type which arrives while max_pending of its handlers are queued or running
+    BLOCK = KeyedDispatcher.BLOCK
+    DROP = KeyedDispatcher.DROP
+
+    def __init__(self, device_type, workers: int = None, max_pending: int = 1000, overload: str = BLOCK,
+                 processes: int = None, schema=None, aggregate: Sequence[str] = None, device_sketches: bool = False):
         self.type = device_type
 
+        # the number of threads running the handlers of the type's clients, the handlers of a type with its own workers
+        # are never held up by the handlers of other types (None shares the Manager's handler workers)
+        self.workers = workers
+
+        # the max number of the type's handlers queued or running, only used when the type has its own workers
+        self.max_pending = max_pending
+
+        # with block the Manager's message listener waits for room (which holds up every type), with drop the new
+        # message of the type is thrown away
+        self.overload = overload
+
+        # the number of processes for CPU bound work of the handlers, see DeviceType.run_in_process()
+        self.processes = processes
+
+        # the process pool of the type, set by the Manager when the type is added
+        self.process_pool = None
+
+        # the fixed size binary record layout of the type's messages (a RecordSchema, struct format or numpy dtype),
+        # the messages of a type with a schema are handed over in batches decoded into records (see on_records())
+        self.schema = schema if schema is None or isinstance(schema, RecordSchema) else RecordSchema(schema)
+
+        # the names of the schema fields the Manager keeps windowed aggregates of for each device and for the whole type
+        # (see Manager.device_aggregate() and Manager.type_aggregate()), the type's keys always keep percentile
+        # sketches and the keys of each device only with device_sketches
+        self.aggregate = tuple(aggregate) if aggregate else ()
+        self.device_sketches = device_sketches
+
+        # the Manager's Aggregator, set by the Manager when the type is added so handlers can aggregate their own values
+        self.aggregator = None
+
+    # run a function on the type's processes
+    def run_in_process(self, function: Callable, *args, timeout: float = None):
+        """
+        Run a CPU bound function on the type's process pool and wait for its result, so it runs without holding the
+        GIL the other handlers need. The function and its arguments must be picklable (pass the payload bytes, not the
+        Message or Client). Runs the function on the calling thread if the type has no processes.
+
+        :param function: A module level function.
+        :param args: The arguments of the function.
+        :param timeout: Max time to wait for the result in seconds, None will wait as long as needed.
+        :return: The function's result.
+        """
+
+        if self.process_pool is None:
+            return function(*args)
+
+        return self.process_pool.submit(function, *args).result(timeout)
+
     def on_connect(self, client: Client):
         pass
 
     def on_message(self, message: Message):
         pass
 
+    # overriding it makes the Manager hand the type's messages over in batches (see Manager.on_message_batch()), and
+    # on_message is no longer called
+    def on_message_batch(self, batch: MessageBatch):
+        pass
+
+    # runs in place of on_message for a type with a schema, records is a numpy structured array of the records in the
+    # batch's messages (a list of tuples if numpy is not installed)
+    def on_records(self, batch: MessageBatch, records):
+        pass
+
+    def on_stream(self, message: Message):
+        pass
+
     def on_disconnect(self, client: Client):
         pass
@@ -0,0 +1,235 @@
+# default lib imports
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Hashable
+
+
+# runs handlers on a pool of workers, handlers submitted with the same key run one at a time in the order they were
+# submitted while handlers of different keys run at the same time
+class KeyedDispatcher:
+    # what happens to a handler submitted while max_pending handlers are queued or running
+    BLOCK = "block"
+    DROP = "drop"
+    POLICIES = (BLOCK, DROP)
+
+    def __init__(self, max_workers: int = 16, max_pending: int = 10000, batch_size: int = 32, policy: str = BLOCK,
+                 thread_name_prefix: str = "Message Handler", logging_id: str = "[Keyed Dispatcher]",
+                 logging_level: int = logging.WARNING):
+        if policy not in self.POLICIES:
+            raise ValueError("policy must be one of " + ", ".join(self.POLICIES))
+
+        # logger object and setup
+        self.logger = logging.getLogger(logging_id)
+        self.logger.setLevel(logging_level)
+
+        # the max number of handlers queued or running
+        self.max_pending = max_pending
+
+        # block makes submit() wait for room so a reader submitting faster than the handlers run is slowed down, drop
+        # throws the new handler away so the reader is never held up
+        self.policy = policy
+
+        # the max number of handlers of one key a worker runs before letting the other keys have the worker
+        self.batch_size = batch_size
+
+        # lock guarding the queues and counters, notified whenever a handler finishes
+        self.__lock = threading.Lock()
+        self.__room = threading.Condition(self.__lock)
+
+        # the handlers waiting to run indexed by key, a key is only present while it has handlers queued or running
+        self.__queues = {}
+
+        # the number of handlers queued or running
+        self.__pending = 0
+
+        # the number of handlers running
+        self.__running = 0
+
+        # counters of the handlers run, of the times submit() waited for room and of the handlers dropped
+        self.dispatched = 0
+        self.completed = 0
+        self.waits = 0
+        self.dropped = 0
+
+        # the most handlers which have been queued or running at once
+        self.peak_pending = 0
+
+        # true once the dispatcher is shut down, handlers submitted after are run on the calling thread
+        self.__closed = False
+
+        # the workers running the handlers
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+
+    # queue a handler
+    def submit(self, key: Hashable, handler: Callable, *args, block: bool = True) -> bool:
+        """
+        Queue a handler to run after every handler already submitted with the same key.
+
+        :param key: The key the handler is ordered by (ex. a client's UUID).
+        :param handler: The function to run.
+        :param args: The arguments of the function.
+        :param block: Apply the policy if max_pending handlers are queued or running, False queues the handler anyway
+                      (for handlers which must not be dropped and may be submitted from a handler).
+        :return: True if the handler was queued (or run on the calling thread because the dispatcher is shut down),
+                 False if it was dropped.
+        """
+
+        with self.__lock:
+            if block and self.__pending >= self.max_pending and not self.__closed:
+                # throw the handler away
+                if self.policy == self.DROP:
+                    self.dropped += 1
+                    return False
+
+                # wait for the workers to catch up
+                self.waits += 1
+
+                while self.__pending >= self.max_pending and not self.__closed:
+                    self.__room.wait()
+
+            closed = self.__closed
+
+            if not closed:
+                self.__pending += 1
+                self.peak_pending = max(self.peak_pending, self.__pending)
+                self.dispatched += 1
+
+                # a key which has a queue is already being run by a worker, which will get to this handler
+                queue = self.__queues.get(key)
+                if queue is not None:
+                    queue.append((handler, args))
+                    return True
+
+                self.__queues[key] = deque(((handler, args),))
+
+        # run the handler here so it is not lost
+        if closed:
+            self.__call(handler, args)
+            return True
+
+        self.__schedule(key)
+        return True
+
+    # give a key's handlers to the workers
+    def __schedule(self, key: Hashable):
+        try:
+            self.__executor.submit(self.__run, key)
+
+        # the dispatcher was shut down in the meantime, run the handlers here
+        except RuntimeError:
+            self.__run(key)
+
+    # run the queued handlers of a key, run on the executor
+    def __run(self, key: Hashable):
+        queue = self.__queues[key]
+
+        while True:
+            for _ in range(self.batch_size):
+                with self.__lock:
+                    handler, args = queue.popleft()
+                    self.__running += 1
+
+                self.__call(handler, args)
+
+                with self.__lock:
+                    self.__running -= 1
+                    self.__pending -= 1
+                    self.completed += 1
+                    self.__room.notify_all()
+
+                    # the key is done, a handler submitted from now on starts a new run
+                    if not queue:
+                        del self.__queues[key]
+                        return
+
+            # let the handlers of other keys have the worker before running more of this key's
+            try:
+                self.__executor.submit(self.__run, key)
+                return
+
+            # the dispatcher was shut down, keep running the key's handlers on this worker
+            except RuntimeError:
+                pass
+
+    # run a handler, a failing handler must not take down the worker
+    def __call(self, handler: Callable, args: tuple):
+        try:
+            handler(*args)
+        except Exception as error:
+            self.logger.error("(Dispatch) Exception caught when running a handler. Exception: '" + str(error) + "'")
+
+    # the number of handlers queued for a key
+    def depth(self, key: Hashable) -> int:
+        """
+        Get the number of handlers of a key waiting to run.
+
+        :param key: The key.
+        :return: int
+        """
+
+        with self.__lock:
+            queue = self.__queues.get(key)
+            return 0 if queue is None else len(queue)
+
+    # the dispatch counters
+    def stats(self) -> dict:
+        """
+        Get the number of handlers queued or running (pending), running, and dispatched and completed in total, the
+        number of keys with handlers pending and the deepest queue of one key, the most handlers pending at once
+        (peak_pending), the number of times a submit waited for room (waits), and the number of handlers dropped.
+
+        :return: dict
+        """
+
+        with self.__lock:
+            return {
+                "pending": self.__pending,
+                "running": self.__running,
+                "dispatched": self.dispatched,
+                "completed": self.completed,
+                "keys": len(self.__queues),
+                "max_depth": max((len(queue) for queue in self.__queues.values()), default=0),
+                "peak_pending": self.peak_pending,
+                "waits": self.waits,
+                "dropped": self.dropped
+            }
+
+    # wait for the queued handlers
+    def join(self, timeout: float = None) -> bool:
+        """
+        Wait for every queued handler to run.
+
+        :param timeout: Max time to wait in seconds, None will wait as long as needed.
+        :return: True if every handler has run, False if the timeout expired first.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self.__lock:
+            while self.__pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+
+                if remaining is not None and remaining <= 0:
+                    return False
+
+                self.__room.wait(remaining)
+
+        return True
+
+    # stop the workers
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the workers once every queued handler has run, handlers submitted from now on run on the calling thread.
+
+        :param wait: Block until the handlers have run.
+        :return: None
+        """
+
+        with self.__lock:
+            self.__closed = True
+            self.__room.notify_all()
+
+        self.__executor.shutdown(wait)
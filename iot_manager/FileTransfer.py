@@ -0,0 +1,223 @@
+# default lib imports
+import os
+import mmap
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable
+
+# module imports
+from .Client import Client
+
+
+# the progress of sending a file to one client
+class FileTransfer:
+    # states of a transfer
+    QUEUED = "queued"
+    SENDING = "sending"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, client: Client, path: str, size: int, offset: int):
+        # the client the file is sent to
+        self.client = client
+
+        # the uuid of the client the file is sent to
+        self.uuid = client.uuid()
+
+        # the path of the file being sent
+        self.path = path
+
+        # the size of the whole file in bytes
+        self.size = size
+
+        # the offset the transfer started from
+        self.start_offset = offset
+
+        # the offset in the file reached so far, pass it to Manager.send_file() to resume a failed transfer
+        self.offset = offset
+
+        # the state of the transfer
+        self.state = self.QUEUED
+
+        # future which resolves to True once the file has been sent or False if the transfer failed
+        self.future = Future()
+
+    # the fraction of the file which has been sent
+    @property
+    def progress(self) -> float:
+        """
+        The fraction of the file which has been sent, from 0 to 1.
+
+        :return: float
+        """
+        return 1.0 if self.size == 0 else self.offset / self.size
+
+    # check if the transfer is done
+    def done(self) -> bool:
+        """
+        Check if the transfer has finished, successfully or not.
+
+        :return: bool
+        """
+        return self.future.done()
+
+    # block until the transfer is done
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Block until the transfer has finished.
+
+        :param timeout: Max time to wait in seconds, None will wait forever.
+        :return: True if the file was sent, False if the transfer failed. Raises concurrent.futures.TimeoutError if the
+                 timeout expires.
+        """
+        return self.future.result(timeout)
+
+    def __repr__(self):
+        return "FileTransfer(uuid=" + str(self.uuid) + ", state=" + self.state + ", offset=" + str(self.offset) \
+               + ", size=" + str(self.size) + ")"
+
+
+# a file opened once and shared by every transfer of a distribution, closed once the last transfer finishes
+class _SharedFile:
+    def __init__(self, path: str, users: int, needs_mapping: bool):
+        # read only file descriptor, only used with explicit offsets so it has no shared position
+        self.file_descriptor = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+
+        try:
+            # the size of the file when the distribution started
+            self.size = os.fstat(self.file_descriptor).st_size
+
+            # a read only mmap of the file for connections which can not use os.sendfile, every transfer slices the
+            # same mapping so the file is only in memory once (empty files can not be mapped)
+            self.mapping = None
+            if needs_mapping and self.size > 0:
+                self.mapping = mmap.mmap(self.file_descriptor, self.size, access=mmap.ACCESS_READ)
+
+        except Exception:
+            os.close(self.file_descriptor)
+            raise
+
+        # the number of transfers still using the file
+        self.__users = users
+        self.__lock = threading.Lock()
+
+    # called by each transfer once it has finished with the file
+    def release(self):
+        with self.__lock:
+            self.__users -= 1
+
+            if self.__users > 0:
+                return
+
+        # a slice of the mapping still held by a failed send keeps it open until it is garbage collected
+        if self.mapping is not None:
+            try:
+                self.mapping.close()
+            except BufferError:
+                pass
+
+        os.close(self.file_descriptor)
+
+
+# sends files from disk to many clients at once
+class FileDistributor:
+    def __init__(self, max_transfers: int = 16, chunk_size: int = 65536, timeout: float = 30,
+                 logging_id: str = "[File Distributor]", logging_level: int = logging.WARNING):
+        # logger object and setup
+        self.logger = logging.getLogger(logging_id)
+        self.logger.setLevel(logging_level)
+
+        # the max size of each frame's chunk of a file in bytes
+        self.chunk_size = chunk_size
+
+        # the time a client's socket has to accept more data before its transfer fails
+        self.timeout = timeout
+
+        # each transfer runs on its own worker so the number of workers caps the number of transfers running at once,
+        # the rest wait in the executor's queue
+        self.__executor = ThreadPoolExecutor(max_workers=max_transfers, thread_name_prefix="File Transfer")
+
+    # send a file to a group of clients
+    def distribute(self, path: str, clients, offset: int = 0,
+                   on_progress: Callable[[FileTransfer], None] = None) -> dict:
+        """
+        Send a file to every client given. The file is opened once and sent with os.sendfile, or from one shared mmap
+        of the file for connections which can not use os.sendfile, so it is never copied into python per client.
+
+        :param path: The path of the file to send.
+        :param clients: A sequence of Client objects to send the file to.
+        :param offset: The offset in the file to start sending from, used to resume a transfer.
+        :param on_progress: Optional callable called with the FileTransfer after each chunk is sent.
+        :return: A dict of FileTransfer objects indexed by client uuid.
+        """
+
+        transfers = {}
+
+        # nothing to send
+        if not clients:
+            return transfers
+
+        shared = _SharedFile(path, len(clients), not all(client.supports_sendfile() for client in clients))
+
+        if not 0 <= offset <= shared.size:
+            shared.release()
+            raise ValueError("offset must be from 0 up to the size of the file (" + str(shared.size) + " bytes)")
+
+        # logging output
+        self.logger.info("(Distribute) Sending '" + str(path) + "' (" + str(shared.size) + " bytes) to '"
+                         + str(len(clients)) + "' clients.")
+
+        for client in clients:
+            transfer = FileTransfer(client, path, shared.size, offset)
+            transfers[transfer.uuid] = transfer
+
+            self.__executor.submit(self.__run, transfer, shared, on_progress)
+
+        return transfers
+
+    # send the file to one client, run on the executor
+    def __run(self, transfer: FileTransfer, shared: _SharedFile, on_progress):
+        transfer.state = FileTransfer.SENDING
+        sent = False
+
+        # record the offset reached after each chunk
+        def progress(offset: int):
+            transfer.offset = offset
+
+            if on_progress is not None:
+                try:
+                    on_progress(transfer)
+                except Exception as error:
+                    self.logger.error("(Transfer) Exception caught when running the on_progress callback. "
+                                      + "Exception: '" + str(error) + "'")
+
+        try:
+            if not transfer.client.is_closed():
+                sent = transfer.client.send_file(shared.file_descriptor, transfer.offset, shared.size - transfer.offset,
+                                                 self.chunk_size, shared.mapping, progress, self.timeout)
+
+        # a failing transfer must not take down the worker
+        except Exception as error:
+            self.logger.error("(Transfer) Exception caught when sending a file to client '" + str(transfer.uuid)
+                              + "'. Exception: '" + str(error) + "'")
+
+        finally:
+            shared.release()
+
+            transfer.state = FileTransfer.DONE if sent else FileTransfer.FAILED
+            transfer.future.set_result(sent)
+
+            # logging output
+            self.logger.debug("(Transfer) Transfer to client '" + str(transfer.uuid) + "' " + transfer.state + " at "
+                              + str(transfer.offset) + " of " + str(transfer.size) + " bytes.")
+
+    # stop the transfer workers
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the transfer workers once every queued transfer has run.
+
+        :param wait: Block until the transfers have finished.
+        :return: None
+        """
+        self.__executor.shutdown(wait)
@@ -0,0 +1,193 @@
+# module imports
+from .Packet import Packet
+from .ReservedBytes import PROTOCOL_V1, PROTOCOL_V2
+
+
+# incremental decoder for the frames sent between the manager and its clients
+# version 1 frames: [2B - Message Size][Message]
+# version 2 frames: [1B - Flags][4B - Message Size][Message]
+class FrameDecoder:
+    # an exception raised when a frame header declares a message larger than the decoder allows
+    class FrameTooLarge(Exception):
+        pass
+
+    # the size of the frame header and of the message size field at the end of it for each protocol version
+    HEADER_SIZES = {PROTOCOL_V1: 2, PROTOCOL_V2: 5}
+    SIZE_FIELD_SIZES = {PROTOCOL_V1: 2, PROTOCOL_V2: 4}
+
+    def __init__(self, buffer_size: int = 65536, max_frame_size: int = None, version: int = PROTOCOL_V1):
+        # the protocol version of the frames being decoded
+        self.__version = None
+        self.__header_size = None
+        self.__size_field_size = None
+        self.version = version
+
+        # the largest message a frame may carry, None for no limit other than the header
+        self.max_frame_size = max_frame_size
+
+        # reusable receive buffer, socket reads go straight into it, grown to fit a larger frame and shrunk back to
+        # its default size once the frame has been parsed so an idle connection does not keep a large buffer
+        self.__buffer_size = max(buffer_size, max(self.HEADER_SIZES.values()))
+        self.__buffer = bytearray(self.__buffer_size)
+        self.__view = memoryview(self.__buffer)
+
+        # the start and end of the data which has been read but not yet parsed into frames
+        self.__start = 0
+        self.__end = 0
+
+    # the protocol version of the frames being decoded
+    @property
+    def version(self) -> int:
+        """
+        The protocol version of the frames being decoded, can be changed between frames (ex. after a handshake).
+
+        :return: int
+        """
+        return self.__version
+
+    @version.setter
+    def version(self, version: int):
+        if version not in self.HEADER_SIZES:
+            raise ValueError("Unknown protocol version '" + str(version) + "'.")
+
+        self.__version = version
+        self.__header_size = self.HEADER_SIZES[version]
+        self.__size_field_size = self.SIZE_FIELD_SIZES[version]
+
+    # the number of bytes read but not yet parsed into frames (a partial frame)
+    def pending(self) -> int:
+        """
+        Get the number of bytes which have been read but do not make up a complete frame yet.
+
+        :return: int
+        """
+        return self.__end - self.__start
+
+    # the size of the frame at the start of the unparsed data, None if its header has not been read yet
+    def __next_frame_size(self):
+        if self.__end - self.__start < self.__header_size:
+            return None
+
+        # the message size is the last field of the header
+        header_end = self.__start + self.__header_size
+        message_size = int.from_bytes(self.__view[header_end - self.__size_field_size:header_end], 'big')
+
+        # refuse frames which would grow the buffer past the limit
+        if self.max_frame_size is not None and message_size > self.max_frame_size:
+            raise self.FrameTooLarge("Frame of " + str(message_size) + " bytes is larger than the max frame size of "
+                                     + str(self.max_frame_size) + " bytes.")
+
+        return self.__header_size + message_size
+
+    # make sure there is room after the unparsed data for the next read
+    def __make_room(self):
+        pending = self.__end - self.__start
+
+        # nothing left to parse, start again from the front of the buffer
+        if pending == 0:
+            self.__start = self.__end = 0
+            self.__shrink()
+            return
+
+        frame_size = self.__next_frame_size()
+
+        # the buffer was grown for an earlier frame and the partial frame fits in the default size
+        if len(self.__buffer) > self.__buffer_size and pending <= self.__buffer_size \
+                and (frame_size is None or frame_size <= self.__buffer_size):
+            self.__buffer[:pending] = self.__view[self.__start:self.__end].tobytes()
+            self.__start, self.__end = 0, pending
+            self.__shrink()
+
+        # grow the buffer if the partial frame will not fit in it
+        if frame_size is not None and frame_size > len(self.__buffer):
+            self.__view.release()
+            self.__buffer[self.__end:] = bytes(frame_size - self.__end)
+            self.__view = memoryview(self.__buffer)
+
+        # move the partial frame to the front of the buffer if the space after it is running low
+        if (self.__start > 0 and len(self.__buffer) - self.__end < len(self.__buffer) // 4) \
+                or (frame_size is not None and self.__start + frame_size > len(self.__buffer)):
+            self.__buffer[:pending] = self.__view[self.__start:self.__end].tobytes()
+            self.__start, self.__end = 0, pending
+
+    # shrink the buffer back to its default size, the data left must be at the front of the buffer
+    def __shrink(self):
+        if len(self.__buffer) <= self.__buffer_size:
+            return
+
+        self.__view.release()
+
+        # a view handed out by FrameDecoder.buffer() is still in use, shrink on a later read
+        try:
+            del self.__buffer[self.__buffer_size:]
+        except BufferError:
+            pass
+
+        self.__view = memoryview(self.__buffer)
+
+    # read as much as is available from the socket into the buffer
+    def read_from(self, connection) -> int:
+        """
+        Read from a socket straight into the receive buffer with a single recv_into call.
+
+        :param connection: The socket to read from.
+        :return: The number of bytes read, 0 if the socket has been closed by the other end.
+        """
+
+        read = connection.recv_into(self.buffer())
+        self.advance(read)
+
+        return read
+
+    # the free space at the end of the receive buffer
+    def buffer(self) -> memoryview:
+        """
+        Get the free space after the unparsed data for the next read to write into, used by readers which do not own
+        the socket (ex. asyncio.BufferedProtocol.get_buffer()). Must be followed by FrameDecoder.advance().
+
+        :return: A writable memoryview of the receive buffer.
+        """
+
+        self.__make_room()
+
+        return self.__view[self.__end:]
+
+    # mark bytes written into the receive buffer as read
+    def advance(self, read: int):
+        """
+        Mark the first bytes of the space returned by FrameDecoder.buffer() as read.
+
+        :param read: The number of bytes written into the buffer.
+        :return: None
+        """
+        self.__end += read
+
+    # parse every complete frame out of the buffer
+    def frames(self) -> list:
+        """
+        Parse every complete frame which has been read. A trailing partial frame is kept and completed by later reads.
+
+        :return: A list of receiving Packet objects, one per frame.
+        """
+
+        frames = []
+
+        while True:
+            frame_size = self.__next_frame_size()
+
+            # stop at a partial header or a partial frame
+            if frame_size is None or self.__end - self.__start < frame_size:
+                break
+
+            # version 2 frames start with the flags
+            flags = self.__buffer[self.__start] if self.__version == PROTOCOL_V2 else 0
+
+            frames.append(Packet(bytes(self.__view[self.__start + self.__header_size:self.__start + frame_size]),
+                                 sending=False, flags=flags))
+            self.__start += frame_size
+
+        # everything was parsed, the next read can start at the front of the buffer
+        if self.__start == self.__end:
+            self.__start = self.__end = 0
+
+        return frames
@@ -0,0 +1,243 @@
+# default lib imports
+import json
+import struct
+import sys
+import threading
+from typing import Union
+from uuid import UUID
+
+# module imports
+from .ReservedBytes import BINARY_INFO
+
+# binary info reply: [1B - BINARY_INFO][16B - UUID][2B - Type ID][Type Name if the Type ID is 0][Metadata]
+# type name: [1B - Length][UTF-8 Name]
+# metadata: [1B - Entry Count] followed by the entries, each [1B - Key Length][UTF-8 Key][1B - Tag][Value]
+
+# metadata value tags
+TAG_NONE = 0
+TAG_FALSE = 1
+TAG_TRUE = 2
+# [8B - Signed Int]
+TAG_INT = 3
+# [8B - Double]
+TAG_FLOAT = 4
+# [2B - Length][UTF-8 String]
+TAG_STR = 5
+# [2B - Length][JSON], used for lists, dicts and ints which do not fit in 8 bytes
+TAG_JSON = 6
+
+# type id sent in place of a type name, 0 means the name follows
+NAMED_TYPE = 0
+
+_INT = struct.Struct(">q")
+_FLOAT = struct.Struct(">d")
+_SHORT = struct.Struct(">H")
+
+
+# interns the device type names shared by every client, each registered type also gets a small id clients can send
+# in a binary handshake instead of its name
+class TypeTable:
+    def __init__(self):
+        # lock guarding the tables
+        self.__lock = threading.Lock()
+
+        # the registered type names indexed by id and the ids indexed by name, ids start at 1
+        self.__names = [None]
+        self.__ids = {}
+
+    # register a type name
+    def register(self, name: str) -> int:
+        """
+        Register a type name, types are given ids in the order they are registered.
+
+        :param name: The type name.
+        :return: The type's id.
+        """
+
+        with self.__lock:
+            type_id = self.__ids.get(name)
+
+            if type_id is None:
+                if len(self.__names) > 0xFFFF:
+                    raise OverflowError("Only 65535 types can be registered.")
+
+                type_id = len(self.__names)
+                self.__names.append(sys.intern(name))
+                self.__ids[self.__names[type_id]] = type_id
+
+            return type_id
+
+    # the shared copy of a type name
+    def intern(self, name: str) -> str:
+        """
+        Get the shared copy of a type name so every client of a type holds the same str object.
+
+        :param name: The type name.
+        :return: str
+        """
+        return sys.intern(name)
+
+    # the id of a type name
+    def id_of(self, name: str) -> Union[int, None]:
+        """
+        Get the id of a registered type name.
+
+        :param name: The type name.
+        :return: int or None if the type is not registered.
+        """
+        return self.__ids.get(name)
+
+    # the name of a type id
+    def name_of(self, type_id: int) -> Union[str, None]:
+        """
+        Get the shared name of a registered type id.
+
+        :param type_id: The type id.
+        :return: str or None if no type has the id.
+        """
+
+        names = self.__names
+        return names[type_id] if 0 < type_id < len(names) else None
+
+
+# encode one metadata value
+def _encode_value(value) -> bytes:
+    if value is None:
+        return bytes((TAG_NONE,))
+
+    if value is True or value is False:
+        return bytes((TAG_TRUE if value else TAG_FALSE,))
+
+    if isinstance(value, int) and -0x8000000000000000 <= value <= 0x7FFFFFFFFFFFFFFF:
+        return bytes((TAG_INT,)) + _INT.pack(value)
+
+    if isinstance(value, float):
+        return bytes((TAG_FLOAT,)) + _FLOAT.pack(value)
+
+    if isinstance(value, str):
+        tag, encoded = TAG_STR, value.encode()
+    else:
+        tag, encoded = TAG_JSON, json.dumps(value, separators=(",", ":")).encode()
+
+    return bytes((tag,)) + _SHORT.pack(len(encoded)) + encoded
+
+
+# build a binary info reply
+def encode_info(unique_id: Union[str, UUID], device_type: Union[str, int], data: dict = None) -> bytes:
+    """
+    Build the binary reply to the manager's GET_DATA request, the compact alternative to 'UUID##DEVICE_TYPE##JSON'.
+
+    :param unique_id: The client's UUID as a str or UUID object.
+    :param device_type: The client's type name, or the id of a type registered with the manager.
+    :param data: The client's data as a dict with str keys, values may be None, bool, int, float, str or anything JSON
+                 can encode.
+    :return: bytes
+    """
+
+    if not isinstance(unique_id, UUID):
+        unique_id = UUID(unique_id)
+
+    parts = [BINARY_INFO, unique_id.bytes]
+
+    if isinstance(device_type, int):
+        parts.append(_SHORT.pack(device_type))
+    else:
+        name = device_type.encode()
+        parts.append(_SHORT.pack(NAMED_TYPE) + bytes((len(name),)) + name)
+
+    data = data or {}
+    parts.append(bytes((len(data),)))
+
+    for key, value in data.items():
+        key = key.encode()
+        parts.append(bytes((len(key),)) + key)
+        parts.append(_encode_value(value))
+
+    return b''.join(parts)
+
+
+# parse a binary info reply
+def decode_info(payload: Union[bytes, memoryview], types: TypeTable) -> tuple:
+    """
+    Parse a binary reply to the manager's GET_DATA request, raises a ValueError if the reply is malformed or names an
+    unknown type id.
+
+    :param payload: The reply, starting with BINARY_INFO.
+    :param types: The table the type is interned in.
+    :return: A tuple of the UUID str, the shared type name, the type id sent (NAMED_TYPE if the name was sent), and the
+             data dict.
+    """
+
+    # the reply is small, indexing bytes is cheaper than indexing a memoryview
+    data = bytes(payload)
+
+    try:
+        if data[0] != BINARY_INFO[0]:
+            raise ValueError("Reply does not start with BINARY_INFO.")
+
+        # format the UUID as text without building a UUID object
+        hex_uuid = data[1:17].hex()
+        if len(hex_uuid) != 32:
+            raise ValueError("UUID is truncated.")
+
+        client_uuid = "-".join((hex_uuid[:8], hex_uuid[8:12], hex_uuid[12:16], hex_uuid[16:20], hex_uuid[20:]))
+
+        type_id, = _SHORT.unpack_from(data, 17)
+        offset = 19
+
+        if type_id == NAMED_TYPE:
+            end = offset + 1 + data[offset]
+            client_type = types.intern(data[offset + 1:end].decode())
+            offset = end
+        else:
+            client_type = types.name_of(type_id)
+
+            if client_type is None:
+                raise ValueError("Unknown type id " + str(type_id) + ".")
+
+        client_data = {}
+        count = data[offset]
+        offset += 1
+
+        for _ in range(count):
+            end = offset + 1 + data[offset]
+            key = data[offset + 1:end].decode()
+            tag = data[end]
+            offset = end + 1
+
+            if tag == TAG_STR or tag == TAG_JSON:
+                end = offset + 2 + _SHORT.unpack_from(data, offset)[0]
+
+                if end > len(data):
+                    raise ValueError("Metadata value is truncated.")
+
+                value = data[offset + 2:end].decode()
+                offset = end
+
+                if tag == TAG_JSON:
+                    value = json.loads(value)
+            elif tag == TAG_INT:
+                value, = _INT.unpack_from(data, offset)
+                offset += 8
+            elif tag == TAG_FLOAT:
+                value, = _FLOAT.unpack_from(data, offset)
+                offset += 8
+            elif tag == TAG_NONE:
+                value = None
+            elif tag == TAG_FALSE:
+                value = False
+            elif tag == TAG_TRUE:
+                value = True
+            else:
+                raise ValueError("Unknown metadata tag " + str(tag) + ".")
+
+            client_data[key] = value
+
+    # a reply which ends early or holds invalid UTF-8 or JSON is malformed
+    except (IndexError, struct.error, UnicodeDecodeError, json.JSONDecodeError) as error:
+        raise ValueError("Malformed binary info. " + str(error))
+
+    if offset != len(data):
+        raise ValueError("Binary info has trailing bytes.")
+
+    return client_uuid, client_type, type_id, client_data
@@ -0,0 +1,209 @@
+# default lib imports
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from typing import Callable
+
+# module imports
+from .Client import Client
+
+
+# schedules heartbeat probes for each client spread across the heartbeat interval
+class HeartbeatScheduler:
+    # kinds of scheduled entries
+    PROBE = 0
+    DEADLINE = 1
+
+    def __init__(self, probe: Callable[[list], None], expire: Callable[[Client], None], rate: float,
+                 timeout: float, jitter: float = 0.1, passive: bool = True, logging_id: str = "[Heartbeat Scheduler]",
+                 logging_level: int = logging.WARNING):
+        # logger object and setup
+        self.logger = logging.getLogger(logging_id)
+        self.logger.setLevel(logging_level)
+
+        # called with a list of clients which are due for a heartbeat probe, must not block waiting for replies
+        self.__probe = probe
+
+        # called with a client which failed to reply to a probe before its deadline
+        self.__expire = expire
+
+        # the delay between heartbeat probes for a client
+        self.rate = rate
+
+        # the time a client has to reply to a probe
+        self.timeout = timeout
+
+        # the fraction of the rate each probe is randomly moved by so probes do not bunch up
+        self.jitter = jitter
+
+        # if true any message received from a client counts as a heartbeat, only clients which have been quiet for
+        # longer than the rate are sent probes
+        self.passive = passive
+
+        # condition used to wait for the next entry to be due and to wake the scheduler when a client is added
+        self.__condition = threading.Condition()
+
+        # heap of scheduled entries as tuples of (due time, sequence number, kind, client)
+        self.__heap = []
+
+        # tie breaker so entries due at the same time never compare clients
+        self.__sequence = itertools.count()
+
+        # the clients being tracked indexed by instance id
+        self.__clients = {}
+
+        # the times the probes waiting for a reply were sent indexed by instance id
+        self.__pending = {}
+
+        # true until stop() is called
+        self.__running = True
+
+    # the delay before a client's next probe
+    def __interval(self) -> float:
+        return max(0.0, self.rate * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    # add an entry to the heap, a deadline carries the time its probe was sent, must be called with the condition held
+    def __schedule(self, due: float, kind: int, client: Client, probed: float = None):
+        heapq.heappush(self.__heap, (due, next(self.__sequence), kind, client, probed))
+
+    # start tracking a client
+    def add(self, client: Client):
+        """
+        Start sending heartbeat probes to a client. The first probe is placed at a random point in the interval so
+        clients which connected together are not all probed together.
+
+        :param client: Client object to track.
+        :return: None
+        """
+
+        with self.__condition:
+            self.__clients[client.instance_id] = client
+            self.__schedule(time.monotonic() + random.uniform(0, self.rate), self.PROBE, client)
+            self.__condition.notify()
+
+    # stop tracking a client
+    def remove(self, client: Client):
+        """
+        Stop sending heartbeat probes to a client. Its scheduled entries are dropped lazily when they come due.
+
+        :param client: Client object to stop tracking.
+        :return: None
+        """
+
+        with self.__condition:
+            if self.__clients.get(client.instance_id) is client:
+                del self.__clients[client.instance_id]
+                self.__pending.pop(client.instance_id, None)
+
+    # match a heartbeat reply to the probe waiting for it
+    def acknowledge(self, client: Client) -> bool:
+        """
+        Record a heartbeat reply from a client.
+
+        :param client: Client object which replied.
+        :return: True if the client had a probe waiting for a reply, otherwise False.
+        """
+
+        with self.__condition:
+            return self.__pending.pop(client.instance_id, None) is not None
+
+    # the number of clients being tracked
+    def __len__(self) -> int:
+        return len(self.__clients)
+
+    # run the scheduler loop, blocks until stop() is called
+    def run(self):
+        """
+        Run the scheduler loop on the calling thread until stop() is called. Each wakeup only handles the entries
+        which are due so the cost of a wakeup does not depend on the number of clients being tracked.
+
+        :return: None
+        """
+
+        # log on init
+        self.logger.debug("(Run) Starting process...")
+
+        while True:
+            # clients due for a probe and clients which missed their deadline
+            probes = []
+            expired = []
+
+            with self.__condition:
+                if not self.__running:
+                    return
+
+                now = time.monotonic()
+
+                # pop every due entry
+                while self.__heap and self.__heap[0][0] <= now:
+                    _, _, kind, client, probed = heapq.heappop(self.__heap)
+
+                    # skip entries of clients which are no longer tracked
+                    if self.__clients.get(client.instance_id) is not client:
+                        continue
+
+                    if kind == self.PROBE:
+                        # a client which recently sent a message is alive so it does not need a probe
+                        recently_seen = self.passive and now - client.last_seen < self.rate
+
+                        # a client still waiting on a reply is handled by the deadline of that probe
+                        if not recently_seen and client.instance_id not in self.__pending:
+                            self.__pending[client.instance_id] = now
+                            self.__schedule(now + self.timeout, self.DEADLINE, client, now)
+                            probes.append(client)
+
+                        # schedule the next probe
+                        self.__schedule(now + self.__interval(), self.PROBE, client)
+
+                    else:
+                        # ignore deadlines of probes which were replied to, or of earlier probes
+                        if self.__pending.get(client.instance_id) != probed:
+                            continue
+
+                        del self.__pending[client.instance_id]
+
+                        # any message received since the probe was sent counts as a reply
+                        if self.passive and client.last_seen >= probed:
+                            continue
+
+                        del self.__clients[client.instance_id]
+                        expired.append(client)
+
+                # nothing due, wait for the next entry or for a client to be added
+                if not probes and not expired:
+                    self.__condition.wait(self.__heap[0][0] - now if self.__heap else None)
+                    continue
+
+            # send the probes and expire the dead clients outside of the lock
+            if probes:
+                self.logger.debug("(Run) Sending heartbeat probes to '" + str(len(probes)) + "' clients.")
+
+                try:
+                    self.__probe(probes)
+                except Exception as error:
+                    self.logger.error("(Run) Exception caught when sending heartbeat probes. Exception: '"
+                                      + str(error) + "'")
+
+            for client in expired:
+                self.logger.debug("(Run) Client '" + str(client.uuid()) + "' missed its heartbeat deadline.")
+
+                try:
+                    self.__expire(client)
+                except Exception as error:
+                    self.logger.error("(Run) Exception caught when expiring a client. Exception: '"
+                                      + str(error) + "'")
+
+    # stop the scheduler loop
+    def stop(self):
+        """
+        Stop the scheduler loop.
+
+        :return: None
+        """
+
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify_all()
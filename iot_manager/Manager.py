@@ -1,11 +1,11 @@
 # default lib imports
 import logging
 import ssl
-import sys
-import os
 import socket
+import selectors
 import threading
-from concurrent.futures import ThreadPoolExecutor
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait as wait_futures
 from typing import Union
 
 # external lib imports
@@ -14,18 +14,41 @@ import gevent
 # module imports
 from .Client import Client
 from .Packet import Packet
-from .Message import Message
+from .Message import Message, MessageBatch
 from .DeviceType import DeviceType
+from .ReceiveEngine import ReceiveEngine
+from .ClientRegistry import ClientRegistry
+from .RateLimiter import TokenBucket
+from .HeartbeatScheduler import HeartbeatScheduler
+from .ReservedBytes import HEARTBEAT, PRIORITY_CONTROL
+from .Broadcast import Broadcaster, BroadcastResult
+from .OutboundQueue import OutboundQueue, OutboundBudget
+from .FileTransfer import FileDistributor, FileTransfer
+from .TLSHandshake import TLSHandshaker
+from .Admission import RegistrationAdmission
+from .Handshake import TypeTable
+from .Dispatcher import KeyedDispatcher
+from .Aggregator import Aggregator
 
 # define the packetable datatype
-packetable = Union[str, bytes, bytearray, Packet]
+packetable = Union[str, bytes, bytearray, memoryview, Packet]
 
 
 # Manager class
 class Manager:
     def __init__(self, ssl_context: ssl.SSLContext = None, host: str = "127.0.0.1", connection_port: int = 8595,
-                 max_workers: int = 8, heartbeat_rate: int = 60, heartbeat_timeout: int = 10,
-                 backlogged_connections: int = 10,
+                 max_workers: int = 8, control_workers: int = 2, heartbeat_rate: int = 60, heartbeat_timeout: int = 10,
+                 heartbeat_jitter: float = 0.1, passive_heartbeat: bool = True,
+                 backlogged_connections: int = 10, accept_rate: float = None, accept_batch_size: int = 64,
+                 max_frame_size: int = 4194304, max_file_transfers: int = 16, flush_window: float = 0.0,
+                 max_batch_bytes: int = 262144, write_timeout: float = 30, outbound_high_watermark: int = 1048576,
+                 outbound_low_watermark: int = None, outbound_policy: str = OutboundQueue.DROP_NEWEST,
+                 max_outbound_bytes: int = 268435456, reuse_port: bool = False, max_handshakes: int = 4,
+                 max_pending_handshakes: int = 256, handshake_timeout: float = 10, tls_session_tickets: int = None,
+                 max_registrations: int = 8, max_pending_registrations: int = 1024, registration_rate: float = None,
+                 max_connections_per_ip: int = None, registration_overload: str = RegistrationAdmission.QUEUE,
+                 registration_timeout: float = 15, handler_workers: int = 16, max_pending_messages: int = 10000,
+                 batch_window: float = 0.0, max_batch_size: int = 256, aggregator: Aggregator = None,
                  logging_id: str = "[Manager]", logging_level: int = logging.WARNING,
                  client_logging_level: int = logging.WARNING):
 
@@ -37,27 +60,135 @@ class Manager:
         self.port = connection_port
 
         # the delay between heartbeat messages
-        if isinstance(heartbeat_rate, (int, float)):
-            self.heartbeat_rate = heartbeat_rate
-        else:
+        if not isinstance(heartbeat_rate, (int, float)):
             raise TypeError("heartbeat_rate must be a number representing delay in seconds")
 
         # the time a client has to respond before being removed
-        if isinstance(heartbeat_timeout, (int, float)):
-            self.heartbeat_timeout = heartbeat_timeout
-        else:
+        if not isinstance(heartbeat_timeout, (int, float)):
             raise TypeError("heartbeat_timeout must be a number representing time in seconds")
 
+        # the fraction of the heartbeat_rate each client's heartbeat is randomly moved by
+        if not isinstance(heartbeat_jitter, (int, float)) or not 0 <= heartbeat_jitter < 1:
+            raise TypeError("heartbeat_jitter must be a number from 0 up to but not including 1")
+
+        # the max number of connections accepted in one pass over the listening socket's backlog
+        if isinstance(accept_batch_size, int) and accept_batch_size > 0:
+            self.accept_batch_size = accept_batch_size
+        else:
+            raise TypeError("accept_batch_size must be an int greater than 0")
+
+        # the largest message a client may send using protocol version 2 frames
+        if isinstance(max_frame_size, int) and max_frame_size > 0:
+            self.max_frame_size = max_frame_size
+        else:
+            raise TypeError("max_frame_size must be an int greater than 0")
+
+        # the time a flush of packets queued by Manager.send() waits for more packets to the same client before writing
+        if isinstance(flush_window, (int, float)) and flush_window >= 0:
+            self.flush_window = flush_window
+        else:
+            raise TypeError("flush_window must be a number greater than or equal to 0 representing time in seconds")
+
+        # the max number of queued bytes written to a client with one write
+        if isinstance(max_batch_bytes, int) and max_batch_bytes > 0:
+            self.max_batch_bytes = max_batch_bytes
+        else:
+            raise TypeError("max_batch_bytes must be an int greater than 0")
+
+        # the time a client's socket may refuse more data before the client is disconnected
+        if isinstance(write_timeout, (int, float)) and write_timeout > 0:
+            self.write_timeout = write_timeout
+        else:
+            raise TypeError("write_timeout must be a number greater than 0 representing time in seconds")
+
+        # the number of bytes queued for a client at which its queue is full, and the number it must drain to before
+        # taking packets again
+        if outbound_high_watermark is not None and \
+                (not isinstance(outbound_high_watermark, int) or outbound_high_watermark <= 0):
+            raise TypeError("outbound_high_watermark must be None or an int greater than 0")
+
+        if outbound_low_watermark is not None and (not isinstance(outbound_low_watermark, int)
+                                                   or not 0 <= outbound_low_watermark <= (outbound_high_watermark or 0)):
+            raise TypeError("outbound_low_watermark must be None or an int from 0 up to outbound_high_watermark")
+
+        self.outbound_high_watermark = outbound_high_watermark
+        self.outbound_low_watermark = outbound_low_watermark
+
+        # what happens to a packet for a client whose queue is full
+        if outbound_policy in OutboundQueue.POLICIES:
+            self.outbound_policy = outbound_policy
+        else:
+            raise ValueError("outbound_policy must be one of " + ", ".join(OutboundQueue.POLICIES))
+
+        # the max number of bytes queued across every client
+        if max_outbound_bytes is not None and (not isinstance(max_outbound_bytes, int) or max_outbound_bytes <= 0):
+            raise TypeError("max_outbound_bytes must be None or an int greater than 0")
+
+        # the max number of file transfers which run at once
+        if not isinstance(max_file_transfers, int) or max_file_transfers <= 0:
+            raise TypeError("max_file_transfers must be an int greater than 0")
+
+        # the number of registrations which run at once, the number which may wait, the rate they start at, and the
+        # number of connections one IP address may have
+        if not isinstance(max_registrations, int) or max_registrations <= 0:
+            raise TypeError("max_registrations must be an int greater than 0")
+
+        if not isinstance(max_pending_registrations, int) or max_pending_registrations <= 0:
+            raise TypeError("max_pending_registrations must be an int greater than 0")
+
+        if registration_rate is not None and (not isinstance(registration_rate, (int, float)) or registration_rate <= 0):
+            raise TypeError("registration_rate must be None or a number greater than 0 representing registrations per"
+                            + " second")
+
+        if max_connections_per_ip is not None and (not isinstance(max_connections_per_ip, int)
+                                                   or max_connections_per_ip <= 0):
+            raise TypeError("max_connections_per_ip must be None or an int greater than 0")
+
+        # what happens to a connection which arrives while the registration stage is busy
+        if registration_overload not in RegistrationAdmission.POLICIES:
+            raise ValueError("registration_overload must be one of " + ", ".join(RegistrationAdmission.POLICIES))
+
+        # the time a new client has to give its info, also the longest a queued registration may wait
+        if isinstance(registration_timeout, (int, float)) and registration_timeout > 0:
+            self.registration_timeout = registration_timeout
+        else:
+            raise TypeError("registration_timeout must be a number greater than 0 representing time in seconds")
+
         # <> Instantiate Private Class Variables <>
+        # runs registrations on workers of their own, refusing or queueing the connections over its limits
+        self.__admission = RegistrationAdmission(self.__register_client, max_registrations, max_pending_registrations,
+                                                 registration_rate, max_connections_per_ip, registration_overload,
+                                                 registration_timeout, logging_id=logging_id + "[Admission]",
+                                                 logging_level=logging_level)
+
+        # memory budget shared by the outbound queues of every client so slow clients can not use up the memory
+        self.__outbound_budget = OutboundBudget(max_outbound_bytes)
+
+        # token bucket limiting the rate connections are accepted at (None if the rate is unlimited)
+        self.__accept_limiter = None
+
+        # the ceiling on accepted connections per second
+        self.accept_rate = accept_rate
+
+        # the size of the listening socket's backlog
+        self.__backlogged_connections = backlogged_connections
+
         # socket that will be used for accepting new clients
         self.__connection_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-        # a pool of connected clients
-        self.__client_pool = []
+        # a registry of connected clients indexed by uuid, instance id, and type
+        self.__clients = ClientRegistry()
 
         # a list of device types
         self.__device_types = {}
 
+        # the handler workers and process pools of the device types which declared their own, indexed by type
+        self.__type_dispatchers = {}
+        self.__type_processes = {}
+
+        # interns the type names of the clients and gives each added device type an id for binary handshakes
+        self.__types = TypeTable()
+
         # logger object and setup
         if isinstance(logging_id, str):
             # logger object
@@ -79,6 +210,13 @@ class Manager:
         # true if the socket is using SSL
         self.__ssl_enabled = False
 
+        # let several processes bind the same host and port, the kernel spreads new connections across them
+        if reuse_port:
+            if not hasattr(socket, "SO_REUSEPORT"):
+                raise ValueError("reuse_port is not supported on this platform")
+
+            self.__connection_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
         # attempt to bind the socket to the provided host and port
         try:
             # try binding
@@ -96,51 +234,52 @@ class Manager:
 
             # set the socket as a listening socket
             self.__connection_socket.listen(backlogged_connections)
+            self.__backlogged_connections = backlogged_connections
 
         # in the case a socket error is raised
         except socket.error:
             raise Exception("Unable to set the socket as ")
 
-        # if a SSL context is provided then try and wrap the socket
-        if ssl_context is not None and isinstance(ssl_context, ssl.SSLContext):
-            # try to use the SSL context provided
-            try:
-                # create a SSLSocket using the provided ssl_context
-                self.__connection_socket = \
-                    ssl_context.wrap_socket(self.__connection_socket, server_side=True)
+        # if a SSL context is not the proper type fall back to a default server context
+        if ssl_context is not None and not isinstance(ssl_context, ssl.SSLContext):
+            # logging output
+            self.logger.error("(Constructor) ssl_context is not the proper type, please provide a sll.SSLContext."
+                              + " Defaulting to ssl.create_default_context(). Do not use this in a production"
+                              + " application.")
 
-                # set __ssl_enabled as true
-                self.__ssl_enabled = True
+            ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
 
-                # logging output
-                self.logger.info("(Constructor) Provided SSL context used to wrap socket successfully.")
+        # the listening socket is never wrapped, each accepted connection is wrapped and its handshake is run on the
+        # handshake workers so a slow client can not hold up the connection listener
+        self.__handshaker = None
 
-            # in the case of a SSLError
-            except ssl.SSLError as error:
-                # logging output
-                self.logger.error("(Constructor)  Unable to create SSL socket using the provided SSL context due to the"
-                                  + " following SSLError: " + str(error) + ". Defaulting to the depreciated"
-                                  + " ssl.wrap_socket() method. Do not use this in a production application.")
+        if ssl_context is not None:
+            if not isinstance(max_handshakes, int) or max_handshakes <= 0:
+                raise TypeError("max_handshakes must be an int greater than 0")
 
-                # use the default ssl.wrap_socket method
-                self.__connection_socket = ssl.wrap_socket(self.__connection_socket)
+            if not isinstance(max_pending_handshakes, int) or max_pending_handshakes <= 0:
+                raise TypeError("max_pending_handshakes must be an int greater than 0")
 
-                # set __ssl_enabled as true
-                self.__ssl_enabled = True
+            if not isinstance(handshake_timeout, (int, float)) or handshake_timeout <= 0:
+                raise TypeError("handshake_timeout must be a number greater than 0 representing time in seconds")
 
-        # if the ssl_context provided
-        elif ssl_context is not None and not isinstance(ssl_context, ssl.SSLContext):
-            # logging output
-            self.logger.error("(Constructor) ssl_context is not the proper type, please provide a sll.SSLContext."
-                              + " Defaulting to the depreciated ssl.wrap_socket() method. Do not use this in a"
-                              + " production application.")
+            # the number of session tickets sent so clients can resume their session, setting it changes ssl_context
+            # itself (num_tickets and OP_NO_TICKET) which affects every server sharing the context, None leaves the
+            # context as it is
+            if tls_session_tickets is not None and (not isinstance(tls_session_tickets, int) or tls_session_tickets < 0):
+                raise TypeError("tls_session_tickets must be None or an int greater than or equal to 0")
 
-            # use the default ssl.wrap_socket method
-            self.__connection_socket = ssl.wrap_socket(self.__connection_socket)
+            self.__handshaker = TLSHandshaker(ssl_context, self.__handshake_done, max_handshakes,
+                                              max_pending_handshakes, handshake_timeout, tls_session_tickets,
+                                              self.__admission.abandon, logging_id=logging_id + "[TLS Handshaker]",
+                                              logging_level=logging_level)
 
             # set __ssl_enabled as true
             self.__ssl_enabled = True
 
+            # logging output
+            self.logger.info("(Constructor) Connections will be wrapped using the provided SSL context.")
+
         # <> Greenlet Setup and Initialization <>
         # a gevent ThreadPool which will be used when the manager needs to create temporary greenlets
         self.__executor = gevent.get_hub().threadpool
@@ -148,77 +287,364 @@ class Manager:
         # default thread pool used for async socket operations
         self.__thread_executor = ThreadPoolExecutor(max_workers=max_workers)
 
+        # small thread pool which only writes control packets (handshakes, heartbeats), so they are never queued behind
+        # bulk data on the thread executor
+        if not isinstance(control_workers, int) or control_workers <= 0:
+            raise TypeError("control_workers must be an int greater than 0")
+
+        self.__control_executor = ThreadPoolExecutor(max_workers=control_workers, thread_name_prefix="Control")
+
+        # runs the message handlers of different clients at the same time while the handlers of one client run one at a
+        # time in the order its messages arrived, the message listener waits once max_pending_messages are queued
+        if not isinstance(handler_workers, int) or handler_workers <= 0:
+            raise TypeError("handler_workers must be an int greater than 0")
+
+        if not isinstance(max_pending_messages, int) or max_pending_messages <= 0:
+            raise TypeError("max_pending_messages must be an int greater than 0")
+
+        self.__dispatcher = KeyedDispatcher(handler_workers, max_pending_messages,
+                                            logging_id=logging_id + "[Dispatcher]", logging_level=logging_level)
+
+        # the time the messages of a client are collected for before they are handed to the on_message_batch handlers,
+        # 0 hands over the messages of each socket read, and the max number of messages in one batch
+        if isinstance(batch_window, (int, float)) and batch_window >= 0:
+            self.batch_window = batch_window
+        else:
+            raise TypeError("batch_window must be a number greater than or equal to 0 representing time in seconds")
+
+        if isinstance(max_batch_size, int) and max_batch_size > 0:
+            self.max_batch_size = max_batch_size
+        else:
+            raise TypeError("max_batch_size must be an int greater than 0")
+
+        # the batches being collected as (client, due time, packets) tuples indexed by instance id, only used by the
+        # message listener
+        self.__batches = {}
+
+        # true if the general messages handler takes batches, and the device types whose handler takes batches
+        self.__batch_messages = self.__overrides_batch(self.on_message_batch, Manager)
+        self.__batched_types = set()
+
+        # keeps the windowed aggregates of the record fields listed by each device type's aggregate (see
+        # Manager.device_aggregate() and Manager.type_aggregate()), handlers may add their own keys to it
+        if aggregator is None:
+            aggregator = Aggregator(logging_id=logging_id + "[Aggregator]", logging_level=logging_level)
+        elif not isinstance(aggregator, Aggregator):
+            raise TypeError("aggregator must be an Aggregator or None")
+
+        self.aggregator = aggregator
+
+        # sends one encoded packet to many clients in batches sized to the thread executor
+        self.__broadcaster = Broadcaster(self.__thread_executor, max_workers, control_executor=self.__control_executor)
+
+        # schedules the heartbeat of each client spread across the heartbeat_rate, replies are matched by the message
+        # listener so no worker is ever left waiting on one (with passive_heartbeat any message counts as a reply and
+        # only clients which have been quiet for the heartbeat_rate are sent a heartbeat)
+        self.__heartbeats = HeartbeatScheduler(self.__send_heartbeats, self.__heartbeat_expired, heartbeat_rate,
+                                               heartbeat_timeout, heartbeat_jitter, passive_heartbeat,
+                                               logging_id=logging_id + "[Heartbeat Scheduler]",
+                                               logging_level=logging_level)
+
+        # sends files from disk to clients without copying them into python, capped at max_file_transfers at once
+        self.__files = FileDistributor(max_file_transfers, logging_id=logging_id + "[File Distributor]",
+                                       logging_level=logging_level)
+
+        # readiness based receive engine which tells the message listener which clients have data waiting
+        self.__receiver = ReceiveEngine(logging_id=logging_id + "[Receive Engine]", logging_level=logging_level)
+
+        # readiness based engine which tells the write listener which stalled clients can take more data, so no worker
+        # ever waits on a client which is not reading
+        self.__writer = ReceiveEngine(selectors.EVENT_WRITE, logging_id=logging_id + "[Write Engine]",
+                                      logging_level=logging_level)
+
+        # clients waiting for their socket to take more data and the deadline for it, indexed by instance id
+        self.__stalled = {}
+        self.__stalled_lock = threading.Lock()
+
         # list of core threads
         self.__main_threads = []
 
-    # run on a greenlet and is what connects new devices to the manager
+        # set once Manager.stop() is called, the core loops exit once it is set
+        self.__stopping = threading.Event()
+
+        # set once the message listener has exited
+        self.__message_listener_done = threading.Event()
+
+        # set once the manager has stopped, Manager.run() blocks on it
+        self.__stopped = threading.Event()
+
+    # the delay between heartbeat messages
+    @property
+    def heartbeat_rate(self) -> float:
+        """
+        The delay, in seconds, between heartbeat checks of a client.
+
+        :return: float
+        """
+        return self.__heartbeats.rate
+
+    @heartbeat_rate.setter
+    def heartbeat_rate(self, heartbeat_rate: float):
+        if not isinstance(heartbeat_rate, (int, float)):
+            raise TypeError("heartbeat_rate must be a number representing delay in seconds")
+
+        self.__heartbeats.rate = heartbeat_rate
+
+    # the time a client has to respond to a heartbeat
+    @property
+    def heartbeat_timeout(self) -> float:
+        """
+        The time, in seconds, a client has to respond to a heartbeat before being removed.
+
+        :return: float
+        """
+        return self.__heartbeats.timeout
+
+    @heartbeat_timeout.setter
+    def heartbeat_timeout(self, heartbeat_timeout: float):
+        if not isinstance(heartbeat_timeout, (int, float)):
+            raise TypeError("heartbeat_timeout must be a number representing time in seconds")
+
+        self.__heartbeats.timeout = heartbeat_timeout
+
+    # the max number of connections accepted per second
+    @property
+    def accept_rate(self) -> Union[float, None]:
+        """
+        The max number of connections the Manager will accept per second, None if the rate is unlimited. Can be
+        changed while the Manager is running.
+
+        :return: float or None
+        """
+        return None if self.__accept_limiter is None else self.__accept_limiter.rate
+
+    @accept_rate.setter
+    def accept_rate(self, accept_rate: Union[float, None]):
+        # None removes the ceiling
+        if accept_rate is None:
+            self.__accept_limiter = None
+            return
+
+        if not isinstance(accept_rate, (int, float)) or accept_rate <= 0:
+            raise TypeError("accept_rate must be None or a number greater than 0 representing connections per second")
+
+        # update the existing limiter so the tokens it has are kept
+        if self.__accept_limiter is not None:
+            self.__accept_limiter.rate = accept_rate
+            self.__accept_limiter.capacity = max(1.0, accept_rate)
+        else:
+            self.__accept_limiter = TokenBucket(accept_rate)
+
+    # the size of the listening socket's backlog
+    @property
+    def backlogged_connections(self) -> int:
+        """
+        The number of backlogged connections the listening socket can have before it refuses new clients. Can be
+        changed while the Manager is running.
+
+        :return: int
+        """
+        return self.__backlogged_connections
+
+    @backlogged_connections.setter
+    def backlogged_connections(self, backlogged_connections: int):
+        if not isinstance(backlogged_connections, int):
+            raise TypeError("backlogged_connections must be type int")
+
+        # calling listen again on a listening socket resizes its backlog
+        self.__connection_socket.listen(backlogged_connections)
+        self.__backlogged_connections = backlogged_connections
+
+        # logging output
+        self.logger.info("(Backlog) Listening socket backlog set to '" + str(backlogged_connections) + "'.")
+
+    # run on a thread and is what connects new devices to the manager
     def __connection_listener(self):
         # log on init
         self.logger.debug("(Connection Listener) Starting process...")
 
-        while True:
-            try:
-                # await a connection to the socket waiting for clients
-                client_connection, client_address = self.__connection_socket.accept()
+        # accept without blocking so the backlog can be drained until it is empty
+        self.__connection_socket.setblocking(False)
+
+        # selector used to wait for the listening socket to have pending connections
+        selector = selectors.DefaultSelector()
+        selector.register(self.__connection_socket, selectors.EVENT_READ)
+
+        while not self.__stopping.is_set():
+            # wait for a pending connection
+            if not selector.select(1.0):
+                continue
+
+            # drain the backlog in batches as fast as the kernel hands over connections
+            for _ in range(self.accept_batch_size):
+                try:
+                    # accept a pending connection
+                    client_connection, client_address = self.__connection_socket.accept()
+
+                # the backlog is empty
+                except (BlockingIOError, socket.timeout):
+                    break
+
+                # other socket errors such as running out of file descriptors, back off before trying again
+                except socket.error as exception:
+                    self.logger.error("(Connection Listener) Unable to accept connection. Exception: "
+                                      + str(exception))
+                    gevent.sleep(0.1)
+                    break
 
                 # logging output
                 self.logger.info("(Connection Listener) New Client Connection Established. Client IP Address: '"
                                  + str(client_address[0]) + "'")
 
-                # hand over the client connection and address to a temporary greenlet which will get the data of the new
-                # client
-                self.__thread_executor.submit(self.__register_client, client_connection, client_address)
+                # refuse connections over the registration limits before any work is done for them
+                if not self.__admission.admit(client_address):
+                    client_connection.close()
+                    continue
 
-            # catch any SSL errors and let the user know about them so they can fix them on the client end
-            except ssl.SSLError as exception:
-                self.logger.error("(Connection Listener) Error occurred in the connection_listener greenlet."
-                                  " Exception: " + str(exception))
-            finally:
-                # yield greenlet
-                gevent.sleep(0.1)
+                # hand over the client connection and address to the registration workers which will get the data of
+                # the new client, SSL connections complete their handshake on the handshake workers first
+                if self.__handshaker is not None:
+                    self.__handshaker.submit(client_connection, client_address)
+                else:
+                    self.__admission.register(client_connection, client_address)
+
+                # wait for the accept rate ceiling if one is set
+                limiter = self.__accept_limiter
+                if limiter is not None:
+                    limiter.acquire()
+
+        # stop listening, connections still in the backlog are refused
+        selector.close()
+        self.__connection_socket.close()
+
+        # logging output
+        self.logger.debug("(Connection Listener) Stopped.")
+
+    # called by the handshake workers with each connection which completed its SSL handshake
+    def __handshake_done(self, connection: ssl.SSLSocket, address: tuple):
+        # the manager was stopped during the handshake
+        if self.__stopping.is_set():
+            connection.close()
+            self.__admission.abandon(address)
+            return
+
+        self.__admission.register(connection, address)
+
+    # registration admission counters
+    def registration_stats(self) -> dict:
+        """
+        Get the counters of the registration stage: the number of connections admitted, refused because too many
+        registrations were waiting (rejected_full), because the registration_rate was spent (rejected_rate) or because
+        of max_connections_per_ip (rejected_ip), and dropped after waiting longer than the registration_timeout
+        (expired), along with the number of registrations pending.
+
+        :return: dict
+        """
+        return self.__admission.stats()
+
+    # message dispatch counters
+    def dispatch_stats(self, device_type: str = None) -> dict:
+        """
+        Get the counters of the handler workers: the number of handlers queued or running (pending) and running, the
+        number of clients with handlers pending (keys) and the most handlers queued for one client (max_depth), the
+        most handlers pending at once (peak_pending), the number of times the message listener waited because the
+        workers were full (waits), and the number of messages dropped by a device type's overload policy.
+
+        :param device_type: Get the counters of the workers which run the handlers of a device type, None gets the
+                            counters of the Manager's workers.
+        :return: dict
+        """
+
+        if device_type is None:
+            return self.__dispatcher.stats()
+
+        return self.__type_dispatchers.get(device_type, self.__dispatcher).stats()
+
+    # the windowed aggregates of a field of a device
+    def device_aggregate(self, unique_id: str, field: str, window: float = None,
+                         percentiles: tuple = (0.5, 0.9, 0.99)) -> Union[dict, None]:
+        """
+        Get the count, sum, min, max and mean of a record field one device sent within a window, and estimates of its
+        percentiles if its type keeps device_sketches. The field must be listed in the aggregate of the device's type.
+
+        :param unique_id: The UUID of the device.
+        :param field: The name of the field.
+        :param window: The length of the window in seconds ending now, None uses every bucket the Aggregator keeps.
+        :param percentiles: The percentiles to estimate as fractions (ex. 0.99).
+        :return: dict or None if the device sent no values of the field within the window.
+        """
+        return self.aggregator.query(Aggregator.device_key(unique_id, field), window, percentiles)
+
+    # the windowed aggregates of a field of every device of a type
+    def type_aggregate(self, device_type: str, field: str, window: float = None,
+                       percentiles: tuple = (0.5, 0.9, 0.99)) -> Union[dict, None]:
+        """
+        Get the count, sum, min, max, mean and estimates of the percentiles of a record field sent by every device of a
+        type within a window. The field must be listed in the aggregate of the device type.
+
+        :param device_type: The device type as a str.
+        :param field: The name of the field.
+        :param window: The length of the window in seconds ending now, None uses every bucket the Aggregator keeps.
+        :param percentiles: The percentiles to estimate as fractions (ex. 0.99).
+        :return: dict or None if no device of the type sent values of the field within the window.
+        """
+        return self.aggregator.query(Aggregator.type_key(device_type, field), window, percentiles)
+
+    # SSL handshake counters
+    def tls_metrics(self) -> Union[dict, None]:
+        """
+        Get the counters of the SSL handshakes run by the Manager: the number completed, resumed (using a session
+        ticket), failed, timed out, and rejected (too many waiting), the number pending, and the mean and max latency
+        and the mean and total CPU time of a completed handshake in seconds.
+
+        :return: dict or None if SSL is not enabled.
+        """
+
+        if self.__handshaker is None:
+            return None
+
+        metrics = self.__handshaker.metrics.snapshot()
+        metrics["pending"] = self.__handshaker.pending()
+
+        return metrics
 
     # takes a client socket and address and awaits the data which identifies the client's type
-    def __register_client(self, connection: socket, address: tuple):
+    def __register_client(self, connection: socket, address: tuple) -> bool:
         try:
             # try to create the client while checking for errors
             try:
                 # create the client object (will also retrieve the client's info)
-                client = Client(connection, address, self.client_logging_level)
+                client = Client(connection, address, self.client_logging_level, self.max_frame_size,
+                                OutboundQueue(self.max_batch_bytes, high_watermark=self.outbound_high_watermark,
+                                              low_watermark=self.outbound_low_watermark, policy=self.outbound_policy,
+                                              budget=self.__outbound_budget),
+                                self.flush_window, self.__thread_executor, self.write_timeout, self.__watch_writable,
+                                self.__control_executor, self.__types)
 
                 # get the client's info
-                client.get_data()
+                client.get_data(self.registration_timeout)
 
                 # logging output
                 self.logger.info("(Client Registrar) Got the data of client '" + client.uuid()
                                  + "', adding client to pool.")
 
-            # in the case the client gave an invalid type
-            except Client.InvalidInfo:
+            # in the case the client gave an invalid type or closed the connection during the handshake
+            except (Client.InvalidInfo, Client.ConnectionEnd):
                 # logging output
                 self.logger.error("(Client Registrar) Failed to receive valid data from client client with IP '"
                                   + str(address[0]) + "', ending connection.")
 
+                # free the connection, it may already have been ended
+                client.end()
+
                 # exit the function early
-                return
+                return False
 
             # check if a client is already connected which shares a UUID, assume that it is a invalid connection of the
             # client which is trying to reconnect and remove the old connection
-            # go through all clients
-            for index, check_client in enumerate(self.__client_pool):
-                # check and see if the current client's UUID matches that of another client
-                if check_client.__uuid == client.uuid():
-                    # logging output
-                    self.logger.debug("(Client Registrar) Client with UUID '" + client.uuid() + "' has overridden a"
-                                      + " established connection. This was likely due to reconnection before a "
-                                      + "heartbeat check but could also be caused by two clients sharing a UUID.")
-
-                    # try to end the old client to end its connection if it still exists for some reason
-                    try:
-                        # send the checked client the end message
-                        check_client.end()
-                    finally:
-                        # remove the client
-                        self.__remove_client(check_client)
+            existing_client = self.__clients.get(client.uuid())
+            if existing_client is not None and self.__clients.remove(existing_client):
+                self.__replace_client(existing_client)
 
             # catch and exceptions within the general on_connect function
             try:
@@ -243,67 +669,131 @@ class Manager:
                     "(Client Registrar) Exception caught when running the on_connect() handler. For the " +
                     client.type() + " client type. Exception: '" + str(error) + "'")
 
-            # add the client to the pool
-            self.__client_pool.append(client)
+            # the manager was stopped while the client was registering
+            if self.__stopping.is_set():
+                client.end()
+                return False
 
-            # log the success
-            self.logger.info("(Client Registrar) Client with UUID '" + client.uuid() + "' successfully added to pool.")
+            # add the client to the pool, a connection sharing the UUID may have registered in the meantime
+            replaced_client = self.__clients.add(client)
+            if replaced_client is not None:
+                self.__replace_client(replaced_client)
 
-        except Exception as e:
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-            print(exc_tb.tb_lineno)
-            self.logger.warning("EXCEPTION IN REGISTRAR: " + str(e))
+            # start watching the client's socket for messages, the message listener becomes its only reader
+            client.attach_reader()
+            self.__receiver.register(client)
 
-    # heartbeat loop for checking if clients are still connected, run every x seconds based on the heartbeat_rate
-    def __heartbeat_checker(self):
-        # log on init
-        self.logger.debug("(Heartbeat Checker) Starting process...")
+            # start checking the client's heartbeat
+            self.__heartbeats.add(client)
 
-        while True:
-            # wait the delay for a heartbeat to be sent
-            gevent.sleep(self.heartbeat_rate)
+            # the client can now be found by its UUID
+            try:
+                self.on_registered(client)
+            except Exception as error:
+                self.logger.error("(Client Registrar) Exception caught when running the on_registered() hook."
+                                  + " Exception: '" + str(error) + "'")
 
-            # logging output
-            self.logger.info("(Heartbeat Checker) Starting client heartbeat check. Number of clients: '"
-                             + str(len(self.__client_pool)) + "'.")
+            # log the success
+            self.logger.info("(Client Registrar) Client with UUID '" + client.uuid() + "' successfully added to pool.")
+            return True
 
-            # check the heartbeat of the connected clients
-            for index in range(len(self.__client_pool) - 1, -1, -1):
-                # logging output
-                self.logger.debug("(Heartbeat Checker) Checking the heartbeat of client '"
-                                  + self.__client_pool[index].__uuid + "'.")
+        # log the traceback of any unexpected error so the connection is dropped without taking down the registrar
+        except Exception as error:
+            self.logger.exception("(Client Registrar) Exception caught when registering a client. Exception: '"
+                                  + str(error) + "'")
+            return False
 
-                # submit the heartbeat check to the executor
-                self.__thread_executor.submit(self.__heartbeat, index)
+    # end a connection which has been overridden by a new connection sharing its UUID, the connection must have
+    # already been removed from the registry
+    def __replace_client(self, client: Client):
+        # logging output
+        self.logger.debug("(Client Registrar) Client with UUID '" + client.uuid() + "' has overridden a"
+                          + " established connection. This was likely due to reconnection before a "
+                          + "heartbeat check but could also be caused by two clients sharing a UUID.")
 
-    # check the heartbeat of a client based on their given index
-    def __heartbeat(self, client_index):
-        client = self.__client_pool[client_index]
+        # try to end the old client to end its connection if it still exists for some reason
+        try:
+            # send the checked client the end message
+            client.end()
+        except socket.error:
+            pass
+        finally:
+            # run the disconnect handlers for the old connection
+            self.__disconnect_client(client)
 
+    # send heartbeat probes to the clients which are due for one, called by the heartbeat scheduler
+    def __send_heartbeats(self, clients: list):
         # logging output
-        self.logger.debug("(Heartbeat Checker for Client '" + client.__uuid
-                          + "') Initiating heartbeat check.")
+        self.logger.debug("(Heartbeat Checker) Sending heartbeat probes. Number of clients: '" + str(len(clients))
+                          + "'.")
+
+        # send the probes without waiting for them, the replies are picked up by the message listener
+        self.__broadcaster.broadcast(clients, Packet(HEARTBEAT, priority=PRIORITY_CONTROL))
 
+    # remove a client which did not reply to its heartbeat probe in time, called by the heartbeat scheduler
+    def __heartbeat_expired(self, client: Client):
+        # logging output
+        self.logger.error("(Heartbeat Checker for Client '" + str(client.uuid())
+                          + "') Client failed heartbeat check, removing from pool.")
+
+        # end the connection on the thread executor so the scheduler is never blocked by a dead socket
+        self.__thread_executor.submit(self.__end_client, client)
+
+    # end a client's connection and remove it from the pool
+    def __end_client(self, client: Client):
         try:
-            # check the heartbeat of the client
-            client.heartbeat(self.heartbeat_timeout)
+            # end the client's connection
+            client.end()
+        except socket.error:
+            pass
+        finally:
+            # remove the client
+            self.__remove_client(client)
 
-            # logging output
-            self.logger.debug("(Heartbeat Checker for Client '" + client.__uuid + "') Client passed heartbeat check.")
+    # wait for a stalled client's socket to take more data, called by the client when its send buffer is full
+    def __watch_writable(self, client: Client):
+        with self.__stalled_lock:
+            self.__stalled[client.instance_id] = (client, time.monotonic() + client.write_timeout)
 
-            return
-        except Client.ConnectionEnd:
-            try:
-                # end the client's connection
-                client.end()
-            finally:
-                # logging output
-                self.logger.error("(Heartbeat Checker for Client '" + client.__uuid
-                                  + "') Client failed heartbeat check, removing from pool.")
+        self.__writer.register(client)
+
+    # this loop continues the flushes of clients whose sockets can take more data again
+    def __write_listener(self):
+        """
+        Loop's and continues writing to stalled clients once they can take more data, disconnects clients which
+        stay stalled for longer than the write_timeout.
+
+        :return: None
+        """
+
+        # log on init
+        self.logger.debug("(Write Listener) Starting process...")
+
+        while not self.__stopping.is_set():
+            # continue the flush of each client which can take more data
+            for client in self.__writer.poll(1.0):
+                self.__writer.unregister(client)
+
+                with self.__stalled_lock:
+                    self.__stalled.pop(client.instance_id, None)
+
+                self.__thread_executor.submit(client.flush)
+
+            # find the clients which missed their write deadline
+            now = time.monotonic()
+
+            with self.__stalled_lock:
+                expired = [client for client, deadline in self.__stalled.values() if deadline <= now]
 
-                # remove the client
-                self.__remove_client(client)
+                for client in expired:
+                    del self.__stalled[client.instance_id]
+
+            for client in expired:
+                self.__writer.unregister(client)
+
+                # the message listener sees the connection end and removes the client
+                client.abort("Client stopped reading, no data was written for " + str(client.write_timeout)
+                             + " seconds.")
 
     # this loop checks for client messages to the server
     def __message_listener(self):
@@ -316,30 +806,117 @@ class Manager:
         # log on init
         self.logger.debug("(Message Listener) Starting process...")
 
-        # loop for the lifetime of the program
-        while True:
-            # loop through each client
-            for client in self.__client_pool:
-                # check if the client has sent some data
-                packet = client.recv(0)
+        try:
+            # loop until the manager is stopped
+            while not self.__stopping.is_set():
+                self.__receive_messages()
+        finally:
+            # hand over the batches still being collected
+            try:
+                for instance_id in list(self.__batches):
+                    self.__flush_batch(instance_id)
+            finally:
+                self.__message_listener_done.set()
+
+    # read and handle the messages of every client which has data ready
+    def __receive_messages(self):
+        """
+        Wait up to a second for clients to have data ready and send their messages to the handlers.
+
+        :return: None
+        """
+
+        # wait for data, but not past the time the first batch being collected is due
+        timeout = 1.0
+        if self.__batches:
+            timeout = min(timeout, max(0.0, min(batch[1] for batch in self.__batches.values()) - time.monotonic()))
+
+        # loop through each client which has data ready, idle clients are never touched
+        for client in self.__receiver.poll(timeout):
+            try:
+                # read every message the client has sent, one socket read can hold several messages
+                packets = client.recv_available()
+
+            # the client closed its end of the connection
+            except Client.ConnectionEnd:
+                # logging output
+                self.logger.info("(Message Listener) Client '" + str(client.uuid()) + "' closed the connection,"
+                                 + " removing from pool.")
+
+                # the messages collected so far are handled before the disconnect
+                if client.instance_id in self.__batches:
+                    self.__flush_batch(client.instance_id)
+
+                # end the client's side of the connection and remove it
+                self.__end_client(client)
+                continue
+
+            # true if the client's messages are handed to the handlers in batches
+            batched = self.__batch_messages or client.type() in self.__batched_types
+
+            # an empty list means only part of a message has arrived, wait for the client to be ready again
+            for packet in packets:
+                # a reply to a heartbeat probe, match it to the probe instead of handing it to the handlers
+                if packet.bytes == HEARTBEAT:
+                    self.__heartbeats.acknowledge(client)
+                    continue
+
+                # add the message to the client's batch, no Message object is made for it
+                if batched and not packet.is_stream():
+                    batch = self.__batches.get(client.instance_id)
+                    if batch is None:
+                        batch = self.__batches[client.instance_id] = (client, time.monotonic() + self.batch_window, [])
+
+                    batch[2].append(packet)
+
+                    if len(batch[2]) >= self.max_batch_size:
+                        self.__flush_batch(client.instance_id)
 
-                # if the client has sent no data move onto the next client
-                if packet is None:
                     continue
-                # if the client has sent some data then process it using the on_message function
+
+                # the batched messages the client sent first are handled first
+                if client.instance_id in self.__batches:
+                    self.__flush_batch(client.instance_id)
+
+                # logging message
+                self.logger.debug("(Message Listener) Data received from client '" + str(client.uuid()) + "'."
+                                  + " Sending data to appropriate handlers.")
+
+                # create a message
+                message = Message(client, packet)
+
+                # send the message to the handlers, the messages of a client are handled in order but never hold up
+                # the listener or the messages of other clients
+                if packet.is_stream():
+                    self.__dispatcher_of(client).submit(client.uuid(), self.__handle_stream, message)
                 else:
-                    # logging message
-                    self.logger.debug("(Message Listener) Data received from client '" + client.__uuid + "'."
-                                      + " Sending data to appropriate handlers.")
+                    self.__dispatcher_of(client).submit(client.uuid(), self.__handle_message, message)
+
+        # hand over the batches which are due
+        if self.__batches:
+            now = time.monotonic()
 
-                    # create a message
-                    message = Message(client, packet)
+            for instance_id in [instance_id for instance_id, batch in self.__batches.items() if batch[1] <= now]:
+                self.__flush_batch(instance_id)
 
-                    # submit data to the __handle_message function
-                    self.__executor.spawn(self.__handle_message(message))
+    # hand a client's batch of messages to the handlers
+    def __flush_batch(self, instance_id: str):
+        client, _, packets = self.__batches.pop(instance_id)
 
-            # yield
-            gevent.sleep(0.1)
+        # logging message
+        self.logger.debug("(Message Listener) " + str(len(packets)) + " messages received from client '"
+                          + str(client.uuid()) + "'. Sending the batch to appropriate handlers.")
+
+        self.__dispatcher_of(client).submit(client.uuid(), self.__handle_batch, client, packets)
+
+    # true if a handler object overrides the on_message_batch handler of its base class
+    @staticmethod
+    def __overrides_batch(handler, base: type) -> bool:
+        return getattr(handler, "__func__", None) is not base.on_message_batch
+
+    # the handler workers of a client, the workers of its device type if the type has its own
+    def __dispatcher_of(self, client: Client) -> KeyedDispatcher:
+        return self.__type_dispatchers.get(client.type(), self.__dispatcher)
 
     # function which is used to handle data sent from the client
     def __handle_message(self, message: Message):
@@ -373,15 +950,155 @@ class Manager:
                 "(Message Handler) Exception caught when running the on_message() handler for DeviceType '" +
                 message.client.type() + "." + "Exception: '" + str(error) + "'")
 
+    # function which is used to handle a batch of messages sent from the client
+    def __handle_batch(self, client: Client, packets: list):
+        """
+        Process a batch of messages by sending it to the on_message_batch handlers, or each message to the on_message
+        handlers if only one of the general handler and the device type's handler takes batches.
+
+        :param client: Client object which sent the messages.
+        :param packets: The Packet objects of the messages in the order they arrived.
+        :return: None
+        """
+
+        batch = MessageBatch(client, packets)
+
+        # catch and exceptions within the general handler, a failing message does not stop the rest of the batch
+        if self.__batch_messages:
+            try:
+                self.on_message_batch(batch)
+            except Exception as error:
+                self.logger.error("(Message Handler) Exception caught when running the on_message_batch() handler."
+                                  + " Exception: '" + str(error) + "'")
+        else:
+            for packet in packets:
+                try:
+                    self.on_message(Message(client, packet))
+                except Exception as error:
+                    self.logger.error("(Message Handler) Exception caught when running the on_message() handler."
+                                      + " Exception: '" + str(error) + "'")
+
+        # check if the user provided a device specific handler for this client's device type, if so execute it
+        device = self.__device_types.get(client.type())
+        if device is None:
+            return
+
+        # decode the records of a type with a schema in one step and update the aggregates of its fields
+        if getattr(device, "schema", None) is not None:
+            try:
+                records = device.schema.decode(batch.payloads())
+            except Exception as error:
+                self.logger.error("(Message Handler) Exception caught when decoding the records of DeviceType '"
+                                  + client.type() + "'. Exception: '" + str(error) + "'")
+                return
+
+            # a failed update of the aggregates does not keep the records from the handler
+            if getattr(device, "aggregate", None):
+                try:
+                    self.aggregator.add_records(client.type(), client.uuid(), device.schema, records, device.aggregate,
+                                                device.device_sketches)
+                except Exception as error:
+                    self.logger.error("(Message Handler) Exception caught when aggregating the records of DeviceType '"
+                                      + client.type() + "'. Exception: '" + str(error) + "'")
+
+            try:
+                device.on_records(batch, records)
+            except Exception as error:
+                self.logger.error("(Message Handler) Exception caught when running the on_records() handler for"
+                                  + " DeviceType '" + client.type() + "'. Exception: '" + str(error) + "'")
+
+        elif client.type() in self.__batched_types:
+            try:
+                device.on_message_batch(batch)
+            except Exception as error:
+                self.logger.error("(Message Handler) Exception caught when running the on_message_batch() handler for"
+                                  + " DeviceType '" + client.type() + "'. Exception: '" + str(error) + "'")
+        else:
+            for packet in packets:
+                try:
+                    device.on_message(Message(client, packet))
+                except Exception as error:
+                    self.logger.error("(Message Handler) Exception caught when running the on_message() handler for"
+                                      + " DeviceType '" + client.type() + "'. Exception: '" + str(error) + "'")
+
+    # function which is used to handle stream chunks sent from the client
+    def __handle_stream(self, message: Message):
+        """
+        Process a stream chunk by sending it to the on_stream handlers.
+
+        :param message: Message object containing a stream chunk Packet.
+        :return: None
+        """
+        # catch and exceptions within the general on_stream function
+        # noinspection PyBroadException
+        try:
+            # run the on_stream function for the client
+            self.on_stream(message)
+
+        # in case of a exception when executing handler
+        except Exception as error:
+            self.logger.error("(Message Handler) Exception caught when running the on_stream() handler. Exception: '"
+                              + str(error) + "'")
+
+        # catch and exceptions within the device specific on_stream function if any occur
+        # noinspection PyBroadException
+        try:
+            # check if the user provided a device specific handler for this client's device type, if so execute it
+            if message.client.type() in self.__device_types.keys():
+                self.__device_types[message.client.type()].on_stream(message)
+
+        # in case of a exception when executing handler
+        except Exception as error:
+            self.logger.error(
+                "(Message Handler) Exception caught when running the on_stream() handler for DeviceType '" +
+                message.client.type() + "." + "Exception: '" + str(error) + "'")
+
     # remove a client from the client pool and trigger the disconnect handler
     def __remove_client(self, client: Client):
         """
-        Remove a client from the manager's client pool.
+        Remove a client from the manager's client pool. Does nothing if the client was already removed.
 
         :param client: Client object to be removed from the client pool.
         :return: None
         """
 
+        # remove the client from the registry, only the first removal runs the disconnect handlers
+        if self.__clients.remove(client):
+            self.__disconnect_client(client)
+
+    # stop watching a removed client and run the disconnect handlers
+    def __disconnect_client(self, client: Client):
+        """
+        Stop watching a client which is no longer in the client pool and run the on_disconnect handlers.
+
+        :param client: Client object which was removed from the client pool.
+        :return: None
+        """
+
+        # the client no longer counts against its address
+        self.__admission.release(client.address)
+
+        # stop watching the client's socket and checking its heartbeat
+        self.__receiver.unregister(client)
+        self.__writer.unregister(client)
+        self.__heartbeats.remove(client)
+
+        with self.__stalled_lock:
+            self.__stalled.pop(client.instance_id, None)
+
+        # the disconnect handlers run after the handlers of the messages the client sent, they may be queued from a
+        # handler so they never wait for room
+        self.__dispatcher_of(client).submit(client.uuid(), self.__handle_disconnect, client, block=False)
+
+    # function which is used to run the disconnect handlers of a client
+    def __handle_disconnect(self, client: Client):
+        """
+        Run the on_disconnect handlers of a client which was removed from the client pool.
+
+        :param client: Client object which was removed from the client pool.
+        :return: None
+        """
+
         # catch and exceptions within the general on_connect function
         try:
             # run the on_connect function for the client
@@ -406,81 +1123,147 @@ class Manager:
                 "(Message Handler) Exception caught when running the on_disconnect() handler. For the " +
                 client.type() + " client type. Exception: '" + str(error) + "'")
 
-        # remove item from list
-        self.__client_pool = [x for x in self.__client_pool if x.instance_id != client.instance_id]
+        # free the aggregates of the device unless it has reconnected in the meantime
+        device = self.__device_types.get(client.type())
+        if getattr(device, "aggregate", None) and self.__clients.get(client.uuid()) is None:
+            for field in device.aggregate:
+                self.aggregator.remove(Aggregator.device_key(client.uuid(), field))
 
     # sends data to all clients
-    def send_all(self, data: packetable):
+    def send_all(self, data: packetable, priority: int = None) -> BroadcastResult:
         """
-        Send some data to all devices.
+        Send some data to all devices. The data is encoded into a Packet once and shared by every client.
 
-        :param data: str, int, bytes, bytearray, or Packet object
-        :return: None
+        :param data: str, bytes, bytearray, memoryview, or Packet object
+        :param priority: Optional outbound priority class (ReservedBytes.PRIORITY_*), None keeps the packet's priority.
+        :return: A BroadcastResult with the sent/failed/skipped counts and a future which resolves once every client
+                 has been handled.
         """
 
-        # for each client in the pool
-        for client in self.__client_pool:
-            # send the client the data
-            self.__thread_executor.submit(client.send, self.make_packet(data))
+        # encode the data once and send it to every client in the pool
+        return self.__broadcaster.broadcast(self.__clients.snapshot(), self.make_packet(data, priority))
 
     # sends data to all clients of a specified device_type
-    def send_type(self, device_type, data: packetable):
+    def send_type(self, device_type, data: packetable, priority: int = None) -> BroadcastResult:
         """
-        Send some data to all devices of a specific type.
+        Send some data to all devices of a specific type. The data is encoded into a Packet once and shared by every
+        client.
 
         :param device_type: Device type to broadcast to as a str.
-        :param data: str, int, bytes, bytearray, or Packet object
-        :return: None
+        :param data: str, bytes, bytearray, memoryview, or Packet object
+        :param priority: Optional outbound priority class (ReservedBytes.PRIORITY_*), None keeps the packet's priority.
+        :return: A BroadcastResult with the sent/failed/skipped counts and a future which resolves once every client
+                 has been handled.
         """
-        # for each client in the pool
-        for client in self.__client_pool:
-            # check if the client matches the provided type
-            if client.__type == device_type:
-                # send the client the data
-                self.__thread_executor.submit(client.send, self.make_packet(data))
+
+        # encode the data once and send it to every client of the provided type
+        return self.__broadcaster.broadcast(self.__clients.of_type(device_type), self.make_packet(data, priority))
 
     # sends data to a client given a uuid
-    def send(self, unique_id: str, data: packetable) -> bool:
+    def send(self, unique_id: str, data: packetable, priority: int = None) -> bool:
         """
         Send some data to a specific Client given their UUID.
 
         :param unique_id: The client's UUID as a str.
-        :param data: str, int, bytes, bytearray, or Packet object.
+        :param data: str, bytes, bytearray, memoryview, or Packet object.
+        :param priority: Optional outbound priority class (ReservedBytes.PRIORITY_*), None keeps the packet's priority.
+                         Queued packets of a higher priority are written first.
+        :return: True if the data was queued for the client, False if the client does not exist or its outbound queue
+                 is full. Raises Client.QueueFull if the outbound queue is full and the outbound_policy is "raise".
+        """
+
+        # look up the client with the provided uuid
+        client = self.__clients.get(unique_id)
+        if client is None:
+            return False
+
+        # queue the data for the client, a burst of sends to the client is written by a single flush on the thread
+        # executor
+        return client.post(self.make_packet(data, priority))
+
+    # streams data to a client given a uuid
+    def send_stream(self, unique_id: str, source, chunk_size: int = 65536) -> bool:
+        """
+        Stream a payload of any size to a specific Client given their UUID, see Client.send_stream(). The client must
+        be using protocol version 2.
+
+        :param unique_id: The client's UUID as a str.
+        :param source: A bytes-like object, a binary file object, or an iterable of bytes-like chunks.
+        :param chunk_size: The max size of each chunk in bytes.
         :return: If client exists: bool
         """
 
-        # for each client in the pool
-        for client in self.__client_pool:
-            # check if the client matches the provided uuid
-            if client.__uuid == unique_id:
-                # send the client the data
-                self.__thread_executor.submit(client.send, self.make_packet(data))
-                return True
-        return False
+        # look up the client with the provided uuid
+        client = self.__clients.get(unique_id)
+        if client is None:
+            return False
+
+        # stream the data to the client
+        self.__thread_executor.submit(client.send_stream, source, chunk_size)
+        return True
+
+    # sends a file from disk to one client, a device type, or every client
+    def send_file(self, path: str, unique_id: str = None, device_type: str = None, offset: int = 0,
+                  on_progress=None) -> dict:
+        """
+        Send a file, such as a firmware image, to a specific Client given their UUID, to all devices of a specific type,
+        or to all devices if neither is given. The file is sent from disk with os.sendfile (or from one shared mmap of
+        the file for SSL connections) so it is never copied into python per client. Clients using protocol version 2
+        receive the file as a stream, clients using protocol version 1 receive it as messages of up to 65535 bytes.
+
+        At most max_file_transfers transfers run at once, the rest are queued.
+
+        :param path: The path of the file to send.
+        :param unique_id: The client's UUID as a str.
+        :param device_type: Device type to send the file to as a str.
+        :param offset: The offset in the file to start sending from, a failed transfer can be resumed by passing
+                       FileTransfer.offset.
+        :param on_progress: Optional callable called with the FileTransfer after each chunk is sent.
+        :return: A dict of FileTransfer objects indexed by client uuid, empty if there are no matching clients.
+        """
+
+        # pick the target clients
+        if unique_id is not None:
+            client = self.__clients.get(unique_id)
+            clients = () if client is None else (client,)
+        elif device_type is not None:
+            clients = self.__clients.of_type(device_type)
+        else:
+            clients = self.__clients.snapshot()
+
+        return self.__files.distribute(path, clients, offset, on_progress)
 
     # converts a str, bytes, bytearray, or Packet into a Packet
     @staticmethod
-    def make_packet(data: packetable) -> Packet:
+    def make_packet(data: packetable, priority: int = None) -> Packet:
         """
         Make a packet out of any 'packetable' datatype.
 
         :param data: and packetable
-        :return: A new Packet object.
+        :param priority: Optional outbound priority class of the packet, None keeps the priority of a Packet object and
+                         uses PRIORITY_INTERACTIVE for other data. A Packet object with another priority is copied
+                         (sharing its buffers) so the caller's packet is left unchanged.
+        :return: A Packet object.
         """
 
         # if a string convert to Packet
         if isinstance(data, str):
-            return Packet(data.encode())
-        # bytes and bytearray conversion to Packet
-        if isinstance(data, bytes) or isinstance(data, bytearray):
-            return Packet(data)
+            packet = Packet(data.encode())
+        # bytes, bytearray, and memoryview conversion to Packet (the buffer is wrapped, not copied)
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            packet = Packet(data)
         # Packet object pass-through
-        if isinstance(data, Packet):
-            return data
+        elif isinstance(data, Packet):
+            packet = data
         # raise ValueError
         else:
             raise ValueError("Unable to parse data into Packet object.")
 
+        if priority is not None:
+            packet = packet.with_priority(priority)
+
+        return packet
+
     # returns an list of dictionaries storing the connected clients' information
     def get_client_data(self):
         """
@@ -493,7 +1276,7 @@ class Manager:
         info = []
 
         # loop through the clients and add their info to the list
-        for client in self.__client_pool:
+        for client in self.__clients.snapshot():
             # add the info for the given client
             info.append(client.return_data())
 
@@ -503,21 +1286,27 @@ class Manager:
     # event manager decorator function
     def event(self, coroutine):
         """
-        Decorator which allows for simple overwriting of the generic on_message, on_connect, and
-         on_disconnect functions.
+        Decorator which allows for simple overwriting of the generic on_message, on_connect, on_disconnect, and
+         on_stream functions.
 
-        :param coroutine: Function named on_connect, on_message, or on_disconnect.
+        :param coroutine: Function named on_connect, on_message, on_disconnect, or on_stream.
         :return: bool
         """
 
-        # handle general on_connect, on_message, and on_disconnect handlers
+        # handle general on_connect, on_message, on_message_batch, on_disconnect, and on_stream handlers
         if coroutine.__name__ == "on_connect" or coroutine.__name__ == "on_message" \
-                or coroutine.__name__ == "on_disconnect":
+                or coroutine.__name__ == "on_message_batch" or coroutine.__name__ == "on_disconnect" \
+                or coroutine.__name__ == "on_stream":
             # logging output
             self.logger.info("(Event Handler) '" + coroutine.__name__ + "' handler was added successfully.")
 
             # replaces the existing coroutine with the provided one
             setattr(self, coroutine.__name__, coroutine)
+
+            # messages are handed over in batches from now on
+            if coroutine.__name__ == "on_message_batch":
+                self.__batch_messages = True
+
             return True
         return False
 
@@ -538,11 +1327,86 @@ class Manager:
         if not isinstance(device.type, str):
             raise ValueError("device.type is not of type str")
 
+        # check the execution resources the device declared, a subclass which does not call DeviceType.__init__() shares
+        # the Manager's handler workers
+        workers = getattr(device, "workers", None)
+        processes = getattr(device, "processes", None)
+
+        if workers is not None:
+            if not isinstance(workers, int) or workers <= 0:
+                raise ValueError("device.workers must be None or an int greater than 0")
+
+            if not isinstance(device.max_pending, int) or device.max_pending <= 0:
+                raise ValueError("device.max_pending must be an int greater than 0")
+
+            if device.overload not in KeyedDispatcher.POLICIES:
+                raise ValueError("device.overload must be one of " + ", ".join(KeyedDispatcher.POLICIES))
+
+        if processes is not None and (not isinstance(processes, int) or processes <= 0):
+            raise ValueError("device.processes must be None or an int greater than 0")
+
+        # stop the workers of a device type which is being replaced, their queued handlers still run
+        replaced = self.__type_dispatchers.pop(device.type, None)
+        if replaced is not None:
+            replaced.shutdown(False)
+
+        replaced = self.__type_processes.pop(device.type, None)
+        if replaced is not None:
+            replaced.shutdown(False)
+
+        # give the device type its own workers so its handlers never wait on the handlers of other types
+        if workers is not None:
+            self.__type_dispatchers[device.type] = KeyedDispatcher(
+                workers, device.max_pending, policy=device.overload, thread_name_prefix="Handler " + device.type,
+                logging_id=self.logger.name + "[Dispatcher " + device.type + "]", logging_level=self.logger.level)
+
+        # processes for the CPU bound work of its handlers
+        if processes is not None:
+            self.__type_processes[device.type] = device.process_pool = ProcessPoolExecutor(processes)
+
+        # hand the type's messages over in batches if it takes them or decodes them into records
+        if self.__overrides_batch(device.on_message_batch, DeviceType) or getattr(device, "schema", None) is not None:
+            self.__batched_types.add(device.type)
+        else:
+            self.__batched_types.discard(device.type)
+
+        # the fields to aggregate must be fields of the type's records
+        aggregate = getattr(device, "aggregate", None)
+        if aggregate:
+            if device.schema is None:
+                raise ValueError("device.aggregate needs a device.schema to decode the fields from")
+
+            for field in aggregate:
+                if field not in device.schema.names:
+                    raise ValueError("device.aggregate field '" + str(field) + "' is not a field of device.schema")
+
+                if field not in device.schema.numeric:
+                    raise ValueError("device.aggregate field '" + str(field) + "' is not a number")
+
+        # let the type's handlers add their own values to the aggregator
+        device.aggregator = self.aggregator
+
         # add the device to the list of device types
         self.__device_types.update({device.type: device})
 
+        # give the type an id clients can send in a binary handshake
+        type_id = self.__types.register(device.type)
+
         # logging output
-        self.logger.debug("(Device Adder) Successfully added DeviceType '" + device.type + "' to the manager.")
+        self.logger.debug("(Device Adder) Successfully added DeviceType '" + device.type + "' to the manager with type"
+                          + " id " + str(type_id) + ".")
+
+    # the id of a device type
+    def type_id(self, device_type: str) -> Union[int, None]:
+        """
+        Get the id of a device type added with Manager.add_device(), clients can send it instead of the type's name in
+        a binary handshake (see Handshake.encode_info()). Ids are given in the order the device types are added, so
+        they stay the same across restarts as long as the types are added in the same order.
+
+        :param device_type: The device type as a str.
+        :return: int or None if the device type was not added.
+        """
+        return self.__types.id_of(device_type)
 
     # on connection function - run on client connection
     def on_connect(self, client: Client):
@@ -568,6 +1432,47 @@ class Manager:
         """
         return
 
+    # on message batch function - runs with the messages a client sent within the batch_window
+    def on_message_batch(self, batch: MessageBatch):
+        """
+        A empty implementation of the generic on_message_batch function, meant to be overwritten. Once it is
+        overwritten it runs in place of on_message.
+
+        Runs with the messages one device sent within the batch_window (at most max_batch_size of them, a batch_window
+        of 0 hands over the messages of each socket read), so high rate devices cost one call per batch instead of one
+        per message. Stream chunks are still handed to on_stream one at a time.
+
+        :param batch: MessageBatch object containing a Client and the Packets it sent, in the order they arrived.
+        :return: None
+        """
+        return
+
+    # on stream function - runs when a client sends a chunk of a stream to the server
+    def on_stream(self, message: Message):
+        """
+        A empty implementation of the generic on_stream function, meant to be overwritten.
+
+        Runs when any device sends a chunk of a stream to the manager (protocol version 2 only). The chunk is found in
+        message.packet.stream_data, the stream it belongs to in message.packet.stream_id, and
+        message.packet.is_stream_end() is True for the last chunk of a stream.
+
+        :param message: Message object containing a Client and a stream chunk Packet.
+        :return: None
+        """
+        return
+
+    # runs once a client has been added to the pool
+    def on_registered(self, client: Client):
+        """
+        A empty hook meant to be overwritten, runs on the registrar right after a client is added to the client pool
+        (unlike on_connect, which runs before), so the client can already be sent data by its UUID. A client which
+        fails to register after on_connect never reaches it.
+
+        :param client: Client object representing the registered client.
+        :return: None
+        """
+        return
+
     # on disconnect function - runs when the client disconnects from the server
     def on_disconnect(self, client: Client):
         """
@@ -587,7 +1492,8 @@ class Manager:
 
         Processes:
             - Manager.__connection_listener
-            - Manager.__heartbeat_checker
+            - HeartbeatScheduler.run
+            - Manager.__write_listener
             - Manager.__message_listener
 
         :return:
@@ -599,7 +1505,9 @@ class Manager:
         # add the core threads to the pool
         self.__main_threads.append(threading.Thread(target=self.__connection_listener, name="Connection Listener",
                                                     daemon=True))
-        self.__main_threads.append(threading.Thread(target=self.__heartbeat_checker, name="Heartbeat Checker",
+        self.__main_threads.append(threading.Thread(target=self.__heartbeats.run, name="Heartbeat Checker",
+                                                    daemon=True))
+        self.__main_threads.append(threading.Thread(target=self.__write_listener, name="Write Listener",
                                                     daemon=True))
         self.__executor.spawn(self.__message_listener)
 
@@ -622,10 +1530,11 @@ class Manager:
         # start all of the background threads
         self.__process_handler()
 
-    # runs start and creates a blocking loop
+    # runs start and blocks until the manager is stopped
     def run(self):
         """
-        Blocking version of Manager.start().
+        Blocking version of Manager.start(), returns once Manager.stop() has finished. A KeyboardInterrupt stops the
+        manager.
 
         :return: None
         """
@@ -633,6 +1542,93 @@ class Manager:
         # start the manager
         self.start()
 
-        # block
-        while True:
-            pass
+        # block without using the CPU until the manager is stopped
+        try:
+            self.__stopped.wait()
+        except KeyboardInterrupt:
+            self.stop()
+
+    # stops the manager
+    def stop(self, timeout: float = 10):
+        """
+        Stop the Manager. New connections are refused, the core threads are stopped once they finish what they are
+        doing, every queued packet is written, then every client's connection is ended and the handlers of the
+        messages already received and the on_disconnect handlers are run.
+
+        :param timeout: Max time in seconds to wait for the threads to stop and the queued packets to be written, a
+                        client which has not taken its packets in time is ended anyway.
+        :return: None
+        """
+
+        # another thread is already stopping the manager
+        if self.__stopping.is_set():
+            self.__stopped.wait(timeout)
+            return
+
+        # logging output
+        self.logger.info("(Stop) Stopping the manager.")
+
+        deadline = time.monotonic() + timeout
+
+        def remaining():
+            return max(0.0, deadline - time.monotonic())
+
+        # stop the core loops and wake the ones which are waiting
+        self.__stopping.set()
+        self.__heartbeats.stop()
+        self.__receiver.wake()
+        self.__writer.wake()
+
+        for thread in self.__main_threads:
+            thread.join(remaining())
+
+        self.__message_listener_done.wait(remaining())
+
+        # write what is left in every client's queue
+        clients = self.__clients.snapshot()
+        drains = [(client, self.__thread_executor.submit(client.drain, remaining())) for client in clients]
+        wait_futures([drain for _, drain in drains], remaining())
+
+        # end every connection and run the disconnect handlers, a client still being written to is aborted first so
+        # ending it does not wait on the write
+        for client, drain in drains:
+            if not drain.done():
+                client.abort("The manager stopped before the queued packets were written.")
+
+            self.__end_client(client)
+
+        # let the handlers of the messages received so far and the disconnect handlers finish
+        dispatchers = [self.__dispatcher] + list(self.__type_dispatchers.values())
+
+        for dispatcher in dispatchers:
+            if not dispatcher.join(remaining()):
+                self.logger.warning("(Stop) " + str(dispatcher.stats()["pending"]) + " handlers are still queued,"
+                                    + " stopping without waiting for them.")
+
+        # stop the workers, work still queued fails quickly now the connections are closed
+        for dispatcher in dispatchers:
+            dispatcher.shutdown(False)
+
+        for pool in self.__type_processes.values():
+            pool.shutdown(False)
+
+        self.__files.shutdown(False)
+        self.__admission.shutdown(False)
+        self.__control_executor.shutdown(False)
+
+        if self.__handshaker is not None:
+            self.__handshaker.shutdown(False)
+
+        self.__thread_executor.shutdown(False)
+
+        # the engines can only be closed once their threads are no longer polling them
+        if self.__message_listener_done.is_set():
+            self.__receiver.close()
+
+        if not any(thread.is_alive() for thread in self.__main_threads):
+            self.__writer.close()
+
+        self.__stopped.set()
+
+        # logging output
+        self.logger.info("(Stop) Manager stopped.")
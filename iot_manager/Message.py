@@ -17,3 +17,45 @@ class Message:
         :return: str
         """
         return
+
+
+# a batch of messages sent by one client
+class MessageBatch:
+    # batch containing a client and the packets it sent, in the order they arrived
+    def __init__(self, client: Client, packets: list):
+        self.client = client
+        self.packets = packets
+
+    def __len__(self):
+        return len(self.packets)
+
+    def __iter__(self):
+        return iter(self.packets)
+
+    # the payloads of the packets
+    def payloads(self) -> list:
+        """
+        The payload of each packet in the batch.
+
+        :return: A list of bytes-like objects.
+        """
+        return [packet.payload for packet in self.packets]
+
+    # the payloads of the packets joined into one buffer
+    def buffer(self) -> bytes:
+        """
+        The payloads of the packets joined into one contiguous buffer, useful when every message is a record of the
+        same size (see MessageBatch.sizes() otherwise).
+
+        :return: bytes
+        """
+        return b''.join(packet.payload for packet in self.packets)
+
+    # the sizes of the payloads
+    def sizes(self) -> list:
+        """
+        The size of each packet's payload, splits MessageBatch.buffer() back into messages.
+
+        :return: A list of ints.
+        """
+        return [packet.size for packet in self.packets]
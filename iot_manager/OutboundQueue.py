@@ -0,0 +1,356 @@
+# default lib imports
+import os
+import threading
+from collections import deque
+
+# module imports
+from .ReservedBytes import PRIORITY_CONTROL, PRIORITY_INTERACTIVE, PRIORITY_BULK
+
+# the max number of buffers one sendmsg call accepts
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+
+# a memory budget shared by the outbound queues of every client
+class OutboundBudget:
+    def __init__(self, max_bytes: int = None):
+        # lock guarding the count
+        self.__lock = threading.Lock()
+
+        # the max number of bytes queued across every client, None for no limit
+        self.max_bytes = max_bytes
+
+        # the number of bytes queued across every client
+        self.__used = 0
+
+    # the number of bytes queued across every client
+    @property
+    def used(self) -> int:
+        """
+        The number of bytes queued across every client.
+
+        :return: int
+        """
+        return self.__used
+
+    # take bytes out of the budget
+    def reserve(self, size: int) -> bool:
+        """
+        Take bytes out of the budget if there is room for them.
+
+        :param size: The number of bytes to reserve.
+        :return: True if the bytes were reserved, False if the budget is spent.
+        """
+
+        with self.__lock:
+            if self.max_bytes is not None and self.__used + size > self.max_bytes:
+                return False
+
+            self.__used += size
+            return True
+
+    # give bytes back to the budget
+    def release(self, size: int):
+        """
+        Give bytes back to the budget once they have left a queue.
+
+        :param size: The number of bytes to release.
+        :return: None
+        """
+
+        with self.__lock:
+            self.__used -= size
+
+
+# frames waiting to be written to a client, taken in batches so several frames go out in one write, with one lane per
+# priority class so control frames are never stuck behind bulk data
+class OutboundQueue:
+    # an exception raised when a frame does not fit in the queue
+    class QueueFull(Exception):
+        pass
+
+    # what happens to a frame which does not fit in the queue
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    DISCONNECT = "disconnect"
+    RAISE = "raise"
+    POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT, RAISE)
+
+    def __init__(self, max_batch_bytes: int = 262144, max_batch_buffers: int = IOV_MAX, high_watermark: int = None,
+                 low_watermark: int = None, policy: str = DROP_NEWEST, budget: OutboundBudget = None,
+                 max_control_frames: int = 64):
+        if policy not in self.POLICIES:
+            raise ValueError("policy must be one of " + ", ".join(self.POLICIES))
+
+        # lock guarding the queue, never held while writing
+        self.__lock = threading.Lock()
+
+        # the frames in send order as tuples of (buffers, size in bytes), one lane per priority class
+        self.__lanes = tuple(deque() for _ in range(PRIORITY_BULK + 1))
+
+        # the number of bytes queued in the interactive and bulk lanes (control frames are small and skip the watermarks
+        # so they are never stuck behind application data)
+        self.__bytes = 0
+
+        # the number of bytes queued in the control lane, counted against the budget, and the contents of the queued
+        # control frames so a frame identical to one already waiting (ex. a second heartbeat) is not queued again
+        self.__control_bytes = 0
+        self.__control_frames = set()
+
+        # the max number of control frames queued, a client which stops reading can not make them pile up
+        self.max_control_frames = max_control_frames
+
+        # the max number of bytes in one batch, a single frame larger than this is sent as a batch on its own
+        self.max_batch_bytes = max_batch_bytes
+
+        # the max number of buffers in one batch
+        self.max_batch_buffers = max(1, max_batch_buffers)
+
+        # the number of queued bytes at which the queue is full, None for no limit (a frame is always accepted by an
+        # empty queue so a single frame larger than the watermark can still be sent)
+        self.high_watermark = high_watermark
+
+        # once full the queue refuses frames until it has drained to this many bytes
+        self.low_watermark = low_watermark if low_watermark is not None or high_watermark is None \
+            else high_watermark // 2
+
+        # what happens to a frame which does not fit (drop_oldest evicts queued frames to make room for it)
+        self.policy = policy
+
+        # memory budget shared with the queues of other clients, None for no shared limit
+        self.__budget = budget
+
+        # true from when the queue fills up until it drains to the low watermark
+        self.__full = False
+
+        # the number of frames dropped because they did not fit
+        self.dropped = 0
+
+        # true while a flush of the queue is pending, so a burst of frames schedules only one flush
+        self.__flush_scheduled = False
+
+        # true while a flush of just the control lane is pending
+        self.__control_flush_scheduled = False
+
+    # the number of frames queued
+    def __len__(self) -> int:
+        return sum(len(lane) for lane in self.__lanes)
+
+    # the number of bytes queued
+    def pending_bytes(self) -> int:
+        """
+        Get the number of bytes waiting to be written, not counting control frames.
+
+        :return: int
+        """
+        return self.__bytes
+
+    # check if the queue is refusing frames
+    def is_full(self) -> bool:
+        """
+        Check if the queue has filled up to the high watermark and not yet drained to the low watermark.
+
+        :return: bool
+        """
+        return self.__full
+
+    # check if a frame fits, must be called with the lock held
+    def __fits(self, size: int) -> bool:
+        # an empty queue takes any frame
+        if not self.__bytes:
+            return True
+
+        # dropping the oldest frames makes room right away, so there is no need to wait for the low watermark
+        if self.__full and self.policy != self.DROP_OLDEST:
+            return False
+
+        return self.high_watermark is None or self.__bytes + size <= self.high_watermark
+
+    # remove the oldest frame of the lowest priority, never one of a higher priority than the given priority, must be
+    # called with the lock held
+    def __drop_oldest(self, priority: int) -> bool:
+        for lane in reversed(self.__lanes[priority:]):
+            if lane:
+                _, size = lane.popleft()
+                self.__bytes -= size
+                self.dropped += 1
+
+                if self.__budget is not None:
+                    self.__budget.release(size)
+
+                return True
+
+        return False
+
+    # the contents of a control frame, control frames are a few bytes so they are compared by value
+    @staticmethod
+    def __contents(buffers: list) -> bytes:
+        return b''.join(bytes(buffer) for buffer in buffers)
+
+    # add a frame to the end of the queue
+    def put(self, buffers: list, priority: int = PRIORITY_INTERACTIVE) -> bool:
+        """
+        Add a frame to the end of its priority's lane. Control frames skip the watermarks, a control frame identical
+        to one already queued is not queued again and at most max_control_frames are queued.
+
+        :param buffers: The frame as a list of bytes-like objects (see Packet.buffers()).
+        :param priority: The priority class of the frame (PRIORITY_CONTROL, PRIORITY_INTERACTIVE, or PRIORITY_BULK).
+        :return: True if no flush which will write the frame was pending and the caller should schedule one (a control
+                 flush for control frames), otherwise False. Raises OutboundQueue.QueueFull if the frame does not fit
+                 (with drop_oldest only once every lower or equal priority frame has been dropped), the caller applies
+                 the other policies.
+        """
+
+        if not PRIORITY_CONTROL <= priority <= PRIORITY_BULK:
+            raise ValueError("Unknown priority '" + str(priority) + "'.")
+
+        size = sum(memoryview(buffer).nbytes for buffer in buffers)
+
+        with self.__lock:
+            # control frames skip the watermarks and get their own flush
+            if priority == PRIORITY_CONTROL:
+                contents = self.__contents(buffers)
+
+                # the same frame is already waiting to be written, along with the flush which will write it
+                if contents in self.__control_frames:
+                    return False
+
+                if len(self.__lanes[PRIORITY_CONTROL]) >= self.max_control_frames:
+                    self.dropped += 1
+                    raise self.QueueFull("The outbound queue is full (" + str(self.max_control_frames)
+                                         + " control frames queued).")
+
+                if self.__budget is not None:
+                    # free budget from this queue's oldest application frames
+                    while not self.__budget.reserve(size):
+                        if self.policy != self.DROP_OLDEST or not self.__drop_oldest(PRIORITY_INTERACTIVE):
+                            self.dropped += 1
+                            raise self.QueueFull("The outbound memory budget is spent (" + str(self.__budget.used)
+                                                 + " bytes queued across every client).")
+
+                self.__lanes[PRIORITY_CONTROL].append((buffers, size))
+                self.__control_bytes += size
+                self.__control_frames.add(contents)
+
+                schedule = not self.__control_flush_scheduled
+                self.__control_flush_scheduled = True
+
+                return schedule
+
+            # make room by dropping the oldest frames, lowest priority first
+            if self.policy == self.DROP_OLDEST:
+                while not self.__fits(size) and self.__drop_oldest(priority):
+                    pass
+
+            # the queue is over its high watermark
+            if not self.__fits(size):
+                self.__full = True
+                self.dropped += 1
+                raise self.QueueFull("The outbound queue is full (" + str(self.__bytes) + " bytes queued).")
+
+            if self.__budget is not None:
+                # free budget from this queue's oldest frames
+                while not self.__budget.reserve(size):
+                    if self.policy != self.DROP_OLDEST or not self.__drop_oldest(priority):
+                        self.dropped += 1
+                        raise self.QueueFull("The outbound memory budget is spent (" + str(self.__budget.used)
+                                             + " bytes queued across every client).")
+
+            self.__lanes[priority].append((buffers, size))
+            self.__bytes += size
+
+            # the queue has filled up
+            if self.high_watermark is not None and self.__bytes >= self.high_watermark:
+                self.__full = True
+
+            schedule = not self.__flush_scheduled
+            self.__flush_scheduled = True
+
+        return schedule
+
+    # take the next batch of frames from the front of the queue
+    def take(self, max_priority: int = PRIORITY_BULK) -> list:
+        """
+        Take whole frames from the front of the lanes, highest priority first, up to max_batch_bytes and
+        max_batch_buffers. Frames of the same priority are taken in the order they were queued. An empty queue marks
+        the pending flush as done.
+
+        :param max_priority: The lowest priority to take frames of, PRIORITY_CONTROL only takes control frames.
+        :return: The buffers of the frames taken, empty if there are no frames to take.
+        """
+
+        batch = []
+        size = 0
+        limited_size = 0
+        control_size = 0
+
+        with self.__lock:
+            for priority, lane in enumerate(self.__lanes[:max_priority + 1]):
+                while lane:
+                    buffers, frame_size = lane[0]
+
+                    # keep the frame for the next batch if it would make this one too large
+                    if batch and (size + frame_size > self.max_batch_bytes
+                                  or len(batch) + len(buffers) > self.max_batch_buffers):
+                        break
+
+                    lane.popleft()
+                    batch.extend(buffers)
+                    size += frame_size
+
+                    if priority != PRIORITY_CONTROL:
+                        limited_size += frame_size
+                    else:
+                        control_size += frame_size
+                        self.__control_frames.discard(self.__contents(buffers))
+
+                # the batch is full
+                if lane:
+                    break
+
+            self.__bytes -= limited_size
+            self.__control_bytes -= control_size
+
+            if self.__budget is not None:
+                self.__budget.release(limited_size + control_size)
+
+            # the queue has drained enough to take frames again
+            if self.__full and (self.low_watermark is None or self.__bytes <= self.low_watermark):
+                self.__full = False
+
+            # the lanes have been drained, the next frame needs a new flush
+            if not batch:
+                self.__control_flush_scheduled = False
+
+                if max_priority != PRIORITY_CONTROL:
+                    self.__flush_scheduled = False
+
+        return batch
+
+    # drop every queued frame
+    def clear(self) -> int:
+        """
+        Drop every queued frame, used once the connection can no longer be written to.
+
+        :return: The number of frames dropped.
+        """
+
+        with self.__lock:
+            dropped = sum(len(lane) for lane in self.__lanes)
+
+            if self.__budget is not None:
+                self.__budget.release(self.__bytes + self.__control_bytes)
+
+            for lane in self.__lanes:
+                lane.clear()
+
+            self.__bytes = 0
+            self.__control_bytes = 0
+            self.__control_frames.clear()
+            self.__full = False
+            self.__flush_scheduled = False
+            self.__control_flush_scheduled = False
+
+        return dropped
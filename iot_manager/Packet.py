@@ -1,42 +1,226 @@
 from __future__ import annotations
 
+# default lib imports
+import copy
+from typing import Union
+
+# module imports
+from .ReservedBytes import PROTOCOL_V1, PROTOCOL_V2, STREAM_CHUNK, STREAM_END, STREAM_OFFSET, PRIORITY_INTERACTIVE
+
 
 # define a packet class
 class Packet:
-    def __init__(self, *args: bytes, sending: bool = True):
-        # byte array
-        self.bytes = bytearray()
+    def __init__(self, *args: bytes, sending: bool = True, flags: int = 0, priority: int = PRIORITY_INTERACTIVE):
+        # the payload buffers, kept exactly as they were given so no copy of the payload is ever made (the buffers
+        # are owned by the caller and must not be changed while the packet is in use)
+        self.__buffers = tuple(arg for arg in args if memoryview(arg).nbytes > 0)
 
         # marks if the packet is being used for sending data
         self.__sending = sending
 
-        # go through all of the args and add them
-        for arg in args:
-            self.bytes.extend(arg)
+        # the frame flags of the packet (only sent with protocol version 2)
+        self.flags = flags
+
+        # the outbound priority class of the packet, queued packets of a higher priority are written first
+        self.priority = priority
 
         # the size of the message in bytes
-        self.size = len(self.bytes)
+        self.size = sum(memoryview(buffer).nbytes for buffer in self.__buffers)
+
+        # check if the message is too large for any frame header
+        if self.size > 0xFFFFFFFF:
+            raise OverflowError(" The size of Packet.bytes cannot exceed the size of a 32 bit integer.")
+
+        # true if the packet is sent with a message size header
+        self.__has_header = sending
+
+        # the message size headers of the packet indexed by protocol version, built the first time they are needed
+        self.__headers = {}
+
+        # the joined payload, only built if Packet.payload or Packet.bytes is used
+        self.__payload = None
+
+    # the message size header of the packet for a given protocol version
+    def header(self, version: int = PROTOCOL_V1) -> bytes:
+        """
+        The message size header of the packet, kept separate from the payload so it never has to be prepended to it.
+
+        :param version: The protocol version to build the header for.
+        :return: bytes, empty if the packet has no header.
+        """
+
+        if not self.__has_header:
+            return b''
+
+        header = self.__headers.get(version)
+        if header is not None:
+            return header
+
+        header = self.frame_header(self.size, version, self.flags)
+
+        self.__headers[version] = header
+        return header
+
+    # build a message size header
+    @staticmethod
+    def frame_header(size: int, version: int = PROTOCOL_V1, flags: int = 0) -> bytes:
+        """
+        Build the message size header of a frame.
+
+        :param size: The size of the message in bytes.
+        :param version: The protocol version to build the header for.
+        :param flags: The frame flags, only allowed for protocol version 2.
+        :return: bytes
+        """
+
+        if version == PROTOCOL_V2:
+            return bytes((flags,)) + size.to_bytes(4, 'big')
+
+        # version 1 frames have no room for flags
+        if flags:
+            raise ValueError("Packets with flags can only be sent using protocol version 2.")
+
+        try:
+            return size.to_bytes(2, 'big')
+        # check if this raises an overflow error if so echo it with some info
+        except OverflowError:
+            raise OverflowError(" The size of Packet.bytes cannot exceed the size of a 16 bit integer when using"
+                                + " protocol version 1.")
+
+    # the payload without the header
+    @property
+    def payload(self) -> bytes:
+        """
+        The payload of the packet without the message size header. Joining the payload buffers is deferred until this
+        is used, a packet made from a single buffer returns that buffer as is.
+
+        :return: bytes-like object
+        """
+
+        if self.__payload is None:
+            if len(self.__buffers) == 1:
+                self.__payload = self.__buffers[0]
+            else:
+                self.__payload = b''.join(self.__buffers)
+
+        return self.__payload
+
+    # the header followed by the payload
+    @property
+    def bytes(self) -> bytes:
+        """
+        The packet as a single buffer, the protocol version 1 message size header followed by the payload (receiving
+        packets have no header so this is just the payload). Sending packets should be sent using Packet.buffers()
+        instead, which does not join the header and the payload.
 
-        # if the packet is going to be used for sending add the message size header
-        if sending:
-            try:
-                size = self.size.to_bytes(2, 'big')
-            # check if this raises an overflow error if so echo it with some info
-            except OverflowError:
-                raise OverflowError(" The size of Packet.bytes cannot exceed the size of a 16 bit integer.")
+        :return: bytes-like object
+        """
 
-            # if no problems are raised then add the size of the message to the front of self.bytes
-            self.bytes[:0] = size
+        header = self.header()
+
+        if not header:
+            return self.payload
+
+        return header + bytes(self.payload)
+
+    # the buffers making up the packet
+    def buffers(self, version: int = PROTOCOL_V1) -> list:
+        """
+        The header and payload buffers of the packet, in order, for use with a scatter/gather send such as
+        socket.sendmsg().
+
+        :param version: The protocol version to build the header for.
+        :return: A list of bytes-like objects.
+        """
+
+        header = self.header(version)
+
+        if not header:
+            return list(self.__buffers)
+
+        return [header, *self.__buffers]
+
+    # a copy of the packet with another priority
+    def with_priority(self, priority: int) -> Packet:
+        """
+        Get a copy of the packet with another outbound priority class, the copy shares the payload buffers so nothing
+        is copied and the packet itself is left unchanged.
+
+        :param priority: The priority class of the copy.
+        :return: The packet itself if it already has the priority, otherwise a new Packet object.
+        """
+
+        if priority == self.priority:
+            return self
+
+        packet = copy.copy(self)
+        packet.priority = priority
+        packet.__headers = dict(self.__headers)
+
+        return packet
 
     # used for removing the front two size bytes
     def remove_header(self) -> None:
-        # remove first two bytes
-        del self.bytes[2:]
+        # drop the header
+        self.__has_header = False
 
     # return the value of sending
     def is_sending(self):
         return self.__sending
 
+    # return if the packet is a frame of a stream
+    def is_stream(self) -> bool:
+        """
+        Return True if the packet is a chunk of a stream.
+
+        :return: bool
+        """
+        return bool(self.flags & (STREAM_CHUNK | STREAM_END))
+
+    # return if the packet is the last frame of a stream
+    def is_stream_end(self) -> bool:
+        """
+        Return True if the packet is the last chunk of a stream.
+
+        :return: bool
+        """
+        return bool(self.flags & STREAM_END)
+
+    # the id of the stream the packet belongs to
+    @property
+    def stream_id(self) -> int:
+        """
+        The id of the stream the packet is a chunk of, read from the first 4 bytes of the payload.
+
+        :return: int
+        """
+        return int.from_bytes(memoryview(self.payload)[:4], 'big')
+
+    # the offset the chunk of a resumed file stream starts at
+    @property
+    def stream_offset(self) -> Union[int, None]:
+        """
+        The offset in the file the chunk starts at, read from the 8 bytes after the stream id of the first chunk of a
+        resumed file stream (flagged STREAM_OFFSET).
+
+        :return: int or None if the packet does not carry an offset.
+        """
+        if not self.flags & STREAM_OFFSET:
+            return None
+
+        return int.from_bytes(memoryview(self.payload)[4:12], 'big')
+
+    # the chunk of the stream the packet carries
+    @property
+    def stream_data(self) -> memoryview:
+        """
+        The chunk of the stream the packet carries (the payload without the stream id and offset), does not copy the
+        payload.
+
+        :return: memoryview
+        """
+        return memoryview(self.payload)[12 if self.flags & STREAM_OFFSET else 4:]
+
     # overload the equality operator in python
     def __eq__(self, other: Packet) -> bool:
         if self.bytes == other.bytes:
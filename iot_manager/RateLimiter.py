@@ -0,0 +1,131 @@
+# default lib imports
+import threading
+import time
+
+
+# token bucket rate limiter, tokens refill continuously at the given rate up to the bucket's capacity
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        # lock guarding the bucket's state
+        self.__lock = threading.Lock()
+
+        # tokens added to the bucket per second
+        self.__rate = None
+
+        # the max number of tokens the bucket can hold (the size of a burst)
+        self.__capacity = None
+
+        # the current number of tokens and the time they were last refilled
+        self.__tokens = 0.0
+        self.__last_refill = time.monotonic()
+
+        # set the rate and capacity using the setters so they are validated
+        self.rate = rate
+        self.capacity = capacity
+
+        # start with a full bucket
+        self.__tokens = self.__capacity
+
+    # the refill rate of the bucket
+    @property
+    def rate(self) -> float:
+        """
+        The number of tokens added to the bucket per second.
+
+        :return: float
+        """
+        return self.__rate
+
+    @rate.setter
+    def rate(self, rate: float):
+        if not isinstance(rate, (int, float)) or rate <= 0:
+            raise ValueError("rate must be a number greater than 0")
+
+        with self.__lock:
+            # refill using the old rate before switching to the new one
+            self.__refill()
+            self.__rate = float(rate)
+
+    # the size of the bucket
+    @property
+    def capacity(self) -> float:
+        """
+        The max number of tokens the bucket can hold.
+
+        :return: float
+        """
+        return self.__capacity
+
+    @capacity.setter
+    def capacity(self, capacity: float):
+        # default to one second worth of tokens
+        if capacity is None:
+            capacity = max(1.0, self.__rate)
+
+        if not isinstance(capacity, (int, float)) or capacity < 1:
+            raise ValueError("capacity must be a number greater than or equal to 1")
+
+        with self.__lock:
+            self.__capacity = float(capacity)
+            self.__tokens = min(self.__tokens, self.__capacity)
+
+    # add the tokens earned since the last refill, must be called with the lock held
+    def __refill(self):
+        now = time.monotonic()
+
+        if self.__rate is not None:
+            self.__tokens = min(self.__capacity, self.__tokens + (now - self.__last_refill) * self.__rate)
+
+        self.__last_refill = now
+
+    # take tokens without waiting
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """
+        Take tokens from the bucket if enough are available.
+
+        :param tokens: The number of tokens to take.
+        :return: True if the tokens were taken, False if there were not enough tokens.
+        """
+
+        with self.__lock:
+            self.__refill()
+
+            if self.__tokens >= tokens:
+                self.__tokens -= tokens
+                return True
+
+            return False
+
+    # take tokens, waiting for the bucket to refill if needed
+    def acquire(self, tokens: float = 1, timeout: float = None) -> bool:
+        """
+        Take tokens from the bucket, blocking until enough tokens are available.
+
+        :param tokens: The number of tokens to take.
+        :param timeout: Max time to wait in seconds, None will wait as long as needed.
+        :return: True if the tokens were taken, False if the timeout expired first.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            with self.__lock:
+                self.__refill()
+
+                if self.__tokens >= tokens:
+                    self.__tokens -= tokens
+                    return True
+
+                # time until enough tokens will be available
+                wait = (tokens - self.__tokens) / self.__rate
+
+            # check if waiting would pass the deadline
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0:
+                    return False
+
+                wait = min(wait, remaining)
+
+            time.sleep(wait)
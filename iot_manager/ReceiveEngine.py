@@ -0,0 +1,192 @@
+# default lib imports
+import selectors
+import socket
+import threading
+import logging
+from collections import deque
+
+
+# readiness based receive engine, only hands back clients which actually have data waiting to be read (or, given
+# selectors.EVENT_WRITE, clients which have room to write)
+class ReceiveEngine:
+    def __init__(self, events: int = selectors.EVENT_READ, logging_id: str = "[Receive Engine]",
+                 logging_level: int = logging.WARNING):
+        # logger object and setup
+        self.logger = logging.getLogger(logging_id)
+        self.logger.setLevel(logging_level)
+
+        # the events the client sockets are watched for
+        self.events = events
+
+        # the selector used to wait on the client sockets (epoll/kqueue/poll/select depending on the platform)
+        self.__selector = selectors.DefaultSelector()
+
+        # a socket pair used to wake the selector when a client is registered/unregistered/notified from another thread
+        self.__wakeup_reader, self.__wakeup_writer = socket.socketpair()
+        self.__wakeup_reader.setblocking(False)
+        self.__wakeup_writer.setblocking(False)
+
+        # register the wakeup socket, data is None so it can be told apart from the client sockets
+        self.__selector.register(self.__wakeup_reader, selectors.EVENT_READ, None)
+
+        # lock guarding the pending changes and the notified clients
+        self.__lock = threading.Lock()
+
+        # registration changes which will be applied by the polling thread, tuples of (register: bool, client)
+        self.__pending = deque()
+
+        # clients which have data buffered outside of their socket (ex. messages buffered during a heartbeat)
+        self.__notified = deque()
+
+        # true if a wakeup byte has been written and not yet drained
+        self.__woken = False
+
+    # wake the selector if it is currently blocking
+    def __wake(self):
+        with self.__lock:
+            # only write a single byte per poll, no need to flood the socket pair
+            if self.__woken:
+                return
+
+            self.__woken = True
+
+        try:
+            self.__wakeup_writer.send(b'\x00')
+        except socket.error:
+            pass
+
+    # apply the registration changes queued by other threads, only ever called by the polling thread
+    def __apply_pending(self):
+        with self.__lock:
+            pending = list(self.__pending)
+            self.__pending.clear()
+
+        for register, client in pending:
+            try:
+                if register:
+                    self.__selector.register(client, self.events, client)
+                else:
+                    self.__selector.unregister(client)
+
+            # the socket was already closed or was never registered
+            except (KeyError, ValueError, OSError) as error:
+                self.logger.debug("(Apply Pending) Unable to " + ("register" if register else "unregister")
+                                  + " client '" + str(client.instance_id) + "'. Error: " + str(error))
+
+    # start watching a client's socket
+    def register(self, client):
+        """
+        Start watching a client's socket for incoming data.
+
+        :param client: Client object to watch.
+        :return: None
+        """
+
+        with self.__lock:
+            self.__pending.append((True, client))
+
+        self.__wake()
+
+    # stop watching a client's socket
+    def unregister(self, client):
+        """
+        Stop watching a client's socket for incoming data.
+
+        :param client: Client object to stop watching.
+        :return: None
+        """
+
+        with self.__lock:
+            self.__pending.append((False, client))
+
+        self.__wake()
+
+    # mark a client as ready even though its socket may not be readable
+    def notify(self, client):
+        """
+        Mark a client as having data ready to be read, used when data has been buffered outside of the socket.
+
+        :param client: Client object with data ready.
+        :return: None
+        """
+
+        with self.__lock:
+            self.__notified.append(client)
+
+        self.__wake()
+
+    # wake a thread blocked in poll
+    def wake(self):
+        """
+        Make a poll which is blocking return right away, used to stop the thread polling the engine.
+
+        :return: None
+        """
+        self.__wake()
+
+    # wait for clients to have data ready
+    def poll(self, timeout: float = None) -> list:
+        """
+        Block until at least one client has data ready or the timeout expires. The cost of a poll only depends on the
+        number of clients which are ready, not on the number of clients being watched.
+
+        :param timeout: Max time to wait in seconds, None will wait forever.
+        :return: A list of Client objects which have data ready to be read.
+        """
+
+        # apply any changes queued since the last poll
+        self.__apply_pending()
+
+        # clients which have data ready
+        ready = []
+
+        # wait on the selector
+        for key, _ in self.__selector.select(timeout):
+            # wakeup socket, drain it so it does not keep the selector awake
+            if key.data is None:
+                try:
+                    while self.__wakeup_reader.recv(4096):
+                        pass
+                except socket.error:
+                    pass
+
+                with self.__lock:
+                    self.__woken = False
+
+                continue
+
+            ready.append(key.data)
+
+        # changes may have been queued while waiting
+        self.__apply_pending()
+
+        # add any clients which were notified, skipping ones already returned by the selector
+        with self.__lock:
+            notified = list(self.__notified)
+            self.__notified.clear()
+
+        if notified:
+            seen = set(client.instance_id for client in ready)
+
+            for client in notified:
+                if client.instance_id not in seen:
+                    seen.add(client.instance_id)
+                    ready.append(client)
+
+        return ready
+
+    # the number of sockets being watched (not including the wakeup socket)
+    def __len__(self):
+        return len(self.__selector.get_map()) - 1
+
+    # release the selector and the wakeup sockets
+    def close(self):
+        """
+        Close the selector and the sockets used for waking it.
+
+        :return: None
+        """
+
+        self.__selector.close()
+        self.__wakeup_reader.close()
+        self.__wakeup_writer.close()
@@ -5,3 +5,36 @@ import enum
 GET_DATA = b'\x01'
 HEARTBEAT = b'\x02'
 END_CONNECTION = b'\x03'
+
+# sent by the manager followed by a single byte protocol version, confirms the protocol version requested by a client
+PROTOCOL = b'\x04'
+
+# sent by the manager followed by the 2 byte id of the client's type, answers a binary info reply which named a
+# registered type so the client can send the id instead of the name when it reconnects
+TYPE_ID = b'\x05'
+
+# first byte of a binary info reply (see Handshake.py), it can not start a UTF-8 string so a text info reply
+# 'UUID##DEVICE_TYPE##JSON' is never mistaken for it
+BINARY_INFO = b'\xb1'
+
+# protocol versions
+# version 1 frames: [2B - Message Size][Message]
+PROTOCOL_V1 = 1
+# version 2 frames: [1B - Flags][4B - Message Size][Message]
+PROTOCOL_V2 = 2
+
+# version 2 frame flags, stream frames start with a 4 byte stream id followed by a chunk of the stream
+STREAM_CHUNK = 0x01
+STREAM_END = 0x02
+
+# set on the first chunk of a file stream which resumes a transfer, the stream id is followed by the 8 byte offset in the
+# file the chunk starts at
+STREAM_OFFSET = 0x04
+
+# outbound priority classes, queued frames of a higher priority (lower number) are written first
+# connection signals (GET_DATA, HEARTBEAT, END_CONNECTION, PROTOCOL)
+PRIORITY_CONTROL = 0
+# application messages
+PRIORITY_INTERACTIVE = 1
+# streams and files
+PRIORITY_BULK = 2
@@ -0,0 +1,171 @@
+# default lib imports
+import logging
+import re
+import struct
+from typing import Union, Sequence
+
+# optional lib imports, records are decoded into tuples without numpy
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# numpy type codes of the struct format characters which have a standard size
+_NUMPY_CODES = {
+    "x": "V1", "c": "S1", "b": "i1", "B": "u1", "?": "b1", "h": "i2", "H": "u2", "i": "i4", "I": "u4", "l": "i4",
+    "L": "u4", "q": "i8", "Q": "u8", "e": "f2", "f": "f4", "d": "f8", "s": "S"
+}
+
+# numpy byte order of the struct byte order characters
+_NUMPY_ORDERS = {"<": "<", ">": ">", "!": ">", "=": "="}
+
+# struct format characters of numbers
+_NUMERIC_CODES = "bBhHiIlLqQefd"
+
+# one item of a struct format, a repeat count followed by a format character
+_STRUCT_ITEM = re.compile(r"(\d*)([a-zA-Z?])")
+
+
+# a fixed size binary record layout, the messages of a DeviceType with a schema are decoded into arrays of records
+class RecordSchema:
+    # an exception raised when numpy is needed but not installed
+    class NumpyMissing(Exception):
+        pass
+
+    def __init__(self, layout, names: Sequence[str] = None, logging_id: str = "[Record Schema]",
+                 logging_level: int = logging.WARNING):
+        # the layout is a struct format with an explicit byte order (ex. "<Ifh") or a numpy dtype, names are the names
+        # of the fields of a struct format (f0, f1, ... by default)
+
+        # logger object and setup
+        self.logger = logging.getLogger(logging_id)
+        self.logger.setLevel(logging_level)
+
+        # the struct used to decode records without numpy (None if the layout is a dtype)
+        self.struct = None
+
+        # the numpy dtype of a record (None without numpy)
+        self.dtype = None
+
+        # the names of the fields and the tuple entries each field is decoded into without numpy
+        self.names = ()
+        self.__columns = {}
+
+        # the names of the fields which hold numbers
+        self.numeric = frozenset()
+
+        if isinstance(layout, (str, bytes)):
+            layout = layout.decode() if isinstance(layout, bytes) else layout
+
+            # a native layout is padded and ordered differently from platform to platform (and from numpy), so every
+            # layout must say its byte order whether numpy is installed or not
+            order = _NUMPY_ORDERS.get(layout[:1])
+            if order is None:
+                raise ValueError("The record layout must start with an explicit byte order ('<', '>', '!' or '=').")
+
+            self.struct = struct.Struct(layout)
+
+            fields = self.__struct_fields(layout)
+
+            if names is None:
+                names = ["f" + str(index) for index in range(len(fields))]
+            elif len(names) != len(fields):
+                raise ValueError("The record layout has " + str(len(fields)) + " fields but " + str(len(names))
+                                 + " names were given.")
+
+            self.names = tuple(names)
+            self.numeric = frozenset(name for name, (_, code) in zip(self.names, fields) if code in _NUMERIC_CODES)
+
+            # a repeat count decodes into as many tuple entries (one for 's', none for 'x')
+            start = 0
+            for name, (count, code) in zip(self.names, fields):
+                width = 0 if code == "x" else 1 if code == "s" else count
+                self.__columns[name] = slice(start, start + width) if count > 1 and code != "s" else start
+                start += width
+
+            if numpy is not None:
+                self.dtype = numpy.dtype([(name, self.__numpy_field(order, count, code))
+                                          for name, (count, code) in zip(self.names, fields)])
+
+            self.size = self.struct.size
+        else:
+            if numpy is None:
+                raise self.NumpyMissing("numpy must be installed to use a dtype as a record layout.")
+
+            self.dtype = numpy.dtype(layout)
+            self.names = self.dtype.names or ()
+            self.numeric = frozenset(name for name in self.names if self.dtype[name].base.kind in "iuf")
+            self.size = self.dtype.itemsize
+
+        if self.size == 0:
+            raise ValueError("The record layout must not be empty.")
+
+    # the (repeat count, format character) items of a struct format
+    @staticmethod
+    def __struct_fields(layout: str) -> list:
+        fields = []
+        for count, code in _STRUCT_ITEM.findall(layout.lstrip("@=<>!").replace(" ", "")):
+            if code not in _NUMPY_CODES:
+                raise ValueError("Format character '" + code + "' has no fixed size.")
+
+            fields.append((int(count) if count else 1, code))
+
+        return fields
+
+    # the numpy type of a struct item, a repeat count makes a sub array (a byte string for 's')
+    @staticmethod
+    def __numpy_field(order: str, count: int, code: str) -> tuple:
+        if code == "s":
+            return "S" + str(count), ()
+        elif code == "x":
+            return "V" + str(count), ()
+
+        return order + _NUMPY_CODES[code], () if count == 1 else (count,)
+
+    # decode the records of a batch of messages
+    def decode(self, payloads: Sequence) -> Union["numpy.ndarray", list]:
+        """
+        Decode the records of a list of message payloads, each message may hold one or more whole records. A message
+        whose size is not a multiple of the record size is left out. Decoded in a single vectorized step with numpy,
+        a single message is decoded without copying it.
+
+        :param payloads: A list of bytes-like objects.
+        :return: A numpy structured array, or a list of tuples without numpy.
+        """
+
+        # leave out messages which do not hold whole records, the messages of a device are usually all the same size so
+        # only the distinct sizes are checked
+        if any(length % self.size for length in set(map(len, payloads))):
+            kept = [payload for payload in payloads if not len(payload) % self.size]
+
+            # logging output
+            self.logger.warning("(Decode) Dropped " + str(len(payloads) - len(kept)) + " messages which are not a"
+                                + " multiple of the " + str(self.size) + " byte record size.")
+
+            payloads = kept
+
+        buffer = payloads[0] if len(payloads) == 1 else b''.join(payloads)
+
+        if self.dtype is not None:
+            return numpy.frombuffer(buffer, self.dtype)
+
+        return list(self.struct.iter_unpack(buffer))
+
+    # the values of one field of decoded records
+    def column(self, records: Union["numpy.ndarray", list], name: str) -> Union["numpy.ndarray", list]:
+        """
+        Get the values of one field of the records returned by RecordSchema.decode().
+
+        :param records: The decoded records.
+        :param name: The name of the field.
+        :return: A numpy array, or a list without numpy (of tuples for a field with a repeat count).
+        """
+
+        if name not in self.names:
+            raise KeyError("The record layout has no field named '" + str(name) + "'.")
+
+        if self.dtype is not None:
+            return records[name]
+
+        index = self.__columns[name]
+        return [record[index] for record in records]
@@ -0,0 +1,405 @@
+# default lib imports
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Union
+
+# module imports
+from .Manager import Manager, packetable
+from .Packet import Packet
+from .Broadcast import BroadcastResult
+
+
+# commands sent to a shard over its control pipe
+SEND = "send"
+SEND_TYPE = "send_type"
+SEND_ALL = "send_all"
+CLIENT_DATA = "client_data"
+STOP = "stop"
+
+# events sent by the shards to the parent
+CONNECTED = "connected"
+DISCONNECTED = "disconnected"
+
+
+# a packet as plain values which can be sent to another process
+def _portable(packet: Packet) -> tuple:
+    return bytes(packet.payload), packet.flags, packet.priority
+
+
+# run one shard of a ShardedManager, the entry point of each worker process
+def _run_shard(index: int, control, events, setup: Callable, broadcast_timeout: float, manager_kwargs: dict):
+    manager = Manager(reuse_port=True, **manager_kwargs)
+
+    # let the user add their handlers and device types
+    if setup is not None:
+        setup(manager)
+
+    # tell the parent which clients this shard owns, a client is only reported once it is in the shard's pool so the
+    # parent never routes a send to a shard which can not find the client yet
+    user_disconnect = manager.on_disconnect
+
+    def on_registered(client):
+        events.put((index, CONNECTED, client.uuid(), client.instance_id))
+
+    def on_disconnect(client):
+        try:
+            return user_disconnect(client)
+        finally:
+            events.put((index, DISCONNECTED, client.uuid(), client.instance_id))
+
+    manager.on_registered = on_registered
+    manager.on_disconnect = on_disconnect
+
+    manager.start()
+
+    # answer the parent's commands until it asks the shard to stop or goes away, each reply carries the sequence number
+    # of its command so the parent can tell a late reply from the one it is waiting for
+    while True:
+        try:
+            sequence, command, *args = control.recv()
+        except (EOFError, OSError):
+            break
+
+        if command == STOP:
+            manager.stop(*args)
+            control.send((sequence, True))
+            break
+
+        try:
+            if command == SEND:
+                unique_id, (payload, flags, priority) = args
+                reply = manager.send(unique_id, Packet(payload, flags=flags, priority=priority))
+
+            elif command in (SEND_TYPE, SEND_ALL):
+                payload, flags, priority = args[-1]
+                packet = Packet(payload, flags=flags, priority=priority)
+
+                if command == SEND_TYPE:
+                    result = manager.send_type(args[0], packet)
+                else:
+                    result = manager.send_all(packet)
+
+                # the packets are only queued so this is short, report what has been counted if it takes too long
+                try:
+                    result.wait(broadcast_timeout)
+                except FutureTimeoutError:
+                    pass
+
+                reply = (result.total, result.sent, result.failed, result.skipped)
+
+            elif command == CLIENT_DATA:
+                reply = manager.get_client_data()
+
+            else:
+                reply = ValueError("Unknown shard command '" + str(command) + "'.")
+
+        # hand the error to the caller instead of taking down the shard
+        except Exception as error:
+            reply = error
+
+        control.send((sequence, reply))
+
+
+# runs one Manager process per CPU core, every process listens on the same host and port with SO_REUSEPORT so the
+# kernel spreads connections across them, and routes sends to the process which owns the client
+class ShardedManager:
+    # an exception raised when a shard has exited or does not reply in time
+    class ShardUnavailable(Exception):
+        pass
+
+    def __init__(self, workers: int = None, setup: Callable[[Manager], None] = None, broadcast_timeout: float = 5,
+                 call_timeout: float = 10, start_method: str = None, logging_id: str = "[Sharded Manager]",
+                 logging_level: int = logging.WARNING, **manager_kwargs):
+        # logger object and setup
+        if isinstance(logging_id, str):
+            self.logger = logging.getLogger(logging_id)
+        else:
+            raise TypeError("logging_id must be of type str")
+
+        if isinstance(logging_level, int):
+            self.logger.setLevel(logging_level)
+        else:
+            raise TypeError("logging_level must resolve to an integer value")
+
+        # the number of worker processes, one per core by default
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if not isinstance(workers, int) or workers <= 0:
+            raise TypeError("workers must be None or an int greater than 0")
+
+        self.workers = workers
+
+        # called in each worker with its Manager to add the handlers and device types, must be picklable when the
+        # start method is not "fork"
+        self.setup = setup
+
+        # the time a shard waits for a broadcast to be queued for all of its clients before reporting its counts
+        self.broadcast_timeout = broadcast_timeout
+
+        # the time the parent waits for a shard to reply to a command, a shard which does not reply in time is skipped
+        # so one hung shard does not hold up the others
+        if not isinstance(call_timeout, (int, float)) or call_timeout <= 0:
+            raise TypeError("call_timeout must be a number greater than 0 representing time in seconds")
+
+        self.call_timeout = call_timeout
+
+        # the arguments of each shard's Manager
+        self.manager_kwargs = manager_kwargs
+        self.manager_kwargs.setdefault("logging_level", logging_level)
+
+        # the multiprocessing context the workers are started with
+        self.__context = multiprocessing.get_context(start_method)
+
+        # the worker processes, their control pipes and a lock for each pipe
+        self.__processes = []
+        self.__pipes = []
+        self.__pipe_locks = []
+
+        # the sequence number of the last command sent to each shard
+        self.__sequences = []
+
+        # threads which wait on the replies of every shard at once, so each one only holds its own shard's pipe lock
+        self.__callers = None
+
+        # the events sent by the shards
+        self.__events = self.__context.Queue()
+
+        # the shard and instance id of each connected client indexed by uuid
+        self.__owners = {}
+        self.__owners_lock = threading.Lock()
+
+        # thread which applies the shards' events to the owners
+        self.__event_thread = None
+
+    # start the worker processes
+    def start(self):
+        """
+        Start the worker processes, each one starts its own Manager.
+
+        :return: None
+        """
+
+        for index in range(self.workers):
+            parent_end, child_end = self.__context.Pipe()
+
+            process = self.__context.Process(target=_run_shard, name="Manager Shard " + str(index), daemon=True,
+                                             args=(index, child_end, self.__events, self.setup, self.broadcast_timeout,
+                                                   self.manager_kwargs))
+            process.start()
+            child_end.close()
+
+            self.__processes.append(process)
+            self.__pipes.append(parent_end)
+            self.__pipe_locks.append(threading.Lock())
+            self.__sequences.append(0)
+
+        self.__callers = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="Shard Caller")
+
+        self.__event_thread = threading.Thread(target=self.__event_listener, name="Shard Event Listener", daemon=True)
+        self.__event_thread.start()
+
+        # logging output
+        self.logger.info("(Process Handler) Started " + str(self.workers) + " shards.")
+
+    # keep track of which shard owns each client
+    def __event_listener(self):
+        while True:
+            event = self.__events.get()
+
+            # stop() wakes the listener with None
+            if event is None:
+                return
+
+            index, kind, unique_id, instance_id = event
+
+            with self.__owners_lock:
+                if kind == CONNECTED:
+                    self.__owners[unique_id] = (index, instance_id)
+
+                # a reconnection may have already replaced the connection which ended
+                elif self.__owners.get(unique_id) == (index, instance_id):
+                    del self.__owners[unique_id]
+
+    # send a command to one shard and wait for its reply
+    def __call(self, index: int, *command, timeout: float = None):
+        timeout = self.call_timeout if timeout is None else timeout
+        pipe = self.__pipes[index]
+
+        with self.__pipe_locks[index]:
+            self.__sequences[index] += 1
+            sequence = self.__sequences[index]
+
+            deadline = time.monotonic() + timeout
+
+            try:
+                pipe.send((sequence,) + command)
+
+                while True:
+                    if not pipe.poll(max(0.0, deadline - time.monotonic())):
+                        raise self.ShardUnavailable("Shard " + str(index) + " did not reply within " + str(timeout)
+                                                    + " seconds.")
+
+                    replied, reply = pipe.recv()
+
+                    # the reply of a command which timed out earlier
+                    if replied == sequence:
+                        break
+
+            except (EOFError, OSError):
+                raise self.ShardUnavailable("Shard " + str(index) + " has exited.")
+
+        if isinstance(reply, Exception):
+            raise reply
+
+        return reply
+
+    # send a command to every shard at once and collect the replies
+    def __call_all(self, *command) -> list:
+        futures = [self.__callers.submit(self.__call, index, *command) for index in range(len(self.__pipes))]
+        replies = []
+
+        for index, future in enumerate(futures):
+            try:
+                replies.append(future.result())
+
+            # leave out a shard which is gone or hung so the others still answer
+            except self.ShardUnavailable as error:
+                self.logger.error("(Shard Caller) Left out shard " + str(index) + ". Exception: '" + str(error) + "'")
+
+        return replies
+
+    # merge the counts of every shard
+    @staticmethod
+    def __merge(replies: list) -> BroadcastResult:
+        result = BroadcastResult(sum(reply[0] for reply in replies))
+
+        for _, sent, failed, skipped in replies:
+            result.record(sent, failed, skipped)
+
+        return result
+
+    # the shard which owns a client
+    def owner(self, unique_id: str) -> Union[int, None]:
+        """
+        Get the index of the shard which owns a client.
+
+        :param unique_id: The client's UUID as a str.
+        :return: int or None if no shard owns the client.
+        """
+
+        with self.__owners_lock:
+            owner = self.__owners.get(unique_id)
+
+        return None if owner is None else owner[0]
+
+    # sends data to a client given a uuid
+    def send(self, unique_id: str, data: packetable) -> bool:
+        """
+        Send some data to a specific Client given their UUID, only the shard which owns the client is asked to send
+        it. See Manager.send().
+
+        :param unique_id: The client's UUID as a str.
+        :param data: str, bytes, bytearray, memoryview, or Packet object.
+        :return: True if the data was queued for the client, False if no shard owns the client or its queue is full.
+                 Raises ShardedManager.ShardUnavailable if the shard which owns the client has exited or does not reply
+                 within the call_timeout.
+        """
+
+        index = self.owner(unique_id)
+        if index is None:
+            return False
+
+        return self.__call(index, SEND, unique_id, _portable(Manager.make_packet(data)))
+
+    # sends data to all clients of a specified device_type
+    def send_type(self, device_type: str, data: packetable) -> BroadcastResult:
+        """
+        Send some data to all devices of a specific type on every shard.
+
+        :param device_type: Device type to broadcast to as a str.
+        :param data: str, bytes, bytearray, memoryview, or Packet object
+        :return: A BroadcastResult with the counts of every shard which replied within the call_timeout.
+        """
+        return self.__merge(self.__call_all(SEND_TYPE, device_type, _portable(Manager.make_packet(data))))
+
+    # sends data to all clients
+    def send_all(self, data: packetable) -> BroadcastResult:
+        """
+        Send some data to all devices on every shard.
+
+        :param data: str, bytes, bytearray, memoryview, or Packet object
+        :return: A BroadcastResult with the counts of every shard which replied within the call_timeout.
+        """
+        return self.__merge(self.__call_all(SEND_ALL, _portable(Manager.make_packet(data))))
+
+    # returns an list of dictionaries storing the connected clients' information
+    def get_client_data(self) -> list:
+        """
+        Get the data of the clients connected to every shard which replied within the call_timeout, see
+        Manager.get_client_data().
+
+        :return: A list of dictionaries representing connected clients.
+        """
+        return [info for reply in self.__call_all(CLIENT_DATA) for info in reply]
+
+    # stop the worker processes
+    def stop(self, timeout: float = 10):
+        """
+        Stop the Manager of every shard (see Manager.stop()) and wait for the worker processes to exit, workers which
+        do not exit in time are terminated.
+
+        :param timeout: Max time to wait for each shard in seconds.
+        :return: None
+        """
+
+        # the shards stop at the same time
+        if self.__callers is not None:
+            futures = [self.__callers.submit(self.__call, index, STOP, timeout, timeout=timeout)
+                       for index in range(len(self.__pipes))]
+
+            for future in futures:
+                try:
+                    future.result()
+                except self.ShardUnavailable:
+                    pass
+
+            self.__callers.shutdown()
+            self.__callers = None
+
+        for process in self.__processes:
+            process.join(timeout)
+
+            if process.is_alive():
+                self.logger.warning("(Process Handler) Shard '" + process.name + "' did not stop, terminating it.")
+                process.terminate()
+
+        self.__events.put(None)
+
+        for pipe in self.__pipes:
+            pipe.close()
+
+        self.__processes.clear()
+        self.__pipes.clear()
+        self.__pipe_locks.clear()
+        self.__sequences.clear()
+
+        # logging output
+        self.logger.info("(Process Handler) All shards stopped.")
+
+    # runs start and blocks until the workers exit
+    def run(self):
+        """
+        Blocking version of ShardedManager.start().
+
+        :return: None
+        """
+
+        self.start()
+
+        for process in list(self.__processes):
+            process.join()
@@ -0,0 +1,240 @@
+# default lib imports
+import logging
+import selectors
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+# counters of the TLS handshakes run by a TLSHandshaker
+class HandshakeMetrics:
+    def __init__(self):
+        # lock guarding the counters
+        self.__lock = threading.Lock()
+
+        # the number of handshakes which completed, and how many of them resumed an earlier session
+        self.completed = 0
+        self.resumed = 0
+
+        # the number of handshakes which failed, timed out, or were refused because too many were waiting
+        self.failed = 0
+        self.timed_out = 0
+        self.rejected = 0
+
+        # the wall clock time and the CPU time spent on completed handshakes in seconds
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.total_cpu = 0.0
+
+    # add a completed handshake
+    def record(self, latency: float, cpu: float, resumed: bool):
+        with self.__lock:
+            self.completed += 1
+            self.resumed += resumed
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.total_cpu += cpu
+
+    # add a handshake which did not complete
+    def record_failure(self, timed_out: bool = False, rejected: bool = False):
+        with self.__lock:
+            if rejected:
+                self.rejected += 1
+            elif timed_out:
+                self.timed_out += 1
+            else:
+                self.failed += 1
+
+    # the counters as a dict
+    def snapshot(self) -> dict:
+        """
+        Get the counters as a dict, including the mean latency and CPU time of a completed handshake.
+
+        :return: dict
+        """
+
+        with self.__lock:
+            return {
+                "completed": self.completed,
+                "resumed": self.resumed,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+                "rejected": self.rejected,
+                "mean_latency": self.total_latency / self.completed if self.completed else 0.0,
+                "max_latency": self.max_latency,
+                "mean_cpu": self.total_cpu / self.completed if self.completed else 0.0,
+                "total_cpu": self.total_cpu
+            }
+
+
+# runs the server side TLS handshake of accepted connections on a bounded pool of workers, so a slow or malicious
+# client never holds up the thread accepting connections
+class TLSHandshaker:
+    def __init__(self, context: ssl.SSLContext, on_ready: Callable[[ssl.SSLSocket, tuple], None], max_workers: int = 4,
+                 max_pending: int = 256, timeout: float = 10, session_tickets: int = None,
+                 on_failed: Callable[[tuple], None] = None, logging_id: str = "[TLS Handshaker]",
+                 logging_level: int = logging.WARNING):
+        # logger object and setup
+        self.logger = logging.getLogger(logging_id)
+        self.logger.setLevel(logging_level)
+
+        # the context the connections are wrapped with
+        self.context = context
+
+        # the number of TLS 1.3 session tickets sent after each full handshake so clients can resume the session, 0
+        # also turns off TLS 1.2 session tickets, None keeps the context's settings
+        if session_tickets is not None:
+            if hasattr(context, "num_tickets"):
+                context.num_tickets = session_tickets
+
+            if session_tickets == 0:
+                context.options |= ssl.OP_NO_TICKET
+            else:
+                context.options &= ~ssl.OP_NO_TICKET
+
+        # called with the wrapped socket and address of each connection which completed its handshake
+        self.__on_ready = on_ready
+
+        # called with the address of each connection which was closed without completing its handshake
+        self.__on_failed = on_failed
+
+        # the max number of connections waiting for or running a handshake, connections over it are closed right away
+        self.max_pending = max_pending
+
+        # the time a client has to complete its handshake
+        self.timeout = timeout
+
+        # the number of connections waiting for or running a handshake
+        self.__pending = 0
+        self.__pending_lock = threading.Lock()
+
+        # the handshake counters
+        self.metrics = HandshakeMetrics()
+
+        # the workers running the handshakes
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="TLS Handshake")
+
+    # the number of connections waiting for or running a handshake
+    def pending(self) -> int:
+        """
+        Get the number of connections waiting for or running a handshake.
+
+        :return: int
+        """
+        return self.__pending
+
+    # queue the handshake of an accepted connection
+    def submit(self, connection: socket.socket, address: tuple) -> bool:
+        """
+        Queue the handshake of an accepted plain connection, the connection is closed if max_pending handshakes are
+        already waiting.
+
+        :param connection: The accepted socket.
+        :param address: The address of the client.
+        :return: True if the handshake was queued, False if the connection was refused.
+        """
+
+        with self.__pending_lock:
+            if self.__pending >= self.max_pending:
+                refused = True
+            else:
+                refused = False
+                self.__pending += 1
+
+        if refused:
+            self.metrics.record_failure(rejected=True)
+
+            # logging output
+            self.logger.warning("(Submit) Too many handshakes waiting, refusing connection from '" + str(address[0])
+                                + "'.")
+
+            connection.close()
+            self.__failed(address)
+            return False
+
+        self.__executor.submit(self.__handshake, connection, address)
+        return True
+
+    # run the handshake of a connection, run on the executor
+    def __handshake(self, connection: socket.socket, address: tuple):
+        try:
+            start = time.monotonic()
+            start_cpu = time.thread_time()
+            tls_connection = None
+
+            try:
+                # the whole handshake has to finish within the timeout, the socket is non blocking so a client which
+                # trickles in its handshake a few bytes at a time can not keep the worker past the deadline
+                connection.setblocking(False)
+
+                tls_connection = self.context.wrap_socket(connection, server_side=True,
+                                                          do_handshake_on_connect=False)
+                self.__run_handshake(tls_connection, start + self.timeout)
+
+                # hand over the socket with the timeout it had before
+                tls_connection.settimeout(self.timeout)
+
+            # the client was too slow
+            except socket.timeout:
+                self.metrics.record_failure(timed_out=True)
+                self.logger.warning("(Handshake) Handshake with '" + str(address[0]) + "' timed out.")
+                (tls_connection or connection).close()
+                self.__failed(address)
+                return
+
+            # the handshake failed or the client went away
+            except (ssl.SSLError, OSError) as error:
+                self.metrics.record_failure()
+                self.logger.error("(Handshake) Handshake with '" + str(address[0]) + "' failed. Exception: '"
+                                  + str(error) + "'")
+                (tls_connection or connection).close()
+                self.__failed(address)
+                return
+
+            self.metrics.record(time.monotonic() - start, time.thread_time() - start_cpu,
+                                tls_connection.session_reused)
+
+        finally:
+            with self.__pending_lock:
+                self.__pending -= 1
+
+        self.__on_ready(tls_connection, address)
+
+    # step the handshake of a non blocking socket until it completes, raises socket.timeout at the deadline
+    @staticmethod
+    def __run_handshake(tls_connection: ssl.SSLSocket, deadline: float):
+        with selectors.DefaultSelector() as selector:
+            selector.register(tls_connection, selectors.EVENT_READ)
+
+            while True:
+                try:
+                    tls_connection.do_handshake()
+                    return
+
+                # wait for the client's next bytes, or for room to send ours
+                except ssl.SSLWantReadError:
+                    selector.modify(tls_connection, selectors.EVENT_READ)
+                except ssl.SSLWantWriteError:
+                    selector.modify(tls_connection, selectors.EVENT_WRITE)
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not selector.select(remaining):
+                    raise socket.timeout("The handshake did not complete within the timeout.")
+
+    # report a connection which did not complete its handshake
+    def __failed(self, address: tuple):
+        if self.__on_failed is not None:
+            self.__on_failed(address)
+
+    # stop the handshake workers
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the handshake workers once every queued handshake has run.
+
+        :param wait: Block until the handshakes have finished.
+        :return: None
+        """
+        self.__executor.shutdown(wait)
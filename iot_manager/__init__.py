@@ -1,4 +1,8 @@
-from .Manager import Manager, DeviceType, Client, Message, Packet
+from .Manager import Manager, DeviceType, Client, Message, MessageBatch, Packet
+from .AsyncManager import AsyncManager, AsyncClient
+from .ShardedManager import ShardedManager
+from .Schema import RecordSchema
+from .Aggregator import Aggregator
 
 __title = "iot-manager"
 __author__ = "Dylan Crockett"
@@ -27,5 +27,8 @@ setup(
     install_requires=[
         'gevent',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     python_requires='>=3.7'
 )
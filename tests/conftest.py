@@ -0,0 +1,38 @@
+# default lib imports
+import socket
+import sys
+from pathlib import Path
+
+# run the tests against the package in this tree
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+# get a port nothing is listening on
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+# build a version 1 frame
+def frame(payload: bytes) -> bytes:
+    return len(payload).to_bytes(2, 'big') + payload
+
+
+# read exactly size bytes from a socket
+def read_exactly(connection: socket.socket, size: int) -> bytes:
+    data = bytearray()
+
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise EOFError("The connection was closed.")
+
+        data += chunk
+
+    return bytes(data)
+
+
+# read one version 1 frame from a socket
+def read_frame(connection: socket.socket) -> bytes:
+    return read_exactly(connection, int.from_bytes(read_exactly(connection, 2), 'big'))
@@ -0,0 +1,58 @@
+# default lib imports
+import threading
+
+# module imports
+from iot_manager.Dispatcher import KeyedDispatcher
+
+
+def test_handlers_of_a_key_run_in_order():
+    dispatcher = KeyedDispatcher(max_workers=4, batch_size=2)
+    ran = []
+
+    for index in range(50):
+        dispatcher.submit("key", ran.append, index)
+
+    assert dispatcher.join(5)
+    dispatcher.shutdown()
+
+    assert ran == list(range(50))
+
+
+def test_block_waits_for_room():
+    dispatcher = KeyedDispatcher(max_workers=1, max_pending=1, policy=KeyedDispatcher.BLOCK)
+    release = threading.Event()
+    submitted = threading.Event()
+
+    dispatcher.submit("a", release.wait, 5)
+
+    # the second submit waits until the first handler is done
+    def submit():
+        dispatcher.submit("b", lambda: None)
+        submitted.set()
+
+    thread = threading.Thread(target=submit)
+    thread.start()
+
+    assert not submitted.wait(0.2)
+
+    release.set()
+    assert submitted.wait(5)
+
+    thread.join()
+    dispatcher.shutdown()
+
+    assert dispatcher.waits == 1
+    assert dispatcher.dropped == 0
+
+
+def test_drop_throws_the_handler_away():
+    dispatcher = KeyedDispatcher(max_workers=1, max_pending=1, policy=KeyedDispatcher.DROP)
+    release = threading.Event()
+
+    dispatcher.submit("a", release.wait, 5)
+    assert not dispatcher.submit("b", lambda: None)
+
+    release.set()
+    dispatcher.shutdown()
+
+    assert dispatcher.dropped == 1
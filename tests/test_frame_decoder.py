@@ -0,0 +1,84 @@
+# default lib imports
+import socket
+
+# test imports
+import pytest
+
+# module imports
+from iot_manager.FrameDecoder import FrameDecoder
+from iot_manager.ReservedBytes import PROTOCOL_V2, STREAM_CHUNK
+
+
+def test_header_split_across_reads():
+    left, right = socket.socketpair()
+    decoder = FrameDecoder(buffer_size=16)
+
+    with left, right:
+        # the first read only holds half of the size field
+        left.sendall(b'\x00')
+        decoder.read_from(right)
+        assert decoder.frames() == []
+        assert decoder.pending() == 1
+
+        left.sendall(b'\x05hello\x00\x02hi')
+        decoder.read_from(right)
+        assert [frame.payload for frame in decoder.frames()] == [b'hello', b'hi']
+        assert decoder.pending() == 0
+
+
+def test_v2_header_split_across_reads():
+    left, right = socket.socketpair()
+    decoder = FrameDecoder(version=PROTOCOL_V2)
+    data = bytes((STREAM_CHUNK,)) + (3).to_bytes(4, 'big') + b'abc'
+
+    with left, right:
+        # feed the frame one byte at a time
+        for index in range(len(data)):
+            left.sendall(data[index:index + 1])
+            decoder.read_from(right)
+
+            frames = decoder.frames()
+            if index < len(data) - 1:
+                assert frames == []
+
+        assert len(frames) == 1
+        assert frames[0].flags == STREAM_CHUNK
+        assert frames[0].bytes == b'abc'
+
+
+def test_frame_larger_than_the_buffer():
+    left, right = socket.socketpair()
+    decoder = FrameDecoder(buffer_size=8)
+    payload = bytes(range(200))
+
+    with left, right:
+        left.sendall(len(payload).to_bytes(2, 'big') + payload)
+
+        frames = []
+        while not frames:
+            decoder.read_from(right)
+            frames = decoder.frames()
+
+        assert frames[0].payload == payload
+
+
+def test_oversize_frame_is_refused():
+    left, right = socket.socketpair()
+    decoder = FrameDecoder(max_frame_size=4)
+
+    with left, right:
+        left.sendall(b'\x00\x04four')
+        decoder.read_from(right)
+        assert decoder.frames()[0].payload == b'four'
+
+        # the header alone is enough to refuse the frame
+        left.sendall(b'\xff\xff')
+        decoder.read_from(right)
+
+        with pytest.raises(FrameDecoder.FrameTooLarge):
+            decoder.frames()
+
+
+def test_unknown_version():
+    with pytest.raises(ValueError):
+        FrameDecoder(version=3)
@@ -0,0 +1,67 @@
+# default lib imports
+import uuid
+
+# test imports
+import pytest
+
+# module imports
+from iot_manager.Handshake import TypeTable, encode_info, decode_info
+from iot_manager.ReservedBytes import BINARY_INFO
+
+CLIENT_UUID = str(uuid.uuid4())
+
+
+def test_round_trip():
+    types = TypeTable()
+    data = {"none": None, "flag": True, "count": -3, "ratio": 0.5, "name": "sensor", "list": [1, 2]}
+
+    client_uuid, client_type, _, client_data = decode_info(encode_info(CLIENT_UUID, "sensor", data), types)
+
+    assert (client_uuid, client_type, client_data) == (CLIENT_UUID, "sensor", data)
+
+
+def test_registered_type_id():
+    types = TypeTable()
+    type_id = types.register("sensor")
+
+    assert decode_info(encode_info(CLIENT_UUID, type_id), types)[1:3] == ("sensor", type_id)
+
+
+@pytest.mark.parametrize("payload", [
+    # empty and wrong first byte
+    b'',
+    b'\x00' + bytes(16),
+    # truncated UUID and type
+    BINARY_INFO + bytes(8),
+    BINARY_INFO + bytes(17),
+    # type name longer than the reply
+    BINARY_INFO + bytes(16) + b'\x00\x00\x10abc',
+])
+def test_truncated(payload):
+    with pytest.raises(ValueError):
+        decode_info(payload, TypeTable())
+
+
+def test_malformed_metadata():
+    types = TypeTable()
+    valid = encode_info(CLIENT_UUID, "sensor", {"name": "sensor", "count": 1})
+
+    # every prefix of a valid reply ends early
+    for end in range(len(valid)):
+        with pytest.raises(ValueError):
+            decode_info(valid[:end], types)
+
+    with pytest.raises(ValueError):
+        decode_info(valid + b'\x00', types)
+
+    # unknown tag, invalid UTF-8 and invalid JSON
+    header = encode_info(CLIENT_UUID, "sensor")[:-1] + b'\x01\x01k'
+
+    for value in (b'\x7f', b'\x05\x00\x02\xff\xfe', b'\x06\x00\x01{'):
+        with pytest.raises(ValueError):
+            decode_info(header + value, types)
+
+
+def test_unknown_type_id():
+    with pytest.raises(ValueError):
+        decode_info(encode_info(CLIENT_UUID, 7), TypeTable())
@@ -0,0 +1,163 @@
+# default lib imports
+import asyncio
+import json
+import socket
+import threading
+import time
+import uuid
+
+# module imports
+from iot_manager import Manager, AsyncManager
+from iot_manager.ReservedBytes import GET_DATA, HEARTBEAT
+
+from conftest import free_port, frame, read_frame
+
+# managers which probe every 0.2 seconds and drop a client which has not replied within 0.5 seconds
+SETTINGS = {"heartbeat_rate": 0.2, "heartbeat_timeout": 0.5, "heartbeat_jitter": 0, "passive_heartbeat": False}
+
+
+# wait for a condition to become true
+def wait_for(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+
+        time.sleep(0.01)
+
+    return True
+
+
+# a device which registers and replies to every heartbeat, run on its own thread
+class Device:
+    def __init__(self, port: int):
+        self.uuid = str(uuid.uuid4())
+        self.heartbeats = 0
+
+        self.connection = socket.create_connection(("127.0.0.1", port), timeout=5)
+        assert read_frame(self.connection) == GET_DATA
+
+        self.connection.sendall(frame((self.uuid + "##sensor##" + json.dumps({"room": 1})).encode()))
+
+        self.__reader = threading.Thread(target=self.__read, daemon=True)
+        self.__reader.start()
+
+    def __read(self):
+        try:
+            while True:
+                if read_frame(self.connection) == HEARTBEAT:
+                    self.heartbeats += 1
+                    self.connection.sendall(frame(HEARTBEAT))
+        except (EOFError, OSError):
+            pass
+
+    # shutdown wakes the reader blocked in recv, close alone does not
+    def close(self):
+        self.connection.shutdown(socket.SHUT_RDWR)
+        self.connection.close()
+        self.__reader.join(5)
+
+
+def test_manager_round_trip():
+    port = free_port()
+    manager = Manager(connection_port=port, **SETTINGS)
+    messages, disconnected = [], []
+
+    @manager.event
+    def on_message(message):
+        messages.append((message.client.uuid(), message.packet.payload))
+
+    @manager.event
+    def on_disconnect(client):
+        disconnected.append(client.uuid())
+
+    manager.start()
+
+    try:
+        device = Device(port)
+        assert wait_for(lambda: len(manager.get_client_data()) == 1)
+        assert manager.get_client_data()[0]["data"] == {"room": 1}
+
+        device.connection.sendall(frame(b'reading'))
+        assert wait_for(lambda: messages)
+        assert messages == [(device.uuid, b'reading')]
+
+        # the device outlives several heartbeat timeouts by replying to the probes
+        assert wait_for(lambda: device.heartbeats >= 4)
+        assert len(manager.get_client_data()) == 1
+
+        device.close()
+        assert wait_for(lambda: disconnected)
+        assert disconnected == [device.uuid]
+        assert manager.get_client_data() == []
+    finally:
+        manager.stop()
+
+
+def test_async_manager_round_trip():
+    port = free_port()
+    manager = AsyncManager(connection_port=port, **SETTINGS)
+    messages, disconnected = [], []
+
+    @manager.event
+    async def on_message(message):
+        messages.append((message.client.uuid(), message.packet.payload))
+
+    @manager.event
+    def on_disconnect(client):
+        disconnected.append(client.uuid())
+
+    # the device blocks on its socket so it runs on a thread while the loop serves the manager
+    async def wait_until(condition, timeout: float = 5) -> bool:
+        return await asyncio.get_running_loop().run_in_executor(None, wait_for, condition, timeout)
+
+    async def main():
+        await manager.start()
+
+        try:
+            device = await asyncio.get_running_loop().run_in_executor(None, Device, port)
+            assert await wait_until(lambda: len(manager.get_client_data()) == 1)
+
+            device.connection.sendall(frame(b'reading'))
+            assert await wait_until(lambda: messages)
+            assert messages == [(device.uuid, b'reading')]
+
+            assert await wait_until(lambda: device.heartbeats >= 4)
+            assert len(manager.get_client_data()) == 1
+
+            device.close()
+            assert await wait_until(lambda: disconnected)
+            assert disconnected == [device.uuid]
+            assert manager.get_client_data() == []
+        finally:
+            await manager.stop()
+
+    asyncio.run(main())
+
+
+def test_silent_device_is_dropped():
+    port = free_port()
+    manager = Manager(connection_port=port, **SETTINGS)
+    disconnected = []
+
+    @manager.event
+    def on_disconnect(client):
+        disconnected.append(client.uuid())
+
+    manager.start()
+
+    try:
+        connection = socket.create_connection(("127.0.0.1", port), timeout=5)
+        assert read_frame(connection) == GET_DATA
+
+        client_uuid = str(uuid.uuid4())
+        connection.sendall(frame((client_uuid + "##sensor##{}").encode()))
+
+        # the probe is never answered
+        assert wait_for(lambda: disconnected)
+        assert disconnected == [client_uuid]
+
+        connection.close()
+    finally:
+        manager.stop()
@@ -0,0 +1,104 @@
+# test imports
+import pytest
+
+# module imports
+from iot_manager.OutboundQueue import OutboundQueue, OutboundBudget
+from iot_manager.ReservedBytes import PRIORITY_CONTROL, PRIORITY_INTERACTIVE, PRIORITY_BULK
+
+
+# drain the queue and return the frames written
+def drain(queue: OutboundQueue) -> list:
+    written = []
+
+    while True:
+        batch = queue.take()
+        if not batch:
+            return written
+
+        written.extend(bytes(buffer) for buffer in batch)
+
+
+def test_drop_oldest_evicts_the_lowest_priority_first():
+    queue = OutboundQueue(high_watermark=30, policy=OutboundQueue.DROP_OLDEST)
+
+    queue.put([b'i' * 10], PRIORITY_INTERACTIVE)
+    queue.put([b'b' * 10], PRIORITY_BULK)
+    queue.put([b'B' * 10], PRIORITY_BULK)
+
+    # the oldest bulk frame makes room even though the interactive frame is older
+    queue.put([b'j' * 10], PRIORITY_INTERACTIVE)
+
+    assert queue.dropped == 1
+    assert drain(queue) == [b'i' * 10, b'j' * 10, b'B' * 10]
+
+
+def test_drop_oldest_never_evicts_a_higher_priority():
+    queue = OutboundQueue(high_watermark=20, policy=OutboundQueue.DROP_OLDEST)
+
+    queue.put([b'i' * 10], PRIORITY_INTERACTIVE)
+    queue.put([b'j' * 10], PRIORITY_INTERACTIVE)
+
+    with pytest.raises(OutboundQueue.QueueFull):
+        queue.put([b'b' * 10], PRIORITY_BULK)
+
+    assert drain(queue) == [b'i' * 10, b'j' * 10]
+
+
+def test_full_queue_refuses_until_the_low_watermark():
+    queue = OutboundQueue(max_batch_bytes=10, high_watermark=30, low_watermark=10)
+
+    for _ in range(3):
+        queue.put([b'x' * 10])
+
+    assert queue.is_full()
+
+    # one frame taken is not enough, the queue stays full until it is down to the low watermark
+    queue.take()
+    with pytest.raises(OutboundQueue.QueueFull):
+        queue.put([b'y' * 10])
+
+    queue.take()
+    assert not queue.is_full()
+    queue.put([b'y' * 10])
+
+    assert queue.dropped == 1
+    assert drain(queue) == [b'x' * 10, b'y' * 10]
+
+
+def test_control_frames_skip_the_watermark_and_are_written_first():
+    queue = OutboundQueue(high_watermark=10)
+
+    queue.put([b'x' * 10])
+    assert queue.put([b'\x00\x01\x02'], PRIORITY_CONTROL)
+
+    # an identical control frame is already waiting
+    assert not queue.put([b'\x00\x01\x02'], PRIORITY_CONTROL)
+
+    assert drain(queue) == [b'\x00\x01\x02', b'x' * 10]
+
+
+def test_control_lane_is_capped():
+    queue = OutboundQueue(max_control_frames=2)
+
+    queue.put([b'\x01'], PRIORITY_CONTROL)
+    queue.put([b'\x02'], PRIORITY_CONTROL)
+
+    with pytest.raises(OutboundQueue.QueueFull):
+        queue.put([b'\x03'], PRIORITY_CONTROL)
+
+
+def test_budget_is_shared_and_released():
+    budget = OutboundBudget(max_bytes=20)
+    first, second = OutboundQueue(budget=budget), OutboundQueue(budget=budget)
+
+    first.put([b'x' * 15])
+
+    with pytest.raises(OutboundQueue.QueueFull):
+        second.put([b'y' * 10])
+
+    drain(first)
+    second.put([b'y' * 10])
+
+    assert budget.used == 10
+    assert second.clear() == 1
+    assert budget.used == 0